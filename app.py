@@ -1,26 +1,31 @@
 #!/usr/bin/env python3
 
 import sys
-import urllib3
-
-from main.menu import scan_menu
 
 
 def main():
 
-    # 禁用SSL警告
-    urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
-    
+    # 带参数运行时为非交互式的命令行模式，只导入需要的模块
+    if len(sys.argv) > 1:
+        from main.cli import main as cli_main
+        sys.exit(cli_main(sys.argv[1:]))
+
+    from main.menu import scan_menu
+    from main.logger import close_log_writer
+
     try:
         # 启动扫描菜单
         scan_menu()
     except KeyboardInterrupt:
         print("\n程序被用户中断")
+        # 写入尚未写入的日志后再退出
+        close_log_writer()
         sys.exit(0)
     except Exception as e:
         print(f"\n程序发生错误: {str(e)}")
+        close_log_writer()
         sys.exit(1)
 
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
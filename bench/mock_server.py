@@ -0,0 +1,107 @@
+"""
+基准测试目标服务器 - 本地HTTP服务器，响应延迟、响应体大小、错误率和状态码都由请求路径决定，
+同一个请求每次得到相同的响应，多次测试的结果可以直接比较
+
+路径格式：/{延迟毫秒}/{响应体字节数}/{错误率千分比}/{状态码}/其余部分
+例如 /5/2048/100/200/t1/p3/r0 表示延迟5毫秒、2048字节响应体、约10%的请求返回错误、其余返回200
+"""
+import sys
+import time
+import zlib
+import argparse
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+
+# 响应体中的标记，基准测试生成的POC用它判断是否"发现漏洞"
+MARKER = b'bench-marker '
+DEFAULT_ERROR_STATUS = 503
+
+_bodies = {}
+
+
+def body_of(size):
+
+    # 相同大小的响应体只生成一次
+    body = _bodies.get(size)
+    if body is None:
+        filler = b'lorem ipsum dolor sit amet consectetur adipiscing elit '
+        body = _bodies[size] = (MARKER + filler * (size // len(filler) + 1))[:max(size, len(MARKER))]
+    return body
+
+
+def parse_path(path):
+
+    parts = path.split('/', 5)
+    try:
+        return int(parts[1]), int(parts[2]), int(parts[3]), int(parts[4])
+    except (IndexError, ValueError):
+        return 0, 0, 0, 200
+
+
+class BenchHandler(BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+    error_status = DEFAULT_ERROR_STATUS
+    # 响应头和响应体缓冲后一次发送并关闭Nagle算法，否则长连接上每个请求都要多等待约40毫秒的延迟确认
+    wbufsize = 65536
+    disable_nagle_algorithm = True
+
+    def respond(self):
+
+        latency, size, error_permille, status = parse_path(self.path)
+        # 是否出错由路径的校验和决定，而不是随机数
+        failed = zlib.crc32(self.path.encode()) % 1000 < error_permille
+        if latency:
+            time.sleep(latency / 1000)
+
+        length = int(self.headers.get('Content-Length') or 0)
+        if length:
+            self.rfile.read(length)
+
+        body = b'error' if failed else body_of(size)
+        self.send_response(self.error_status if failed else status)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_GET = respond
+    do_POST = respond
+
+    def log_message(self, *args):
+
+        pass
+
+
+class BenchServer(ThreadingHTTPServer):
+
+    daemon_threads = True
+    request_queue_size = 4096
+
+    def handle_error(self, request, client_address):
+
+        # 扫描器读够响应体后会提前关闭连接，不是服务器的错误
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(prog='python bench/mock_server.py', description='基准测试目标服务器')
+    parser.add_argument('--host', default='0.0.0.0', help='监听地址，默认监听所有地址（目标可以使用127.0.0.x区分主机）')
+    parser.add_argument('--port', type=int, default=0, help='监听端口，0 表示随机端口')
+    parser.add_argument('--error-status', type=int, default=DEFAULT_ERROR_STATUS, help='出错时返回的状态码')
+    args = parser.parse_args(argv)
+
+    BenchHandler.error_status = args.error_status
+    server = BenchServer((args.host, args.port), BenchHandler)
+    # 第一行输出实际端口，供基准测试脚本读取
+    print(server.server_address[1], flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    sys.exit(main())
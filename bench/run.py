@@ -0,0 +1,366 @@
+"""
+基准测试 - 启动本地目标服务器，生成POC库和目标列表，测量扫描的吞吐量、请求延迟、内存峰值和报告写入时间
+
+每个场景在单独的子进程中运行，内存峰值互不影响；POC、目标和服务器响应都是确定的，
+使用 --output 保存结果、--compare 与之前保存的结果比较，可以看出改动带来的性能变化
+
+用法：
+    python bench/run.py                          # 运行所有场景
+    python bench/run.py -s baseline,async -r 3   # 指定场景，每个场景运行3次取中位数
+    python bench/run.py --output before.json
+    python bench/run.py --compare before.json    # 有场景失败或指标变差超过阈值时退出码为1
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import argparse
+import tempfile
+import statistics
+import subprocess
+from array import array
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+# 场景的默认参数，各场景只写与默认值不同的部分
+DEFAULTS = {
+    "targets": 200,  # 目标数
+    "hosts": 5,  # 目标分布在 127.0.0.1 ~ 127.0.0.N 上（macOS默认只有127.0.0.1可用，需设为1）
+    "pocs": 20,  # POC数
+    "steps": 2,  # 每个POC的请求数
+    "latency": 5,  # 服务器响应延迟（毫秒）
+    "body": 2048,  # 响应体字节数
+    "error_rate": 0.0,  # 返回错误状态码的请求比例
+    "status": 200,  # 正常响应的状态码
+    "finding_every": 10,  # 每N个POC中有一个会"发现漏洞"
+    "engine": "thread",
+    "threads": 50,
+    "processes": 1,
+    "probe": False,  # 扫描前先探测主机端口（circuit_breaker.probe）
+}
+SCENARIOS = {
+    "baseline": {},
+    "large-body": {"targets": 50, "body": 262144},
+    "slow": {"latency": 50},
+    "errors": {"targets": 100, "error_rate": 0.1},
+    "findings": {"finding_every": 1},
+    "async": {"engine": "async"},
+    # 主机数多于任务队列上限（threads * 4），每个新主机还会多排一个存活探测
+    "many-hosts": {"targets": 200, "hosts": 60, "pocs": 1, "threads": 2, "probe": True},
+}
+
+# 指标：(名称, 显示格式, 是否越大越好, 最小有效变化)。变化的绝对值小于最小有效变化时视为测量误差
+METRICS = [
+    ("requests_per_sec", "{:.0f}", True, 0),
+    ("latency_p50_ms", "{:.1f}", False, 1),
+    ("latency_p95_ms", "{:.1f}", False, 1),
+    ("latency_p99_ms", "{:.1f}", False, 1),
+    ("peak_rss_mb", "{:.1f}", False, 2),
+    ("report_write_s", "{:.3f}", False, 0.05),
+    ("poc_compile_s", "{:.3f}", False, 0.05),
+    ("scan_s", "{:.2f}", False, 0.1),
+]
+
+
+def generate_pocs(poc_dir, params):
+
+    # 每个POC的请求路径不同，不会命中响应缓存；"发现漏洞"的POC匹配服务器响应中的标记
+    os.makedirs(poc_dir)
+    poc_files = []
+    for k in range(params["pocs"]):
+        word = "bench-marker" if k % params["finding_every"] == 0 else f"absent-{k}"
+        requests = []
+        for j in range(params["steps"]):
+            requests.append(f"""  - method:
+      - GET
+    path:
+      - "{{{{BaseURL}}}}/p{k}/r{j}"
+    condition: and
+    matchers:
+      - type: status
+        status:
+          - {params["status"]}
+      - type: word
+        words:
+          - "{word}"
+""")
+        poc_file = os.path.join(poc_dir, f"bench-{k:04d}.yaml")
+        with open(poc_file, 'w', encoding='utf-8') as f:
+            f.write(f"id: bench-{k}\ninfo:\n  name: Bench POC {k}\n  severity: high\n  tags: bench\n"
+                    f"requests:\n{''.join(requests)}")
+        poc_files.append(poc_file)
+    return poc_files
+
+
+def generate_targets(targets_file, params, port):
+
+    # 路径中带有服务器的响应参数，见 mock_server.py
+    prefix = f"{params['latency']}/{params['body']}/{int(params['error_rate'] * 1000)}/{params['status']}"
+    with open(targets_file, 'w', encoding='utf-8') as f:
+        for i in range(params["targets"]):
+            f.write(f"http://127.0.0.{i % params['hosts'] + 1}:{port}/{prefix}/t{i}\n")
+
+
+def bench_config(params):
+
+    # 使用项目的配置文件，只覆盖与场景有关的设置；本地目标不需要DNS缓存和代理
+    from main.config import load_config
+    config = load_config(os.path.join(ROOT, 'config.yaml'))
+    config.pop('proxy', None)
+    config['engine'] = params["engine"]
+    config['threads'] = params["threads"]
+    config['async_concurrency'] = params["threads"]
+    config['processes'] = {"enabled": params["processes"] > 1, "count": params["processes"]}
+    config['dns'] = {"enabled": False}
+    config['circuit_breaker'] = dict(config.get('circuit_breaker') or {}, probe=params["probe"])
+    config.pop('cluster', None)
+    return config
+
+
+def percentile(values, q):
+
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(round(q * (len(values) - 1))))]
+
+
+def peak_rss_mb():
+
+    try:
+        import resource
+    except ImportError:
+        return None  # Windows
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 单位为KB，macOS 为字节
+    return rss / (1024 * 1024) if sys.platform == 'darwin' else rss / 1024
+
+
+def run_scenario(params, port):
+
+    # 在子进程中执行：生成POC和目标，扫描并把发现的漏洞写入HTML报告
+    from main.compiler import load_compiled_pocs
+    from main.report import HtmlReport
+    from main.scheduler import iter_scan_results
+    from main.url import iter_urls_from_file
+
+    work_dir = tempfile.mkdtemp(prefix='rws-bench-')
+    try:
+        poc_files = generate_pocs(os.path.join(work_dir, 'poc'), params)
+        targets_file = os.path.join(work_dir, 'targets.txt')
+        generate_targets(targets_file, params, port)
+        config = bench_config(params)
+
+        start = time.perf_counter()
+        pocs, errors = load_compiled_pocs(poc_files, os.path.join(work_dir, 'poc_cache.pickle'))
+        poc_compile = time.perf_counter() - start
+        if errors:
+            raise ValueError(f"POC编译失败: {errors[0]}")
+
+        latencies = array('d')
+        requests_sent = results = findings = 0
+        report = None
+        report_write = 0.0
+
+        start = time.perf_counter()
+        for result in iter_scan_results(pocs, iter_urls_from_file(targets_file), config):
+            results += 1
+            requests_sent += result.requests_sent
+            latencies.extend(step.elapsed for step in result.steps if step.elapsed)
+            if result.vulnerable:
+                findings += 1
+                write_start = time.perf_counter()
+                if report is None:
+                    report = HtmlReport(os.path.join(work_dir, 'report.html'))
+                report.add(result)
+                report_write += time.perf_counter() - write_start
+        if report:
+            write_start = time.perf_counter()
+            report.finalize()
+            report_write += time.perf_counter() - write_start
+        scan = time.perf_counter() - start
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    # 每个(POC, 目标)任务都应该有一个结果，少了说明扫描提前结束
+    if results != params["targets"] * params["pocs"]:
+        raise ValueError(f"结果数 {results} 与任务数 {params['targets'] * params['pocs']} 不一致")
+
+    latencies = sorted(latencies)
+    return {
+        "requests_per_sec": requests_sent / scan if scan else 0.0,
+        "latency_p50_ms": percentile(latencies, 0.50) * 1000,
+        "latency_p95_ms": percentile(latencies, 0.95) * 1000,
+        "latency_p99_ms": percentile(latencies, 0.99) * 1000,
+        "peak_rss_mb": peak_rss_mb(),
+        "report_write_s": report_write,
+        "poc_compile_s": poc_compile,
+        "scan_s": scan,
+        "requests": requests_sent,
+        "results": results,
+        "findings": findings,
+    }
+
+
+def start_server():
+
+    server = subprocess.Popen([sys.executable, os.path.join(ROOT, 'bench', 'mock_server.py')],
+                              stdout=subprocess.PIPE, text=True)
+    port = server.stdout.readline().strip()
+    if not port:
+        server.kill()
+        raise RuntimeError("目标服务器启动失败")
+    return server, int(port)
+
+
+def run_child(params, port):
+
+    process = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), '--child', json.dumps(params), '--port', str(port)],
+        capture_output=True, text=True
+    )
+    lines = process.stdout.strip().splitlines()
+    if process.returncode or not lines:
+        error = (process.stderr.strip().splitlines() or ["未知错误"])[-1]
+        return {"error": error}
+    return json.loads(lines[-1])
+
+
+def median_metrics(runs):
+
+    # 多次运行取中位数，减少偶然波动
+    merged = {}
+    for key in runs[0]:
+        values = [run[key] for run in runs if run.get(key) is not None]
+        merged[key] = statistics.median(values) if values else None
+    return merged
+
+
+def format_table(results, baseline=None, threshold=10.0):
+
+    # 与之前的结果比较时，在每个指标后面显示变化百分比，变差超过阈值的标记为 !
+    names = [name for name, _, _, _ in METRICS]
+    header = ["场景"] + names + ["findings"]
+    rows = []
+    regressions = []
+    for scenario, metrics in results.items():
+        if "error" in metrics:
+            rows.append([scenario, f"失败: {metrics['error']}"])
+            continue
+        row = [scenario]
+        for name, fmt, higher_better, noise in METRICS:
+            value = metrics.get(name)
+            cell = "-" if value is None else fmt.format(value)
+            old = ((baseline or {}).get(scenario) or {}).get(name)
+            if value is not None and old:
+                change = (value - old) / old * 100
+                worse = (-change if higher_better else change) > threshold and abs(value - old) >= noise
+                cell += f" ({change:+.0f}%{'!' if worse else ''})"
+                if worse:
+                    regressions.append(f"{scenario}.{name}")
+            row.append(cell)
+        row.append(str(round(metrics["findings"])))
+        rows.append(row)
+
+    widths = [max(len(str(row[i])) for row in [header] + rows if i < len(row)) for i in range(len(header))]
+    lines = ["  ".join(str(cell).ljust(widths[i]) for i, cell in enumerate(row)) for row in [header] + rows]
+    return "\n".join(lines), regressions
+
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(prog='python bench/run.py', description='扫描性能基准测试')
+    parser.add_argument('-s', '--scenario', help=f"场景，逗号分隔（{', '.join(SCENARIOS)}），默认全部")
+    parser.add_argument('-r', '--repeat', type=int, default=1, help='每个场景的运行次数，结果取中位数')
+    parser.add_argument('--set', action='append', default=[], metavar='KEY=VALUE',
+                        help=f"覆盖所有场景的参数（{', '.join(DEFAULTS)}）")
+    parser.add_argument('--output', help='保存结果的JSON文件')
+    parser.add_argument('--compare', help='与之前保存的结果比较')
+    parser.add_argument('--threshold', type=float, default=10.0, help='指标变差超过该百分比时视为性能退化')
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    parser.add_argument('--port', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        print(json.dumps(run_scenario(json.loads(args.child), args.port)))
+        return 0
+
+    overrides = {}
+    for item in args.set:
+        key, _, value = item.partition('=')
+        if key not in DEFAULTS:
+            parser.error(f"未知参数 {key}")
+        if isinstance(DEFAULTS[key], bool):
+            overrides[key] = value.lower() in ('1', 'true', 'yes')
+        else:
+            overrides[key] = type(DEFAULTS[key])(value)
+
+    names = args.scenario.split(',') if args.scenario else list(SCENARIOS)
+    for name in names:
+        if name not in SCENARIOS:
+            parser.error(f"未知场景 {name}")
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            saved = json.load(f)
+
+    server, port = start_server()
+    results = {}
+    params_used = {}
+    try:
+        for name in names:
+            params = {**DEFAULTS, **SCENARIOS[name], **overrides}
+            params_used[name] = params
+            runs = []
+            for _ in range(args.repeat):
+                run = run_child(params, port)
+                if "error" in run:
+                    runs = [run]
+                    break
+                runs.append(run)
+            results[name] = runs[0] if "error" in runs[0] else median_metrics(runs)
+            print(f"{name}: 完成", file=sys.stderr, flush=True)
+    finally:
+        server.kill()
+        server.wait()
+
+    if args.compare:
+        # 参数不同的场景没有可比性，不比较
+        baseline = {}
+        for name, metrics in saved["results"].items():
+            if saved["params"].get(name) == params_used.get(name):
+                baseline[name] = metrics
+            elif name in results:
+                print(f"{name}: 参数与 {args.compare} 不同，不比较", file=sys.stderr)
+
+    table, regressions = format_table(results, baseline, args.threshold)
+    print(table)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({
+                "created": time.strftime('%Y-%m-%d %H:%M:%S'),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "cpus": os.cpu_count(),
+                "repeat": args.repeat,
+                "params": params_used,
+                "results": results,
+            }, f, ensure_ascii=False, indent=2)
+        print(f"结果已保存到 {args.output}", file=sys.stderr)
+
+    failed = [name for name, metrics in results.items() if "error" in metrics]
+    if failed:
+        print(f"场景失败: {', '.join(failed)}", file=sys.stderr)
+    if regressions:
+        print(f"性能退化: {', '.join(regressions)}", file=sys.stderr)
+    return 1 if failed or regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
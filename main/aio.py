@@ -0,0 +1,430 @@
+"""
+异步扫描模块 - 基于asyncio的扫描引擎（需要安装aiohttp）
+"""
+import sys
+import time
+import socket
+import queue
+import asyncio
+import threading
+from itertools import islice
+from urllib.parse import urlsplit
+
+import requests
+from requests.structures import CaseInsensitiveDict
+from requests.utils import default_headers, get_encoding_from_headers
+
+try:
+    import aiohttp
+    import yarl
+except ImportError:  # 可选依赖，只有使用异步引擎时才需要
+    aiohttp = None
+
+from .cache import build_cache_key, create_response_cache
+from .compiler import compile_poc
+from .dns import get_dns_cache
+from .matcher import MatcherEngine
+from .metrics import get_metrics
+from .profiler import TimedReader, get_profiler
+from .poc import PocRun, build_request
+from .result import UNREACHABLE, build_result, build_skipped
+from .scheduler import create_host_scheduler, get_queue_size, iter_work_items, probe_address, probe_timeout
+from .session import build_proxies
+from .stream import BodyReader, CHUNK_SIZE, DEFAULT_MAX_BODY_SIZE, build_interest, read_plan, share_readers
+
+
+# 每次从目标列表中读取的任务数
+TARGET_BATCH_SIZE = 256
+
+
+def build_trace_config():
+
+    # 启用性能分析时记录新建连接的耗时：aiohttp建立连接的耗时包含域名解析和TLS握手，
+    # 域名解析单独记录，TLS握手无法单独统计，计入连接阶段
+    trace_config = aiohttp.TraceConfig()
+
+    def add_timer(stage, on_start, on_end):
+        async def start(session, ctx, params):
+            setattr(ctx, stage, time.perf_counter())
+
+        async def end(session, ctx, params):
+            if ctx.trace_request_ctx is not None:
+                ctx.trace_request_ctx[stage] += time.perf_counter() - getattr(ctx, stage)
+
+        on_start.append(start)
+        on_end.append(end)
+
+    add_timer("connect", trace_config.on_connection_create_start, trace_config.on_connection_create_end)
+    add_timer("dns", trace_config.on_dns_resolvehost_start, trace_config.on_dns_resolvehost_end)
+    return trace_config
+
+
+if aiohttp is not None:
+    class CachedResolver(aiohttp.abc.AbstractResolver):
+
+        # 使用进程内共用的DNS缓存解析主机，缓存未命中时在线程池中解析
+        def __init__(self, cache):
+
+            self.cache = cache
+
+        async def resolve(self, host, port=0, family=socket.AF_INET):
+
+            with self.cache.lock:
+                addresses = self.cache.lookup(host)
+            if addresses is None or isinstance(addresses, tuple):
+                addresses = await asyncio.get_running_loop().run_in_executor(None, self.cache.resolve, host)
+
+            return [
+                {
+                    "hostname": host,
+                    "host": address[0],
+                    "port": port,
+                    "family": af,
+                    "proto": proto,
+                    "flags": socket.AI_NUMERICHOST | socket.AI_NUMERICSERV,
+                }
+                for af, _, proto, _, address in addresses
+                if family == socket.AF_UNSPEC or af == family
+            ]
+
+        async def close(self):
+
+            pass
+
+
+async def create_async_context(config):
+
+    if aiohttp is None:
+        print("错误: 异步引擎需要安装 aiohttp，请执行 pip install aiohttp。")
+        sys.exit(1)
+
+    pool_config = config.get('pool') or {}
+    timeout = config.get('timeout', 10)  # 默认10秒
+
+    # 启用DNS缓存时使用与线程引擎相同的缓存（支持解析失败的结果缓存），否则使用aiohttp自带的缓存
+    dns = get_dns_cache(config)
+    connector = aiohttp.TCPConnector(
+        limit=config.get('async_concurrency', 500),
+        limit_per_host=pool_config.get('maxsize', 0),  # 0 表示不限制单个主机的连接数
+        resolver=CachedResolver(dns) if dns else None,
+        use_dns_cache=dns is None,
+        ssl=False
+    )
+
+    # 与线程引擎保持一致：requests的默认请求头 + 配置文件中的请求头
+    headers = default_headers()
+    headers.update(config.get('headers') or {})
+
+    metrics = get_metrics(config)
+    profiler = get_profiler()
+    return {
+        "session": aiohttp.ClientSession(
+            connector=connector,
+            cookie_jar=aiohttp.DummyCookieJar(),  # 不在POC之间共享Cookie
+            timeout=aiohttp.ClientTimeout(total=timeout),
+            trust_env=True,
+            trace_configs=[build_trace_config()] if profiler is not None else None
+        ),
+        "headers": headers,
+        "proxies": build_proxies(config),
+        "metrics": metrics,
+        "profiler": profiler,
+        "cache": create_response_cache(config, metrics),
+        "matcher": MatcherEngine(),
+        "max_body_size": config.get('max_body_size', DEFAULT_MAX_BODY_SIZE),
+        "interest": None,
+        "errors": (aiohttp.ClientError, asyncio.TimeoutError),
+        "unreachable": (aiohttp.ClientConnectionError, asyncio.TimeoutError),
+    }
+
+
+async def close_async_context(context):
+
+    await context["session"].close()
+
+
+def build_response(prepared, status, reason, headers, url, content):
+
+    # 转换为requests.Response，报告和日志模块无需区分扫描引擎
+    response = requests.Response()
+    response.status_code = status
+    response.reason = reason
+    response.headers = CaseInsensitiveDict(headers)
+    response.url = url
+    response.encoding = get_encoding_from_headers(response.headers)
+    response._content = content
+    response.request = prepared
+    return response
+
+
+async def send_request_async(request, path, headers, context):
+
+    try:
+        method, body = request.method, request.body
+
+        # 使用requests构造请求，保证URL编码和请求体与线程引擎完全一致
+        merged_headers = CaseInsensitiveDict(context["headers"])
+        merged_headers.update(headers)
+        if method == "POST":
+            prepared = requests.Request(method, path, headers=merged_headers, data=body).prepare()
+        else:
+            prepared = requests.Request(method, path, headers=merged_headers, params=body).prepare()
+
+        proxy = context["proxies"].get(urlsplit(prepared.url).scheme)
+        # 启用性能分析时记录请求各阶段的耗时，新建连接的耗时由 trace_config 写入
+        profiler = context["profiler"]
+        timings = {"dns": 0.0, "connect": 0.0, "tls": 0.0, "match_stream": 0.0} if profiler is not None else None
+
+        # 记录请求开始时间
+        start_time = time.time()
+
+        async with context["session"].request(
+            method,
+            yarl.URL(prepared.url, encoded=True),
+            headers=dict(prepared.headers),
+            data=prepared.body,
+            proxy=proxy,
+            trace_request_ctx=timings
+        ) as r:
+            headers_elapsed = time.time() - start_time
+            response = build_response(prepared, r.status, r.reason, r.headers, str(r.url), None)
+
+            # 超过大小限制或所有匹配规则都已得出结论时不再读取剩余的响应体
+            groups, cap = read_plan(request, context)
+            reader = BodyReader(response, groups, cap, context["matcher"], start_time)
+            if timings is not None:
+                reader = TimedReader(reader, timings)
+            async for chunk in r.content.iter_chunked(CHUNK_SIZE):
+                if reader.feed(chunk):
+                    # 未读完的连接不能放回连接池复用
+                    if reader.truncated:
+                        r.close()
+                    break
+            reader.finish()
+
+        if timings is not None:
+            profiler.end_request(timings, headers_elapsed, time.time() - start_time)
+        return response, None
+
+    except context["unreachable"] as e:
+        return None, f"{UNREACHABLE}: {str(e) or type(e).__name__}"
+    except context["errors"] as e:
+        return None, f"请求执行错误: {str(e) or type(e).__name__}"
+    except Exception as e:
+        return None, f"执行错误: {str(e)}"
+
+
+async def execute_single_request_async(request_config, url, config, context):
+
+    method, path, body, headers = build_request(request_config, url)
+    metrics = context.get("metrics")
+    fetched = False
+
+    async def fetch():
+        # 只统计实际发送的请求，共享的响应不重复计入
+        nonlocal fetched
+        fetched = True
+        start = time.monotonic()
+        response, error = await send_request_async(request_config, path, headers, context)
+        if metrics is not None:
+            metrics.record_request(path, time.monotonic() - start, response, error)
+        return response, error
+
+    # 相同的请求在本次扫描中只发送一次，其他POC直接共享响应
+    cache = context.get("cache")
+    if cache is not None and request_config.shared:
+        key = build_cache_key(method, path, request_config.headers, body)
+        response, error = await cache.get_or_fetch_async(key, fetch, share_readers(request_config, context))
+    else:
+        response, error = await fetch()
+    return response, error, fetched
+
+
+async def execute_poc_async(poc, url, config, context):
+
+    # 兼容直接传入YAML字典的情况
+    if isinstance(poc, dict):
+        try:
+            poc = compile_poc(poc)
+        except ValueError as e:
+            return build_result(url, poc, str(e))
+
+    metrics = context.get("metrics")
+    start = time.monotonic()
+    try:
+        run = PocRun(poc, url, context["matcher"])
+        request = run.next_request()
+        while request is not None:
+            run.feed(*await execute_single_request_async(request, url, config, context))
+            request = run.next_request()
+        result = run.result()
+
+    except Exception as e:
+        result = build_result(url, poc, f"POC执行错误: {str(e)}")
+
+    if metrics is not None:
+        metrics.record_poc(poc, result, time.monotonic() - start)
+    return result
+
+
+async def probe_host_async(url, timeout):
+
+    # 只检查端口能否连接，不发送HTTP请求
+    address = probe_address(url)
+    if address is None:
+        return True
+    try:
+        _, writer = await asyncio.wait_for(asyncio.open_connection(*address), timeout)
+        writer.close()
+        return True
+    except (OSError, asyncio.TimeoutError):
+        return False
+    except ValueError:
+        # 主机名无法编码（例如 a..b）时视为可以连接，由POC请求报告错误
+        return True
+
+
+async def execute_scans_async(pocs, urls, config, on_result):
+
+    # on_result 可能阻塞（例如写入有界队列），在线程池中按完成顺序逐个调用，不阻塞事件循环
+    context = await create_async_context(config)
+    # 所有POC的关键词编译为一个自动机
+    context["matcher"].add_pocs(pocs)
+    # 匹配规则都得出结论后不再读取剩余的响应体
+    context["interest"] = build_interest(pocs)
+
+    # 任务按主机排队，同时进行中的POC数量不超过 async_concurrency，单个主机的并发数根据响应情况调整
+    concurrency = config.get('async_concurrency', 500)
+    hosts = create_host_scheduler(config, concurrency)
+    queue_size = get_queue_size(config, concurrency)
+    wake = asyncio.Event()
+    running = set()
+    metrics = context["metrics"]
+    loop = asyncio.get_running_loop()
+    # 已完成但调用方还没有取走的结果，积压达到上限时暂停启动新任务，进行中的请求不受影响
+    outbox = asyncio.Queue()
+
+    async def forward():
+        while True:
+            result = await outbox.get()
+            await loop.run_in_executor(None, on_result, result)
+            outbox.task_done()
+            wake.set()
+
+    async def run(poc, url, host):
+        result = await execute_poc_async(poc, url, config, context)
+        hosts.done(host, result)
+        wake.set()
+        outbox.put_nowait(result)
+
+    async def probe(url, host):
+        # 探测出错时也要结束探测状态，否则该主机的任务永远不会开始
+        alive = True
+        try:
+            alive = await probe_host_async(url, probe_timeout(config))
+        finally:
+            hosts.probed(host, alive)
+            wake.set()
+
+    forwarder = asyncio.ensure_future(forward())
+    try:
+        # 目标文件（或标准输入）在线程池中分批读取，避免阻塞事件循环；已读取的任务达到上限时暂停读取
+        work_items = iter_work_items(pocs, urls)
+        exhausted = False
+        while True:
+            if not exhausted and len(hosts) < queue_size:
+                count = min(TARGET_BATCH_SIZE, queue_size - len(hosts))
+                batch = await loop.run_in_executor(None, list, islice(work_items, count))
+                for poc, url in batch:
+                    hosts.add((poc, url), url)
+                exhausted = len(batch) < count
+
+            wake.clear()
+            paused = outbox.qsize() >= queue_size
+            for (poc, url), host in () if paused else hosts.ready():
+                if poc is None:
+                    task = asyncio.ensure_future(probe(url, host))
+                else:
+                    task = asyncio.ensure_future(run(poc, url, host))
+                running.add(task)
+                task.add_done_callback(running.discard)
+
+            # 主机熔断后跳过的任务直接返回结果
+            while hosts.skipped:
+                poc, url = hosts.skipped.popleft()
+                outbox.put_nowait(build_skipped(url, poc))
+            if metrics is not None:
+                metrics.set_queue(hosts.running, hosts.buffered)
+
+            if exhausted and not len(hosts):
+                break
+            # 没有可以读取的任务或调用方处理不过来时，等待任意一个任务完成或结果被取走
+            if exhausted or paused or len(hosts) >= queue_size:
+                await wake.wait()
+
+        # 等待剩余的结果都交给调用方
+        await outbox.join()
+    finally:
+        forwarder.cancel()
+        for task in list(running):
+            task.cancel()
+        if metrics is not None:
+            metrics.set_queue(0, 0)
+        await close_async_context(context)
+
+
+def iter_scans_async(pocs, urls, config):
+
+    # 事件循环在后台线程中运行，结果通过有界队列逐个返回给调用方，调用方处理不过来时扫描会暂停
+    results = queue.Queue(maxsize=get_queue_size(config, config.get('async_concurrency', 500)))
+    finished = object()
+    errors = []
+    stop = threading.Event()
+    running = {}  # 事件循环和扫描任务，调用方提前结束时用于取消扫描
+
+    def deliver(result):
+        if not stop.is_set():
+            results.put(result)
+
+    async def scan():
+        running["loop"] = asyncio.get_running_loop()
+        running["task"] = asyncio.current_task()
+        if not stop.is_set():
+            await execute_scans_async(pocs, urls, config, deliver)
+
+    def run_loop():
+        try:
+            asyncio.run(scan())
+        except BaseException as e:
+            errors.append(e)
+        finally:
+            results.put(finished)
+
+    # Python 3.12 之前cProfile需要在事件循环线程中单独启用
+    profiler = get_profiler()
+    thread = threading.Thread(target=profiler.profiled(run_loop) if profiler else run_loop, daemon=True)
+    thread.start()
+
+    result = None
+    try:
+        while True:
+            result = results.get()
+            if result is finished:
+                break
+            yield result
+    finally:
+        # 调用方提前结束（出错或关闭生成器）时取消扫描并等待会话关闭，与线程引擎取消剩余任务一致
+        if result is not finished:
+            stop.set()
+            if "task" in running:
+                try:
+                    running["loop"].call_soon_threadsafe(running["task"].cancel)
+                except RuntimeError:
+                    pass  # 事件循环已经结束
+            # 取走剩余的结果，阻塞在 results.put 上的线程才能退出
+            while results.get() is not finished:
+                pass
+        thread.join()
+
+    if errors:
+        raise errors[0]
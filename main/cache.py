@@ -0,0 +1,160 @@
+"""
+响应缓存模块 - 在同一次扫描中让不同POC共享相同请求的响应
+"""
+import sys
+import asyncio
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+
+
+DEFAULT_MAX_BYTES = 67108864  # 默认最多缓存64MB响应
+
+
+def response_size(response):
+
+    # 缓存中占用内存最多的是响应体和解码后的文本
+    return len(response.content or b'') + sys.getsizeof(getattr(response, '_rws_text', ''))
+
+
+class ResponseCache:
+
+    def __init__(self, max_entries=1024, metrics=None, max_bytes=DEFAULT_MAX_BYTES):
+
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.metrics = metrics  # 共享响应的次数同时计入扫描指标
+        self.lock = threading.Lock()
+        # 请求 -> [响应, 占用字节数, 还会读取的POC数（None表示不知道）]，按最近使用排序
+        self.entries = OrderedDict()
+        self.size = 0
+        self.pending = {}  # 正在进行中的请求 -> [Future, 等待的调用方数量]
+        self.pending_async = {}  # 异步引擎中正在进行中的请求 -> [asyncio.Future, 等待的调用方数量]
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, key):
+
+        # 调用方需要持有锁；所有会读取的POC都读取过后删除响应
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        self.count_hit()
+        if entry[2] is not None:
+            entry[2] -= 1
+            if entry[2] <= 0:
+                self.remove(key)
+                return entry[0], None
+        self.entries.move_to_end(key)
+        return entry[0], None
+
+    def count_hit(self):
+
+        self.hits += 1
+        if self.metrics is not None:
+            self.metrics.record_cache_hit()
+
+    def remove(self, key):
+
+        entry = self.entries.pop(key)
+        self.size -= entry[1]
+
+    def store(self, key, response, remaining):
+
+        # 调用方需要持有锁。请求失败的结果只共享给同时等待的调用方，不缓存：
+        # 偶然的超时不会在之后的POC中重复出现
+        if response is None or (remaining is not None and remaining <= 0):
+            return
+        size = response_size(response)
+        if self.max_bytes and size > self.max_bytes:
+            return
+        if key in self.entries:
+            self.remove(key)
+        self.entries[key] = [response, size, remaining]
+        self.size += size
+
+        # 超过数量或大小上限时淘汰最久未使用的响应
+        while len(self.entries) > self.max_entries or (self.max_bytes and self.size > self.max_bytes):
+            self.remove(next(iter(self.entries)))
+
+    def get_or_fetch(self, key, fetch, readers=None):
+
+        # readers 为本次扫描中会发送这个请求的POC数量，包括当前调用方
+        with self.lock:
+            entry = self.lookup(key)
+            if entry is not None:
+                return entry
+
+            # 相同的请求正在进行中时，等待它完成而不是重复发送
+            waiting = self.pending.get(key)
+            owner = waiting is None
+            if owner:
+                waiting = self.pending[key] = [Future(), 0]
+                self.misses += 1
+            else:
+                waiting[1] += 1
+                self.count_hit()
+
+        future = waiting[0]
+        if not owner:
+            return future.result()
+
+        try:
+            entry = fetch()
+        except BaseException as e:
+            with self.lock:
+                del self.pending[key]
+            future.set_exception(e)
+            raise
+
+        with self.lock:
+            del self.pending[key]
+            self.store(key, entry[0], readers - 1 - waiting[1] if readers is not None else None)
+        future.set_result(entry)
+        return entry
+
+    async def get_or_fetch_async(self, key, fetch, readers=None):
+
+        # 异步引擎只在事件循环线程中调用，不需要在等待期间持有锁
+        with self.lock:
+            entry = self.lookup(key)
+            if entry is not None:
+                return entry
+
+        waiting = self.pending_async.get(key)
+        if waiting is not None:
+            waiting[1] += 1
+            self.count_hit()
+            return await asyncio.shield(waiting[0])
+
+        waiting = self.pending_async[key] = [asyncio.get_running_loop().create_future(), 0]
+        future = waiting[0]
+        self.misses += 1
+        try:
+            entry = await fetch()
+        except BaseException as e:
+            del self.pending_async[key]
+            future.set_exception(e)
+            # 没有其他协程等待时避免 "exception was never retrieved" 警告
+            future.exception()
+            raise
+
+        del self.pending_async[key]
+        with self.lock:
+            self.store(key, entry[0], readers - 1 - waiting[1] if readers is not None else None)
+        future.set_result(entry)
+        return entry
+
+
+def create_response_cache(config, metrics=None):
+
+    cache_config = config.get('response_cache') or {}
+    if not cache_config.get('enabled', True):
+        return None
+    return ResponseCache(cache_config.get('max_entries', 1024), metrics,
+                         cache_config.get('max_bytes', DEFAULT_MAX_BYTES))
+
+
+def build_cache_key(method, path, headers, body):
+
+    return method, path, headers, str(body)
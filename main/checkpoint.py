@@ -0,0 +1,279 @@
+"""
+断点续扫模块 - 记录扫描配置和已完成的(POC, 目标)任务，中断的扫描可以从断点继续
+"""
+import os
+import json
+import time
+import datetime
+from collections import deque
+from urllib.parse import urlsplit, urlunsplit
+
+import yaml
+
+
+# 断点文件格式版本，格式变化时需要递增
+CHECKPOINT_VERSION = 1
+DEFAULT_CHECKPOINT_DIR = 'checkpoints'
+# 不写入断点文件的请求头（不区分大小写），继续扫描时从配置文件重新读取
+SECRET_HEADERS = ('cookie', 'authorization', 'proxy-authorization')
+
+
+class Checkpoint:
+
+    # 断点文件第一行为扫描配置（JSON），之后每行一条进度记录，目标按在目标列表中的序号记录：
+    #   w 序号          序号小于该值的目标都已完成
+    #   d 序号          该目标的所有POC都已完成
+    #   p 序号 POC序号  该目标的单个POC已完成（只记录写入时尚未完成的目标）
+    def __init__(self, path, meta, flush_interval=5.0, done_below=0, done=(), partial=None):
+
+        self.path = path
+        self.meta = meta
+        self.flush_interval = flush_interval
+        self.done_below = done_below
+        self.done = set(done)
+        self.partial = partial or {}  # 目标序号 -> 已完成的POC序号集合
+        self.resumed = False
+        self.poc_index = {os.path.abspath(f): i for i, f in enumerate(meta["poc_files"])}
+        self.targets = {}  # 正在扫描的目标URL -> [[序号, 剩余任务数, 尚未写入的POC序号], ...]
+        self.lines = []  # 尚未写入文件的记录
+        self.last_flush = time.monotonic()
+        self.file = open(path, 'a', encoding='utf-8')
+
+    def is_done(self, index):
+
+        return index < self.done_below or index in self.done
+
+    def iter_targets(self, urls, pocs):
+
+        # 跳过已完成的目标，部分完成的目标只扫描剩余的POC，返回 URL 或 (URL, POC列表)
+        for index, url in enumerate(urls):
+            if self.is_done(index):
+                continue
+            finished = self.partial.get(index)
+            target_pocs = pocs
+            if finished:
+                target_pocs = [poc for poc in pocs if self.poc_index.get(os.path.abspath(poc.path)) not in finished]
+            self.targets.setdefault(url, deque()).append([index, len(target_pocs), []])
+            if not target_pocs:
+                self.finish_target(url)
+                continue
+            yield (url, target_pocs) if target_pocs is not pocs else url
+
+    def finish_target(self, url):
+
+        entries = self.targets[url]
+        index = entries.popleft()[0]
+        if not entries:
+            del self.targets[url]
+        self.lines.append(f"d {index}\n")
+
+    def record(self, result):
+
+        entries = self.targets.get(result.url)
+        if not entries:
+            return
+        entry = entries[0]
+        entry[1] -= 1
+        if entry[1] <= 0:
+            self.finish_target(result.url)
+        else:
+            poc_index = self.poc_index.get(os.path.abspath(result.poc.path))
+            if poc_index is not None:
+                entry[2].append(poc_index)
+
+        # 发现漏洞时立即写入，恢复扫描时不会重复报告同一个漏洞
+        self.flush(force=result.vulnerable)
+
+    def drop(self, url):
+
+        # 没有扫描的目标（如域名无法解析）也算作已完成
+        if url in self.targets:
+            self.finish_target(url)
+
+    def flush(self, force=False):
+
+        if not force and time.monotonic() - self.last_flush < self.flush_interval:
+            return
+        self.last_flush = time.monotonic()
+
+        # 尚未完成的目标只写入新完成的POC，已完成的目标只写入一条记录
+        for entries in self.targets.values():
+            for index, _, finished in entries:
+                self.lines.extend(f"p {index} {poc_index}\n" for poc_index in finished)
+                finished.clear()
+        if not self.lines:
+            return
+        self.file.write(''.join(self.lines))
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.lines = []
+
+    def close(self):
+
+        if not self.file.closed:
+            self.flush(force=True)
+            self.file.close()
+
+    def remove(self):
+
+        # 扫描完成后不再需要断点
+        self.file.close()
+        os.remove(self.path)
+
+
+def checkpoint_config(config):
+
+    return config.get('checkpoint') or {}
+
+
+def strip_userinfo(url):
+
+    # 代理地址中的用户名和密码不写入断点文件
+    try:
+        parts = urlsplit(url)
+    except (TypeError, ValueError):
+        return url
+    if not parts.username and not parts.password:
+        return url
+    netloc = parts.hostname or ''
+    if ':' in netloc:
+        netloc = f"[{netloc}]"
+    if parts.port:
+        netloc = f"{netloc}:{parts.port}"
+    return urlunsplit(parts._replace(netloc=netloc))
+
+
+def strip_secrets(config):
+
+    # 断点文件是明文，去掉令牌、认证请求头和代理密码，继续扫描时从配置文件恢复（见 restore_secrets）
+    config = dict(config)
+    if config.get('headers'):
+        config['headers'] = {name: value for name, value in config['headers'].items()
+                             if name.lower() not in SECRET_HEADERS}
+    if config.get('proxy'):
+        config['proxy'] = {scheme: strip_userinfo(url) for scheme, url in config['proxy'].items()}
+    if config.get('cluster'):
+        config['cluster'] = {key: value for key, value in config['cluster'].items() if key != 'token'}
+    return config
+
+
+def restore_secrets(meta):
+
+    # 配置文件已经不存在或无法读取时使用断点中去掉敏感信息后的配置
+    config_file = meta.get("config_file")
+    try:
+        with open(config_file, 'r', encoding='utf-8') as f:
+            current = yaml.safe_load(f) or {}
+    except (TypeError, OSError, yaml.YAMLError):
+        return meta["config"]
+
+    config = dict(meta["config"])
+    headers = {name: value for name, value in (current.get('headers') or {}).items()
+               if name.lower() in SECRET_HEADERS}
+    if headers:
+        config['headers'] = dict(config.get('headers') or {}, **headers)
+    if current.get('proxy') and config.get('proxy') == strip_secrets(current)['proxy']:
+        config['proxy'] = current['proxy']
+    token = (current.get('cluster') or {}).get('token')
+    if token and config.get('cluster'):
+        config['cluster'] = dict(config['cluster'], token=token)
+    return config
+
+
+def create_checkpoint(config, poc_files, targets, report_file, config_file='config.yaml'):
+
+    # 从标准输入读取的目标无法再次读取，不记录断点
+    ckpt_config = checkpoint_config(config)
+    if not ckpt_config.get('enabled', True) or '-' in targets:
+        return None
+
+    ckpt_dir = ckpt_config.get('dir', DEFAULT_CHECKPOINT_DIR)
+    if not os.path.exists(ckpt_dir):
+        os.makedirs(ckpt_dir)
+
+    name = os.path.splitext(os.path.basename(report_file))[0] if report_file else \
+        datetime.datetime.now().strftime('%Y-%m-%d_%H-%M-%S')
+    path = os.path.join(ckpt_dir, f"{name}.ckpt")
+    meta = {
+        "version": CHECKPOINT_VERSION,
+        "created": datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        "poc_files": list(poc_files),
+        "targets": list(targets),
+        "report_file": report_file,
+        "config_file": os.path.abspath(config_file),
+        "config": strip_secrets(config),
+    }
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(json.dumps(meta, ensure_ascii=False, default=str) + "\n")
+    return Checkpoint(path, meta, ckpt_config.get('flush_interval', 5.0))
+
+
+def read_meta(path):
+
+    with open(path, 'r', encoding='utf-8') as f:
+        meta = json.loads(f.readline())
+    if meta.get("version") != CHECKPOINT_VERSION:
+        raise ValueError(f"断点文件 {path} 的版本不受支持")
+    return meta
+
+
+def load_checkpoint(path):
+
+    meta = read_meta(path)
+    done_below = 0
+    done = set()
+    partial = {}
+    with open(path, 'r', encoding='utf-8') as f:
+        f.readline()
+        for line in f:
+            parts = line.split()
+            try:
+                if parts[0] == 'w':
+                    done_below = max(done_below, int(parts[1]))
+                elif parts[0] == 'd':
+                    done.add(int(parts[1]))
+                elif parts[0] == 'p':
+                    partial.setdefault(int(parts[1]), set()).add(int(parts[2]))
+            except (IndexError, ValueError):
+                continue  # 程序崩溃时最后一行可能没有写完整
+
+    # 从头开始连续完成的目标合并为一条记录，断点文件不会随着每次恢复而变大
+    while done_below in done:
+        done.discard(done_below)
+        done_below += 1
+    done = {index for index in done if index >= done_below}
+    partial = {index: pocs for index, pocs in partial.items() if index >= done_below and index not in done}
+
+    tmp_file = f"{path}.tmp"
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        f.write(json.dumps(meta, ensure_ascii=False, default=str) + "\n")
+        f.write(f"w {done_below}\n")
+        f.writelines(f"d {index}\n" for index in sorted(done))
+        f.writelines(f"p {index} {poc}\n" for index, pocs in sorted(partial.items()) for poc in sorted(pocs))
+    os.replace(tmp_file, path)
+
+    # 文件中保存的是去掉敏感信息的配置，内存中恢复完整的配置用于扫描
+    meta = dict(meta, config=restore_secrets(meta))
+    ckpt_config = checkpoint_config(meta["config"])
+    checkpoint = Checkpoint(path, meta, ckpt_config.get('flush_interval', 5.0), done_below, done, partial)
+    checkpoint.resumed = True
+    return checkpoint
+
+
+def list_checkpoints(config):
+
+    # 未完成的扫描，最近的在前
+    ckpt_dir = checkpoint_config(config).get('dir', DEFAULT_CHECKPOINT_DIR)
+    if not os.path.isdir(ckpt_dir):
+        return []
+    checkpoints = []
+    for name in os.listdir(ckpt_dir):
+        path = os.path.join(ckpt_dir, name)
+        if not name.endswith('.ckpt'):
+            continue
+        try:
+            checkpoints.append((path, read_meta(path)))
+        except (OSError, ValueError):
+            continue
+    checkpoints.sort(key=lambda item: os.path.getmtime(item[0]), reverse=True)
+    return checkpoints
@@ -0,0 +1,387 @@
+"""
+命令行模块 - 非交互式批量扫描，适合定时任务和流水线
+"""
+import os
+import sys
+import glob
+import json
+import argparse
+
+
+# 退出码
+EXIT_CLEAN = 0  # 扫描完成，未发现漏洞
+EXIT_FINDINGS = 1  # 扫描完成，发现漏洞
+EXIT_USAGE = 2  # 参数错误（与argparse一致）
+EXIT_ERROR = 3  # 配置、POC或目标有误，或扫描因错误而中止
+EXIT_INTERRUPTED = 130  # 被用户中断
+
+# --profile 可以同时启用的分析工具
+PROFILE_EXTRAS = ('cprofile', 'tracemalloc')
+
+
+def info(message, quiet=False):
+
+    # 提示信息输出到标准错误，标准输出只输出扫描结果
+    if not quiet:
+        print(message, file=sys.stderr)
+
+
+def describe_error(error):
+
+    # 未处理的异常只输出一行错误信息
+    import sqlite3
+    import yaml
+    if isinstance(error, yaml.YAMLError):
+        return f"配置文件格式错误: {str(error).splitlines()[0] if str(error) else type(error).__name__}"
+    if isinstance(error, sqlite3.Error):
+        return f"结果数据库错误: {str(error)}"
+    if isinstance(error, OSError):
+        return f"{error.strerror or type(error).__name__}: {error.filename}" if error.filename else str(error)
+    return f"{type(error).__name__}: {str(error)}"
+
+
+def split_values(values):
+
+    # 同一参数可以重复指定，也可以用逗号分隔多个值
+    return [v.strip() for value in values or () for v in value.split(',') if v.strip()]
+
+
+def expand_poc_paths(patterns):
+
+    poc_files = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            matched = sorted(glob.glob(os.path.join(pattern, '**', '*.yaml'), recursive=True))
+        elif any(c in pattern for c in '*?['):
+            matched = sorted(f for f in glob.glob(pattern, recursive=True) if os.path.isfile(f))
+        else:
+            matched = [pattern] if os.path.isfile(pattern) else []
+        if not matched:
+            raise ValueError(f"没有找到与 {pattern} 匹配的POC文件")
+        poc_files.extend(matched)
+    return list(dict.fromkeys(poc_files))
+
+
+def select_poc_files(args):
+
+    # 先按路径或通配符选择文件（未指定时为整个POC库），再按产品类型、产品、漏洞类型过滤
+    types = split_values(args.type)
+    products = [tuple(p.split('/', 1)) if '/' in p else p for p in split_values(args.product)]
+    vuln_types = split_values(args.vuln_type)
+
+    poc_files = expand_poc_paths(args.poc) if args.poc else None
+    if poc_files is None or types or products or vuln_types:
+        from .library import get_index, query_pocs
+        library_files = query_pocs(get_index(args.poc_dir), types, products, vuln_types)
+        if poc_files is None:
+            poc_files = library_files
+        else:
+            library_files = {os.path.abspath(f) for f in library_files}
+            poc_files = [f for f in poc_files if os.path.abspath(f) in library_files]
+    return poc_files
+
+
+def filter_pocs(pocs, args):
+
+    # 危害程度、标签、id 使用编译后的POC判断，POC库以外的文件也可以过滤
+    severities = {s.lower() for s in split_values(args.severity)}
+    tags = {t.lower() for t in split_values(args.tag)}
+    ids = set(split_values(args.id))
+    return [
+        poc for poc in pocs
+        if (not severities or poc.severity.lower() in severities)
+        and (not tags or tags & {t.lower() for t in poc.tags})
+        and (not ids or poc.id in ids)
+    ]
+
+
+def format_finding(result, output_format):
+
+    poc = result.poc
+    if output_format == 'jsonl':
+        return json.dumps({
+            "url": result.url,
+            "poc_id": poc.id,
+            "poc_name": poc.name,
+            "severity": poc.severity,
+            "vuln_class": poc.vuln_class,
+            "path": poc.path,
+        }, ensure_ascii=False)
+    return f"[{poc.severity}] {result.url} - {poc.name}"
+
+
+def build_parser():
+
+    parser = argparse.ArgumentParser(
+        prog='python app.py',
+        description='非交互式扫描：选择POC并扫描目标，不带参数运行时进入交互式菜单',
+        epilog=f'退出码: {EXIT_CLEAN} 未发现漏洞, {EXIT_FINDINGS} 发现漏洞, {EXIT_USAGE} 参数错误, '
+               f'{EXIT_ERROR} 配置/POC/目标错误或扫描中止, {EXIT_INTERRUPTED} 被中断'
+    )
+    group = parser.add_argument_group('POC选择（可组合使用，同一参数可重复或用逗号分隔）')
+    group.add_argument('-p', '--poc', action='append', help='POC文件、目录或通配符（如 "poc/**/*.yaml"），默认为整个POC库')
+    group.add_argument('--type', action='append', help='产品类型')
+    group.add_argument('--product', action='append', help='产品名称，或 产品类型/产品名称')
+    group.add_argument('--vuln-type', action='append', help='漏洞类型（版本目录）')
+    group.add_argument('-s', '--severity', action='append', help='危害程度')
+    group.add_argument('--tag', action='append', help='标签')
+    group.add_argument('--id', action='append', help='POC id')
+    group.add_argument('--poc-dir', default='poc', help='POC库目录')
+
+    parser.add_argument('-t', '--target', action='append',
+                        help='目标URL或URL文件（支持.gz/.bz2/.xz，- 表示标准输入），未指定时从标准输入读取')
+    parser.add_argument('-c', '--config', default='config.yaml', help='配置文件')
+    parser.add_argument('--engine', choices=('thread', 'async'), help='扫描引擎，覆盖配置文件')
+    parser.add_argument('--threads', type=int, help='线程数，覆盖配置文件')
+    parser.add_argument('--timeout', type=float, help='超时时间（秒），覆盖配置文件')
+    parser.add_argument('--processes', type=int, nargs='?', const=0, metavar='N',
+                        help='多进程扫描，N为进程数（不指定时为CPU核数），覆盖配置文件')
+    parser.add_argument('-o', '--format', choices=('text', 'jsonl'), default='text', help='标准输出中漏洞的格式')
+    parser.add_argument('--report', help='HTML报告文件，默认保存到report目录')
+    parser.add_argument('--no-report', action='store_true', help='不生成HTML报告')
+    parser.add_argument('--list', action='store_true', help='只列出选中的POC文件，不扫描')
+    parser.add_argument('--resume', nargs='?', const='', metavar='CHECKPOINT',
+                        help='从断点继续中断的扫描（不指定断点文件时为最近一次中断的扫描），忽略POC和目标参数')
+    parser.add_argument('--profile', nargs='?', const='', metavar='cprofile,tracemalloc',
+                        help='性能分析：记录请求各阶段、匹配和报告写入的耗时，可同时启用cProfile和tracemalloc，'
+                             '汇总写入报告旁边的 *_profile.txt')
+    parser.add_argument('-q', '--quiet', action='store_true', help='不输出提示信息')
+
+    group = parser.add_argument_group('分布式扫描')
+    group.add_argument('--coordinator', metavar='ADDRESS',
+                       help='作为协调节点监听该地址（如 0.0.0.0:7700），任务分发给工作节点执行')
+    group.add_argument('--local-workers', type=int, help='协调节点在本机启动的工作节点数')
+    group.add_argument('--worker', metavar='ADDRESS', help='作为工作节点连接协调节点，忽略POC和目标参数')
+    group.add_argument('--token', help='协调节点和工作节点之间的认证令牌，覆盖配置文件')
+
+    group = parser.add_argument_group('结果导出（按 --id、-s 过滤时各只能指定一个值）')
+    group.add_argument('--export', metavar='OUTPUT',
+                       help='把结果数据库中的漏洞导出为JSONL（支持.gz/.bz2/.xz压缩，- 表示标准输出），不扫描')
+    group.add_argument('--db', help='结果数据库文件，默认使用配置文件中的 results_store.path')
+    group.add_argument('--scan', type=int, dest='scan_id', help='只导出指定扫描的结果')
+    group.add_argument('--host', help='只导出指定主机的结果')
+    return parser
+
+
+def scan(args, run):
+
+    # 执行扫描并输出总结，返回退出码
+    def on_finding(result, summary):
+        print(format_finding(result, args.format), flush=True)
+
+    from .runner import summary_text
+    try:
+        summary = run(on_finding, lambda message: info(message))
+    except KeyboardInterrupt:
+        info("扫描被用户中断")
+        return EXIT_INTERRUPTED
+    except Exception as e:
+        info(f"错误: 扫描中止: {describe_error(e)}")
+        return EXIT_ERROR
+
+    info(summary_text(summary), args.quiet)
+    if summary.profile_file:
+        info(f"性能分析结果已保存到 {summary.profile_file}", args.quiet)
+    if summary.findings:
+        report = f"，报告已保存到 {summary.report_file}" if summary.report_file else ""
+        info(f"扫描完成! 共发现 {summary.findings} 个漏洞{report}", args.quiet)
+        return EXIT_FINDINGS
+    info("扫描完成! 未发现漏洞", args.quiet)
+    return EXIT_CLEAN
+
+
+def resume(args):
+
+    from .config import load_config
+    from .checkpoint import list_checkpoints, load_checkpoint
+
+    checkpoint_file = args.resume
+    if not checkpoint_file:
+        config = load_config(args.config) if os.path.isfile(args.config) else {}
+        checkpoints = list_checkpoints(config)
+        if not checkpoints:
+            info("错误: 没有未完成的扫描")
+            return EXIT_ERROR
+        checkpoint_file = checkpoints[0][0]
+
+    try:
+        checkpoint = load_checkpoint(checkpoint_file)
+    except (OSError, ValueError) as e:
+        info(f"错误: 无法读取断点文件 {checkpoint_file}: {str(e)}")
+        return EXIT_ERROR
+
+    from .logger import configure_log_writer
+    from .runner import resume_scan
+
+    configure_log_writer(checkpoint.meta["config"])
+    info(f"继续扫描: {checkpoint_file}", args.quiet)
+    code = scan(args, lambda on_finding, warn: resume_scan(checkpoint, on_finding, warn, not args.quiet))
+    if code in (EXIT_INTERRUPTED, EXIT_ERROR) and os.path.exists(checkpoint_file):
+        info(f"可使用 --resume {checkpoint_file} 继续扫描")
+    return code
+
+
+def export(args):
+
+    from .store import DEFAULT_STORE_FILE, export_jsonl
+
+    ids = split_values(args.id)
+    severities = split_values(args.severity)
+    if len(ids) > 1 or len(severities) > 1:
+        info("错误: 导出时 --id 和 -s 只能指定一个值")
+        return EXIT_USAGE
+
+    store_file = args.db
+    if not store_file:
+        from .config import load_config
+        config = load_config(args.config) if os.path.isfile(args.config) else {}
+        store_file = (config.get('results_store') or {}).get('path', DEFAULT_STORE_FILE)
+    if not os.path.isfile(store_file):
+        info(f"错误: 结果数据库 {store_file} 不存在")
+        return EXIT_ERROR
+
+    count = export_jsonl(store_file, args.export, scan_id=args.scan_id, host=args.host,
+                         poc_id=ids[0] if ids else None, severity=severities[0] if severities else None)
+    info(f"已导出 {count} 条结果", args.quiet)
+    return EXIT_CLEAN
+
+
+def work(args):
+
+    # 工作节点的扫描配置由协调节点发送，命令行参数只覆盖本机的并发设置
+    from .cluster import run_worker
+
+    token = args.token
+    if token is None and os.path.isfile(args.config):
+        from .config import load_config
+        token = (load_config(args.config).get('cluster') or {}).get('token')
+    overrides = {key: getattr(args, key) for key in ('engine', 'threads', 'timeout') if getattr(args, key) is not None}
+    try:
+        total = run_worker(args.worker, token, overrides, lambda message: info(message, args.quiet))
+    except KeyboardInterrupt:
+        info("工作节点被用户中断", args.quiet)
+        return EXIT_INTERRUPTED
+    except (OSError, ValueError) as e:
+        info(f"错误: 工作节点异常退出: {str(e)}")
+        return EXIT_ERROR
+    info(f"工作节点完成，共执行 {total} 个任务", args.quiet)
+    return EXIT_CLEAN
+
+
+def main(argv=None):
+
+    # 未处理的异常也返回 EXIT_ERROR，不能与发现漏洞的退出码混淆
+    args = build_parser().parse_args(argv)
+    try:
+        return dispatch(args)
+    except KeyboardInterrupt:
+        info("程序被用户中断")
+        return EXIT_INTERRUPTED
+    except Exception as e:
+        info(f"错误: {describe_error(e)}")
+        return EXIT_ERROR
+
+
+def dispatch(args):
+
+    if args.worker:
+        return work(args)
+    if args.resume is not None:
+        return resume(args)
+    if args.export:
+        return export(args)
+
+    try:
+        poc_files = select_poc_files(args)
+    except ValueError as e:
+        info(f"错误: {str(e)}")
+        return EXIT_ERROR
+
+    # 性能分析在加载POC之前启动，汇总中包含POC加载的耗时
+    profile_config = None
+    if args.profile is not None:
+        extras = split_values([args.profile])
+        unknown = [extra for extra in extras if extra not in PROFILE_EXTRAS]
+        if unknown:
+            info(f"错误: 不支持的性能分析选项 {', '.join(unknown)}，可选 {', '.join(PROFILE_EXTRAS)}")
+            return EXIT_USAGE
+        profile_config = {'enabled': True, **{extra: True for extra in extras}}
+        if not args.list:
+            from .profiler import start_profiler
+            start_profiler(profile_config)
+
+    from .compiler import load_compiled_pocs
+    pocs, errors = load_compiled_pocs(poc_files)
+    for poc_file, error in errors:
+        info(f"警告: 处理POC文件 {poc_file} 时出错: {error}，跳过此POC", args.quiet)
+    pocs = filter_pocs(pocs, args)
+
+    if args.list:
+        for poc in pocs:
+            print(poc.path)
+        return EXIT_CLEAN
+    if not pocs:
+        info("错误: 没有选中任何POC")
+        return EXIT_ERROR
+
+    targets = args.target
+    if not targets:
+        if sys.stdin.isatty():
+            info("错误: 请使用 -t 指定目标，或通过标准输入提供目标")
+            return EXIT_USAGE
+        targets = ['-']
+    from .url import is_target_file
+    for target in targets:
+        if target != '-' and is_target_file(target) and not os.path.isfile(target):
+            info(f"错误: 目标文件 {target} 不存在")
+            return EXIT_ERROR
+
+    if not os.path.isfile(args.config):
+        info(f"错误: 找不到 {args.config} 配置文件")
+        return EXIT_ERROR
+
+    from .config import load_config
+    from .logger import configure_log_writer
+    from .checkpoint import create_checkpoint
+    from .runner import new_report_file, run_scan
+    from .url import iter_targets
+
+    config = load_config(args.config)
+    for key in ('engine', 'threads', 'timeout'):
+        if getattr(args, key) is not None:
+            config[key] = getattr(args, key)
+    if profile_config:
+        config['profile'] = dict(config.get('profile') or {}, **profile_config)
+    if args.processes is not None:
+        config['processes'] = dict(config.get('processes') or {}, enabled=True, count=args.processes)
+    if args.coordinator or args.local_workers is not None or args.token is not None:
+        cluster_config = config['cluster'] = dict(config.get('cluster') or {})
+        # 只指定本机工作节点数时监听本机的随机端口
+        listen = args.coordinator or (cluster_config.get('listen') or '127.0.0.1:0' if args.local_workers else None)
+        for key, value in (('listen', listen), ('local_workers', args.local_workers), ('token', args.token)):
+            if value is not None:
+                cluster_config[key] = value
+    configure_log_writer(config)
+
+    report_file = None
+    if args.report and not args.no_report:
+        report_file = args.report
+        report_dir = os.path.dirname(report_file)
+        if report_dir and not os.path.exists(report_dir):
+            os.makedirs(report_dir)
+    elif not args.no_report:
+        report_file = new_report_file()
+
+    # 记录断点，扫描中断后可以使用 --resume 继续
+    checkpoint = create_checkpoint(config, [poc.path for poc in pocs], targets, report_file, args.config)
+
+    info(f"正在扫描: {len(pocs)} 个POC", args.quiet)
+    code = scan(args, lambda on_finding, warn: run_scan(pocs, iter_targets(targets), config, report_file,
+                                                         on_finding, warn, checkpoint, targets, not args.quiet))
+    if code in (EXIT_INTERRUPTED, EXIT_ERROR) and checkpoint:
+        info(f"可使用 --resume {checkpoint.path} 继续扫描")
+    return code
+
+
+if __name__ == '__main__':
+    sys.exit(main())
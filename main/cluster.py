@@ -0,0 +1,540 @@
+"""
+分布式扫描模块 - 协调节点把(POC, 目标)任务分片发给多个工作节点，工作节点把结果实时发回，
+由协调节点统一写入日志和报告；工作节点断开或失去响应时，尚未完成的任务重新分配给其他工作节点
+"""
+import os
+import sys
+import hmac
+import json
+import math
+import time
+import queue
+import socket
+import secrets
+import threading
+import subprocess
+from collections import deque
+from itertools import islice, count
+
+from .metrics import get_metrics, start_metrics
+from .result import ScanResult, StepRecord
+
+
+DEFAULT_PORT = 7700
+# 工作节点的结果攒够一批或超过间隔后再发送，发现漏洞时立即发送
+SEND_BATCH_SIZE = 200
+SEND_INTERVAL = 0.5
+# 连接协调节点失败时重试的时长（秒），协调节点可能还没有启动
+CONNECT_RETRY = 30
+# 本机工作进程意外退出时，每个进程平均最多重新启动的次数
+WORKER_RESTARTS = 3
+
+
+def parse_address(address, default_host='127.0.0.1'):
+
+    # 支持 主机:端口、:端口、端口、主机 几种写法
+    host, sep, port = str(address).rpartition(':')
+    if not sep:
+        host, port = ('', port) if port.isdigit() else (port, '')
+    return host.strip('[]') or default_host, int(port) if port else DEFAULT_PORT
+
+
+class Connection:
+
+    # 每行一个JSON消息，发送可以来自多个线程
+    def __init__(self, sock):
+
+        self.sock = sock
+        self.reader = sock.makefile('rb')
+        self.writer = sock.makefile('wb')
+        self.lock = threading.Lock()
+        self.buffered = 0
+        self.last_flush = time.monotonic()
+
+    def send(self, message, flush=True):
+
+        data = json.dumps(message, ensure_ascii=False, default=str).encode('utf-8') + b'\n'
+        with self.lock:
+            self.writer.write(data)
+            self.buffered += 1
+            if flush or self.buffered >= SEND_BATCH_SIZE or time.monotonic() - self.last_flush >= SEND_INTERVAL:
+                self.flush_locked()
+
+    def flush(self):
+
+        with self.lock:
+            if self.buffered:
+                self.flush_locked()
+
+    def flush_locked(self):
+
+        self.writer.flush()
+        self.buffered = 0
+        self.last_flush = time.monotonic()
+
+    def receive(self):
+
+        # 连接关闭时返回None
+        line = self.reader.readline()
+        return json.loads(line) if line else None
+
+    def close(self):
+
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        for f in (self.writer, self.reader, self.sock):
+            try:
+                f.close()
+            except OSError:
+                pass
+
+
+def encode_result(result, poc_index):
+
+    return {
+        "type": "result",
+        "url": result.url,
+        "poc": poc_index,
+        "match": result.match_result,
+        "vulnerable": result.vulnerable,
+        "steps": [[s.method, s.url, s.status_code, s.elapsed, s.truncated, s.snapshot] for s in result.steps],
+        "sent": result.requests_sent,
+        "saved": result.requests_saved,
+    }
+
+
+def decode_result(message, pocs):
+
+    steps = tuple(
+        StepRecord(method, url, status_code, elapsed, truncated, tuple(snapshot) if snapshot else None)
+        for method, url, status_code, elapsed, truncated, snapshot in message["steps"]
+    )
+    return ScanResult(message["url"], pocs[message["poc"]], message["match"], message["vulnerable"], steps,
+                      message["sent"], message["saved"])
+
+
+def info(message):
+
+    # 与命令行模式一致，提示信息输出到标准错误
+    print(message, file=sys.stderr, flush=True)
+
+
+def quiet(message):
+
+    pass
+
+
+class WorkerState:
+
+    __slots__ = ('conn', 'name', 'outstanding', 'last_seen', 'closing')
+
+    def __init__(self, conn, name):
+
+        self.conn = conn
+        self.name = name
+        self.outstanding = {}  # 目标URL -> [尚未返回结果的POC序号集合, ...]
+        self.last_seen = time.monotonic()
+        self.closing = False
+
+
+class Coordinator:
+
+    # 所有工作节点的消息都放入同一个队列，由扫描线程依次处理，分配状态不需要加锁
+    def __init__(self, pocs, urls, config):
+
+        cluster_config = config.get('cluster') or {}
+        self.pocs = pocs
+        self.poc_index = {id(poc): i for i, poc in enumerate(pocs)}
+        self.shard_size = cluster_config.get('shard_size', 10)
+        self.token = cluster_config.get('token') or None
+        self.heartbeat = cluster_config.get('heartbeat', 5)
+        self.worker_timeout = cluster_config.get('worker_timeout', 30)
+        # 多进程模式下工作节点的连接信息不需要显示
+        self.log = quiet if cluster_config.get('quiet') else info
+
+        # 先读取第一个目标，没有目标时不需要等待工作节点
+        self.urls = iter(urls)
+        first = next(self.urls, None)
+        self.exhausted = first is None
+        self.retry = deque([self.target_item(first)] if first is not None else ())
+        self.outstanding = 0  # 已分配但尚未返回结果的任务数
+
+        self.events = queue.Queue()
+        self.workers = {}
+        self.waiting = []  # 没有任务可分配时等待的工作节点
+        self.ids = count(1)
+
+        # 工作节点不需要共享文件系统：POC源文件和扫描配置都由协调节点发送
+        sources = []
+        for poc in pocs:
+            with open(poc.path, 'r', encoding='utf-8') as f:
+                sources.append({"path": poc.path, "source": f.read()})
+        worker_config = {key: value for key, value in config.items() if key not in ('cluster', 'processes')}
+        # 工作节点的扫描指标随心跳发回，由协调节点合并导出
+        worker_config['metrics'] = dict(config.get('metrics') or {}, listen=None, file=None)
+        self.metrics = get_metrics(config)
+        self.setup = {"type": "setup", "pocs": sources, "config": worker_config, "heartbeat": self.heartbeat}
+
+        host, port = parse_address(cluster_config['listen'], '0.0.0.0')
+        self.server = socket.create_server((host, port))
+        self.address = self.server.getsockname()[:2]
+        # 工作节点会收到所有POC和扫描配置，并且可以提交结果，没有配置令牌时生成一个随机令牌
+        if not self.token:
+            self.token = secrets.token_hex(16)
+            info(f"未配置认证令牌，已生成本次扫描的令牌，工作节点使用 --token {self.token} 连接")
+        threading.Thread(target=self.accept, daemon=True).start()
+        self.log(f"协调节点已启动，监听 {self.address[0]}:{self.address[1]}，等待工作节点连接")
+
+        # 本机的工作节点
+        self.local_address = ('127.0.0.1' if host in ('0.0.0.0', '::') else host, self.address[1])
+        self.processes = [spawn_worker(self.local_address, self.token)
+                          for _ in range(cluster_config.get('local_workers', 0))]
+        self.restarts = 0
+
+    def target_item(self, target):
+
+        # 断点续扫时部分完成的目标只分配剩余的POC
+        if isinstance(target, tuple):
+            url, pocs = target
+            return url, [self.poc_index[id(poc)] for poc in pocs]
+        return target, None
+
+    def accept(self):
+
+        while True:
+            try:
+                sock, _ = self.server.accept()
+            except OSError:
+                return  # 协调节点已关闭
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            threading.Thread(target=self.read, args=(next(self.ids), Connection(sock)), daemon=True).start()
+
+    def read(self, worker_id, conn):
+
+        try:
+            while True:
+                message = conn.receive()
+                if message is None:
+                    break
+                self.events.put((worker_id, conn, message))
+        except (OSError, ValueError):
+            pass
+        # None 表示连接已断开
+        self.events.put((worker_id, conn, None))
+
+    def finished(self):
+
+        return self.exhausted and not self.retry and not self.outstanding
+
+    def next_shard(self):
+
+        # 优先分配从断开的工作节点收回的任务
+        items = []
+        while self.retry and len(items) < self.shard_size:
+            items.append(self.retry.popleft())
+        if not items and not self.exhausted:
+            items = [self.target_item(target) for target in islice(self.urls, self.shard_size)]
+            self.exhausted = len(items) < self.shard_size
+        return items
+
+    def assign(self, worker, wait):
+
+        items = self.next_shard()
+        if not items:
+            if wait:
+                self.waiting.append(worker)
+            else:
+                worker.conn.send({"type": "wait"})
+            return
+
+        for url, poc_indexes in items:
+            indexes = set(range(len(self.pocs)) if poc_indexes is None else poc_indexes)
+            worker.outstanding.setdefault(url, []).append(indexes)
+            self.outstanding += len(indexes)
+        worker.conn.send({"type": "shard", "targets": [url if i is None else [url, i] for url, i in items]})
+
+    def serve_waiting(self):
+
+        while self.waiting and (self.retry or self.finished()):
+            worker = self.waiting.pop(0)
+            if self.finished():
+                worker.conn.send({"type": "done"})
+            else:
+                self.assign(worker, True)
+
+    def completed(self, worker, message):
+
+        # 返回已分配任务的结果，重复或未分配的结果忽略
+        entries = worker.outstanding.get(message["url"])
+        for entry in entries or ():
+            if message["poc"] in entry:
+                entry.discard(message["poc"])
+                if not entry:
+                    entries.remove(entry)
+                    if not entries:
+                        del worker.outstanding[message["url"]]
+                self.outstanding -= 1
+                return decode_result(message, self.pocs)
+        return None
+
+    def disconnected(self, worker_id):
+
+        worker = self.workers.pop(worker_id, None)
+        if worker is None:
+            return
+        if worker in self.waiting:
+            self.waiting.remove(worker)
+
+        # 尚未返回结果的任务重新分配
+        count = 0
+        for url, entries in worker.outstanding.items():
+            for indexes in entries:
+                self.retry.append((url, sorted(indexes)))
+                count += len(indexes)
+        self.outstanding -= count
+        info(f"工作节点 {worker.name} 已断开，重新分配 {count} 个任务")
+
+    def check_timeouts(self):
+
+        # 超过时间没有任何消息（包括心跳）的工作节点视为失去响应，断开后由读取线程报告
+        now = time.monotonic()
+        for worker in self.workers.values():
+            if not worker.closing and now - worker.last_seen > self.worker_timeout:
+                worker.closing = True
+                info(f"工作节点 {worker.name} 超过 {self.worker_timeout} 秒没有响应")
+                worker.conn.close()
+
+    def check_processes(self):
+
+        # 本机工作进程意外退出时重新启动（它的任务在连接断开时已经收回）；
+        # 超过重启次数并且没有任何工作节点时结束扫描，不再无限等待
+        for i, process in enumerate(self.processes):
+            if process.poll() is None or self.restarts >= WORKER_RESTARTS * len(self.processes):
+                continue
+            self.restarts += 1
+            info(f"本机工作进程 {process.pid} 已退出（退出码 {process.returncode}），重新启动")
+            self.processes[i] = spawn_worker(self.local_address, self.token)
+
+        if self.processes and not self.workers and all(process.poll() is not None for process in self.processes):
+            raise ConnectionError(f"本机工作进程都已退出，至少还有 {self.outstanding + len(self.retry)} 个任务没有完成")
+
+    def handle(self, worker_id, conn, message):
+
+        if message is None:
+            conn.close()
+            self.disconnected(worker_id)
+            return None
+
+        worker = self.workers.get(worker_id)
+        if message["type"] == "hello":
+            if not hmac.compare_digest(str(message.get("token") or '').encode('utf-8'), self.token.encode('utf-8')):
+                conn.send({"type": "error", "message": "令牌错误"})
+                conn.close()
+                return None
+            worker = self.workers[worker_id] = WorkerState(conn, message.get("name") or str(worker_id))
+            conn.send(self.setup)
+            self.log(f"工作节点 {worker.name} 已连接")
+            return None
+        if worker is None:
+            return None
+
+        worker.last_seen = time.monotonic()
+        if self.metrics is not None and message.get("metrics"):
+            self.metrics.merge_remote(worker_id, message["metrics"])
+        if message["type"] == "get":
+            self.assign(worker, message.get("wait", True))
+        elif message["type"] == "result":
+            return self.completed(worker, message)
+        return None
+
+    def results(self):
+
+        try:
+            while not self.finished():
+                try:
+                    worker_id, conn, message = self.events.get(timeout=1)
+                except queue.Empty:
+                    self.check_timeouts()
+                    self.check_processes()
+                    continue
+                result = self.handle(worker_id, conn, message)
+                self.serve_waiting()
+                if result is not None:
+                    yield result
+                self.check_timeouts()
+                if message is None:
+                    self.check_processes()
+
+            # 所有任务都已完成，通知工作节点退出
+            for worker in self.workers.values():
+                try:
+                    worker.conn.send({"type": "done"})
+                except OSError:
+                    pass
+            if self.metrics is not None:
+                self.drain()
+        finally:
+            self.close()
+
+    def drain(self):
+
+        # 工作节点在每轮扫描的最后一个结果之后才发送扫描指标，等待各节点断开连接时收取最后一次的指标
+        deadline = time.monotonic() + self.heartbeat
+        while self.workers:
+            try:
+                worker_id, _, message = self.events.get(timeout=max(0, deadline - time.monotonic()))
+            except queue.Empty:
+                return
+            if message is None:
+                self.workers.pop(worker_id, None)
+            elif message.get("metrics"):
+                self.metrics.merge_remote(worker_id, message["metrics"])
+
+    def close(self):
+
+        self.server.close()
+        for worker in self.workers.values():
+            worker.conn.close()
+        for process in self.processes:
+            try:
+                process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+
+def spawn_worker(address, token=None):
+
+    # 本机工作节点使用同一个Python解释器，以模块方式运行命令行的工作节点模式
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [root, env.get('PYTHONPATH')]))
+    command = [sys.executable, '-m', 'main.cli', '--worker', f"{address[0]}:{address[1]}", '-q']
+    if token:
+        command += ['--token', token]
+    return subprocess.Popen(command, env=env, stdin=subprocess.DEVNULL)
+
+
+def iter_cluster_results(pocs, urls, config):
+
+    yield from Coordinator(pocs, urls, config).results()
+
+
+def iter_process_results(pocs, urls, config, processes):
+
+    # 多进程模式：在本机启动多个扫描进程，每个进程有自己的线程池（或异步引擎），
+    # 响应解码、匹配和数据包格式化不再共用一个GIL；结果都发回当前进程，由同一个地方写入日志和报告。
+    # 总并发数保持配置的值，平均分给各个进程
+    worker_config = dict(config)
+    for key in ('threads', 'async_concurrency', 'queue_size'):
+        if worker_config.get(key):
+            worker_config[key] = max(1, math.ceil(worker_config[key] / processes))
+    worker_config['cluster'] = dict(config.get('cluster') or {}, listen='127.0.0.1:0', local_workers=processes,
+                                    token=secrets.token_hex(16), quiet=True)
+    yield from iter_cluster_results(pocs, urls, worker_config)
+
+
+def connect_coordinator(address):
+
+    host, port = parse_address(address)
+    deadline = time.monotonic() + CONNECT_RETRY
+    while True:
+        try:
+            sock = socket.create_connection((host, port), timeout=10)
+            sock.settimeout(None)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            return Connection(sock)
+        except OSError:
+            if time.monotonic() >= deadline:
+                raise
+            time.sleep(1)
+
+
+def run_worker(address, token=None, overrides=None, log=info):
+
+    # 工作节点：从协调节点领取任务分片，使用本机的扫描引擎执行，结果逐个发回。返回执行的任务数
+    from .compiler import compile_poc, parse_yaml
+    from .scheduler import iter_scan_results
+    from .session import create_scan_context, close_scan_context
+
+    conn = connect_coordinator(address)
+    replies = queue.Queue()
+
+    def read():
+        try:
+            while True:
+                message = conn.receive()
+                replies.put(message)
+                if message is None:
+                    return
+        except (OSError, ValueError):
+            replies.put(None)
+
+    threading.Thread(target=read, daemon=True).start()
+    conn.send({"type": "hello", "token": token, "name": f"{socket.gethostname()}:{os.getpid()}"})
+
+    def reply():
+        message = replies.get()
+        if message is None:
+            raise ConnectionError("与协调节点的连接已断开")
+        if message["type"] == "error":
+            raise ConnectionError(message["message"])
+        return message
+
+    setup = reply()
+    pocs = [compile_poc(parse_yaml(poc["source"]), poc["path"]) for poc in setup["pocs"]]
+    poc_index = {id(poc): i for i, poc in enumerate(pocs)}
+    config = setup["config"]
+    config.update(overrides or {})
+    log(f"已连接协调节点 {address}，{len(pocs)} 个POC")
+
+    # 心跳同时发送缓冲中的结果和本节点的扫描指标（只统计本次连接执行的任务）
+    stopped = threading.Event()
+    metrics = start_metrics(config)
+
+    def ping():
+        conn.send({"type": "ping", "metrics": metrics.snapshot() if metrics is not None else None})
+
+    def heartbeat():
+        while not stopped.wait(setup["heartbeat"]):
+            try:
+                ping()
+            except OSError:
+                return
+
+    threading.Thread(target=heartbeat, daemon=True).start()
+
+    state = {"done": False}
+
+    def request(wait):
+        # 不等待时没有可分配的任务就结束本轮扫描，避免阻塞已经在执行的任务返回结果
+        conn.send({"type": "get", "wait": wait})
+        message = reply()
+        if message["type"] == "done":
+            state["done"] = True
+        return message.get("targets") if message["type"] == "shard" else None
+
+    def iter_targets(targets):
+        while targets:
+            for target in targets:
+                yield target if isinstance(target, str) else (target[0], [pocs[i] for i in target[1]])
+            targets = request(False)
+
+    context = create_scan_context(config) if config.get('engine', 'thread') != 'async' else None
+    total = 0
+    try:
+        while not state["done"]:
+            targets = request(True)
+            if not targets:
+                break
+            for result in iter_scan_results(pocs, iter_targets(targets), config, context):
+                conn.send(encode_result(result, poc_index[id(result.poc)]), flush=result.vulnerable)
+                total += 1
+            ping()
+    finally:
+        stopped.set()
+        if context is not None:
+            close_scan_context(context)
+        conn.close()
+    return total
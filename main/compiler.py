@@ -0,0 +1,243 @@
+"""
+POC编译模块 - 将YAML格式的POC编译为校验过的不可变对象，并缓存到磁盘
+"""
+import os
+import re
+import time
+import pickle
+import hashlib
+from collections import namedtuple
+
+from .profiler import get_profiler
+
+
+# 缓存格式版本，编译结果的结构变化时需要递增
+CACHE_VERSION = 5
+DEFAULT_CACHE_FILE = os.path.join('cache', 'poc_cache.pickle')
+
+# 支持的HTTP方法和匹配器类型
+SUPPORTED_METHODS = ("GET", "POST")
+MATCHER_TYPES = ("word", "regex", "status", "time")
+MATCH_PARTS = ("body", "header", "all")  # 响应体、响应头、响应头和响应体
+TIME_OPERATORS = ("gt", "lt", "gte", "lte")
+
+CompiledPoc = namedtuple('CompiledPoc', [
+    'path', 'id', 'name', 'severity', 'vuln_class', 'tags', 'info', 'requests'
+])
+CompiledRequest = namedtuple('CompiledRequest', [
+    'method', 'path_parts', 'body', 'headers', 'condition', 'matchers', 'shared',
+    'stop_at_first_match', 'skip_if', 'max_body_size'
+])
+CompiledMatcher = namedtuple('CompiledMatcher', [
+    'type', 'part', 'words', 'regex', 'status', 'operator', 'value', 'condition', 'negative'
+])
+CacheEntry = namedtuple('CacheEntry', ['mtime', 'size', 'digest', 'poc'])
+
+
+def parse_yaml(content):
+
+    # POC都命中缓存时不需要解析YAML，所以只在这里导入；优先使用libyaml提供的C语言解析器
+    import yaml
+    return yaml.load(content, Loader=getattr(yaml, 'CSafeLoader', yaml.SafeLoader))
+
+
+def first_value(value, default):
+
+    # POC中的method、path、body等字段均为列表，只使用第一个值
+    if isinstance(value, list):
+        return value[0] if value else default
+    return default if value is None else value
+
+
+def compile_matcher(matcher):
+
+    matcher_type = matcher.get("type")
+    if matcher_type not in MATCHER_TYPES:
+        raise ValueError(f"不支持的匹配器类型 {matcher_type}")
+
+    # 未指定匹配部分时默认匹配响应体，同时指定多个部分时匹配全部
+    part = matcher.get("part") or "body"
+    if isinstance(part, list):
+        part = part[0] if len(part) == 1 else "all"
+    if part not in MATCH_PARTS:
+        raise ValueError(f"不支持的匹配部分 {part}")
+
+    words = ()
+    regex = ()
+    status = frozenset()
+    operator = None
+    value = None
+
+    if matcher_type == "word":
+        # 空关键词总能匹配成功，不需要参与扫描
+        words = tuple(str(word) for word in matcher.get("words") or [] if str(word))
+    elif matcher_type == "regex":
+        regex = tuple(str(pattern) for pattern in matcher.get("regex") or [])
+        for pattern in regex:
+            try:
+                re.compile(pattern)
+            except re.error as e:
+                raise ValueError(f"无效的正则表达式 {pattern}: {str(e)}")
+    elif matcher_type == "status":
+        status = frozenset(int(code) for code in matcher.get("status") or [])
+    else:
+        # 时间匹配器只使用第一个出现的比较条件
+        for key in TIME_OPERATORS:
+            if key in matcher:
+                operator, value = key, float(matcher[key])
+                break
+
+    return CompiledMatcher(
+        type=matcher_type,
+        part=part,
+        words=words,
+        regex=regex,
+        status=status,
+        operator=operator,
+        value=value,
+        # 同一匹配器中多个关键词/正则之间的关系，默认全部满足
+        condition=str(matcher.get("condition", "and")).lower(),
+        negative=bool(matcher.get("negative", False))
+    )
+
+
+def compile_body_size(value):
+
+    if value is None:
+        return None
+    size = int(value)
+    if size < 0:
+        raise ValueError(f"无效的响应体大小限制 {value}")
+    return size
+
+
+def compile_request(request_config, shared=True, max_body_size=None):
+
+    if "path" not in request_config:
+        raise ValueError("请求缺少 'path' 配置")
+
+    method = str(first_value(request_config.get("method"), "GET")).upper()
+    if method not in SUPPORTED_METHODS:
+        raise ValueError(f"不支持的HTTP方法 {method}")
+
+    path = str(first_value(request_config["path"], ""))
+    body = first_value(request_config.get("body"), "")
+
+    # 预先拆分请求头，冒号之后的内容全部作为值
+    headers = []
+    for header in request_config.get("RequestHeader") or []:
+        name, _, value = str(header).partition(":")
+        headers.append((name.strip(), value.strip()))
+
+    return CompiledRequest(
+        method=method,
+        path_parts=tuple(path.split("{{BaseURL}}")),
+        body=body,
+        headers=tuple(headers),
+        condition=str(request_config.get("condition", "or")).lower(),
+        matchers=tuple(compile_matcher(m) for m in request_config.get("matchers") or []),
+        # share-response: false 表示该请求的响应不与其他POC共享
+        shared=bool(request_config.get("share-response", shared)),
+        # stop-at-first-match: true 表示该请求匹配成功后不再执行后续请求
+        stop_at_first_match=bool(request_config.get("stop-at-first-match", False)),
+        # skip-if 中的任一匹配器命中上一个请求的响应时跳过该请求
+        skip_if=tuple(compile_matcher(m) for m in request_config.get("skip-if") or []),
+        # max-body-size: 最多读取的响应体字节数，0 表示不限制，未指定时使用配置文件中的值
+        max_body_size=compile_body_size(request_config.get("max-body-size", max_body_size))
+    )
+
+
+def compile_poc(poc, path=''):
+
+    if not isinstance(poc, dict) or not poc.get('requests'):
+        raise ValueError("POC 格式错误：缺少 'requests' 配置")
+
+    info = poc.get('info') or {}
+    tags = info.get('tags') or ()
+    if isinstance(tags, str):
+        tags = [tag.strip() for tag in tags.split(',') if tag.strip()]
+
+    return CompiledPoc(
+        path=path,
+        id=str(poc.get('id') or os.path.splitext(os.path.basename(path))[0]),
+        name=info.get('name', os.path.basename(path) or 'Unknown'),
+        severity=str(info.get('severity', 'info')),
+        vuln_class=info.get('type', ''),
+        tags=tuple(tags),
+        info=info,
+        requests=tuple(compile_request(r, poc.get('share-response', True), poc.get('max-body-size'))
+                       for r in poc['requests'])
+    )
+
+
+def read_cache(cache_file):
+
+    try:
+        with open(cache_file, 'rb') as f:
+            version, entries = pickle.load(f)
+        if version == CACHE_VERSION:
+            return entries
+    except Exception:
+        # 缓存不存在或已损坏时重新编译
+        pass
+    return {}
+
+
+def write_cache(cache_file, entries):
+
+    cache_dir = os.path.dirname(cache_file)
+    if cache_dir and not os.path.exists(cache_dir):
+        os.makedirs(cache_dir)
+
+    # 先写临时文件再替换，避免中断时留下损坏的缓存
+    tmp_file = f"{cache_file}.tmp"
+    with open(tmp_file, 'wb') as f:
+        pickle.dump((CACHE_VERSION, entries), f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_file, cache_file)
+
+
+def load_compiled_pocs(poc_files, cache_file=DEFAULT_CACHE_FILE):
+
+    start = time.perf_counter()
+    entries = read_cache(cache_file)
+    changed = False
+    pocs = []
+    errors = []
+
+    for poc_file in poc_files:
+        key = os.path.abspath(poc_file)
+        try:
+            stat = os.stat(poc_file)
+            entry = entries.get(key)
+
+            # 修改时间和大小都没有变化时直接使用缓存
+            if entry and entry.mtime == stat.st_mtime_ns and entry.size == stat.st_size:
+                pocs.append(entry.poc)
+                continue
+
+            with open(poc_file, 'rb') as f:
+                content = f.read()
+            digest = hashlib.sha1(content).hexdigest()
+
+            # 只是修改时间变化而内容没有变化时，更新缓存中的修改时间即可
+            if entry and entry.digest == digest:
+                poc = entry.poc
+            else:
+                poc = compile_poc(parse_yaml(content.decode('utf-8')), poc_file)
+
+            entries[key] = CacheEntry(stat.st_mtime_ns, stat.st_size, digest, poc)
+            changed = True
+            pocs.append(poc)
+        except Exception as e:
+            errors.append((poc_file, str(e)))
+
+    if changed:
+        try:
+            write_cache(cache_file, entries)
+        except OSError as e:
+            print(f"警告: 无法写入POC缓存 {cache_file}: {str(e)}")
+
+    profiler = get_profiler()
+    if profiler is not None:
+        profiler.add("poc_load", time.perf_counter() - start)
+    return pocs, errors
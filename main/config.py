@@ -5,12 +5,12 @@ import yaml
 import sys
 
 
-def load_config():
+def load_config(config_file='config.yaml'):
 
     try:
-        with open('config.yaml', 'r', encoding='utf-8') as f:
+        with open(config_file, 'r', encoding='utf-8') as f:
             config = yaml.safe_load(f)
         return config
     except FileNotFoundError:
-        print("错误: 找不到 config.yaml 配置文件。")
+        print(f"错误: 找不到 {config_file} 配置文件。")
         sys.exit(1)
\ No newline at end of file
@@ -0,0 +1,203 @@
+"""
+DNS模块 - 进程内的域名解析缓存（解析失败的结果也缓存），以及扫描前批量解析目标主机
+"""
+import time
+import socket
+import threading
+from itertools import islice
+from urllib.parse import urlsplit
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from .profiler import record_dns
+
+
+class DnsCache:
+
+    def __init__(self, ttl=300, negative_ttl=60, max_entries=10000):
+
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()  # 主机 -> (过期时间, 地址列表或解析错误)，按最近使用排序
+        self.pending = {}  # 正在解析的主机 -> Future
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, host):
+
+        # 调用方需要持有锁
+        entry = self.entries.get(host)
+        if entry is None:
+            return None
+        if entry[0] < time.monotonic():
+            del self.entries[host]
+            return None
+        self.entries.move_to_end(host)
+        self.hits += 1
+        return entry[1]
+
+    def store(self, host, result):
+
+        # 调用方需要持有锁，超过上限时淘汰最久未使用的主机
+        ttl = self.negative_ttl if isinstance(result, tuple) else self.ttl
+        self.entries[host] = (time.monotonic() + ttl, result)
+        self.entries.move_to_end(host)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def resolve(self, host):
+
+        # 返回 getaddrinfo 格式的地址列表（端口为0），解析失败时抛出 socket.gaierror
+        with self.lock:
+            result = self.lookup(host)
+            if result is None:
+                # 同一主机正在解析时等待其结果，不重复解析
+                future = self.pending.get(host)
+                owner = future is None
+                if owner:
+                    future = self.pending[host] = Future()
+                    self.misses += 1
+                else:
+                    self.hits += 1
+
+        if result is None:
+            if owner:
+                try:
+                    result = socket.getaddrinfo(host, 0, socket.AF_UNSPEC, socket.SOCK_STREAM)
+                except socket.gaierror as e:
+                    # 只缓存错误码和错误信息，每次抛出新的异常对象
+                    result = (e.errno, e.strerror)
+                except BaseException as e:
+                    with self.lock:
+                        del self.pending[host]
+                    future.set_exception(e)
+                    raise
+                with self.lock:
+                    self.store(host, result)
+                    del self.pending[host]
+                future.set_result(result)
+            else:
+                result = future.result()
+
+        if isinstance(result, tuple):
+            raise socket.gaierror(*result)
+        return result
+
+    def resolvable(self, host):
+
+        try:
+            self.resolve(host)
+            return True
+        except socket.gaierror:
+            return False
+        except (UnicodeError, ValueError):
+            # 主机名格式错误，由POC请求报告错误
+            return True
+
+
+def connect(addresses, port, timeout, source_address=None, socket_options=None):
+
+    # 依次连接解析得到的地址，与urllib3的create_connection一致
+    from urllib3.util.connection import allowed_gai_family
+
+    family = allowed_gai_family()
+    error = None
+    for af, socktype, proto, _, address in addresses:
+        if family != socket.AF_UNSPEC and af != family:
+            continue
+        sock = None
+        try:
+            sock = socket.socket(af, socktype, proto)
+            for option in socket_options or ():
+                sock.setsockopt(*option)
+            if timeout is None or isinstance(timeout, (int, float)):
+                sock.settimeout(timeout)
+            if source_address:
+                sock.bind(source_address)
+            sock.connect((address[0], port) + tuple(address[2:]))
+            return sock
+        except OSError as e:
+            error = e
+            if sock is not None:
+                sock.close()
+
+    if error is not None:
+        raise error
+    raise OSError("getaddrinfo returns an empty list")
+
+
+# 进程内共用的DNS缓存
+_cache = None
+_original_create_connection = None
+
+
+def create_connection(address, timeout=None, source_address=None, socket_options=None, **kwargs):
+
+    host, port = address
+    if _cache is None:
+        return _original_create_connection(address, timeout, source_address, socket_options, **kwargs)
+    start = time.perf_counter()
+    addresses = _cache.resolve(host.strip('[]'))
+    record_dns(time.perf_counter() - start)
+    return connect(addresses, port, timeout, source_address, socket_options)
+
+
+def install_dns_cache():
+
+    # urllib3没有提供自定义解析的接口，替换其建立连接的函数，线程引擎的所有新连接都使用缓存
+    global _original_create_connection
+    import urllib3.util.connection as urllib3_connection
+    if _original_create_connection is None:
+        _original_create_connection = urllib3_connection.create_connection
+        urllib3_connection.create_connection = create_connection
+
+
+def get_dns_cache(config):
+
+    global _cache
+    dns_config = config.get('dns') or {}
+    if not dns_config.get('enabled', True):
+        return None
+    if _cache is None:
+        _cache = DnsCache(
+            dns_config.get('ttl', 300),
+            dns_config.get('negative_ttl', 60),
+            dns_config.get('max_entries', 10000)
+        )
+        install_dns_cache()
+    return _cache
+
+
+def target_host(url):
+
+    if isinstance(url, tuple):
+        url = url[0]
+    try:
+        return urlsplit(url).hostname
+    except ValueError:
+        return None
+
+
+def iter_resolved_targets(urls, cache, workers=50, batch_size=1000, on_unresolved=None):
+
+    # 每次读取一批目标，并发解析其中的主机（同一主机只解析一次），无法解析的目标直接丢弃。
+    # 目标边读取边解析，目标文件再大也不需要一次性载入内存
+    executor = ThreadPoolExecutor(max_workers=workers)
+    try:
+        while True:
+            batch = list(islice(urls, batch_size))
+            if not batch:
+                return
+
+            hosts = list({host for host in map(target_host, batch) if host})
+            resolved = dict(zip(hosts, executor.map(cache.resolvable, hosts)))
+            for url in batch:
+                host = target_host(url)
+                if host is None or resolved[host]:
+                    yield url
+                elif on_unresolved:
+                    on_unresolved(url[0] if isinstance(url, tuple) else url)
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
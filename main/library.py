@@ -0,0 +1,198 @@
+"""
+POC库索引模块 - 维护 类型 → 产品 → 漏洞类型 → POC文件 的持久化索引
+"""
+import os
+import pickle
+
+from .compiler import load_compiled_pocs
+
+
+# 索引格式版本，结构变化时需要递增
+INDEX_VERSION = 1
+DEFAULT_INDEX_FILE = os.path.join('cache', 'poc_index.pickle')
+
+# 内存中的索引，同一进程内的多次菜单操作共用
+_index = None
+
+
+def new_index(poc_dir):
+
+    return {
+        "version": INDEX_VERSION,
+        "root": poc_dir,
+        "dirs": {},  # 目录路径 -> (修改时间, 子目录或文件列表)
+        "meta": {},  # POC文件路径 -> 元数据
+    }
+
+
+def read_index(index_file, poc_dir):
+
+    try:
+        with open(index_file, 'rb') as f:
+            index = pickle.load(f)
+        if index.get("version") == INDEX_VERSION and index.get("root") == poc_dir:
+            return index
+    except Exception:
+        # 索引不存在或已损坏时重新建立
+        pass
+    return new_index(poc_dir)
+
+
+def write_index(index_file, index):
+
+    index_dir = os.path.dirname(index_file)
+    if index_dir and not os.path.exists(index_dir):
+        os.makedirs(index_dir)
+
+    tmp_file = f"{index_file}.tmp"
+    with open(tmp_file, 'wb') as f:
+        pickle.dump(index, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_file, index_file)
+
+
+def list_dir(index, path, want_dirs, seen):
+
+    # 目录的修改时间没有变化时，其中的条目也没有变化，直接使用索引中的列表
+    seen.add(path)
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        return [], False
+
+    cached = index["dirs"].get(path)
+    if cached and cached[0] == mtime:
+        return cached[1], False
+
+    entries = []
+    for name in sorted(os.listdir(path)):
+        full_path = os.path.join(path, name)
+        if want_dirs and os.path.isdir(full_path):
+            entries.append(name)
+        elif not want_dirs and name.endswith('.yaml') and os.path.isfile(full_path):
+            entries.append(name)
+
+    index["dirs"][path] = (mtime, entries)
+    return entries, True
+
+
+def build_meta(poc, stat):
+
+    return {
+        "mtime": stat.st_mtime_ns,
+        "size": stat.st_size,
+        "id": poc.id,
+        "name": poc.name,
+        "severity": poc.severity,
+        "steps": len(poc.requests),
+        "tags": poc.tags,
+    }
+
+
+def refresh_index(index):
+
+    changed = False
+    seen = set()
+    tree = {}
+    stale_files = []
+    poc_dir = index["root"]
+
+    types, updated = list_dir(index, poc_dir, True, seen)
+    changed |= updated
+    for type_name in types:
+        type_path = os.path.join(poc_dir, type_name)
+        products, updated = list_dir(index, type_path, True, seen)
+        changed |= updated
+        tree[type_name] = {}
+
+        for product_name in products:
+            product_path = os.path.join(type_path, product_name)
+            vuln_types, updated = list_dir(index, product_path, True, seen)
+            changed |= updated
+            tree[type_name][product_name] = {}
+
+            for vuln_type in vuln_types:
+                vuln_path = os.path.join(product_path, vuln_type)
+                files, updated = list_dir(index, vuln_path, False, seen)
+                changed |= updated
+                poc_files = [os.path.join(vuln_path, name) for name in files]
+                tree[type_name][product_name][vuln_type] = poc_files
+
+                # 文件内容的修改不会改变目录的修改时间，需要单独检查文件
+                for poc_file in poc_files:
+                    meta = index["meta"].get(poc_file)
+                    try:
+                        stat = os.stat(poc_file)
+                    except OSError:
+                        continue
+                    if not meta or meta["mtime"] != stat.st_mtime_ns or meta["size"] != stat.st_size:
+                        stale_files.append(poc_file)
+
+    # 重新读取变化过的POC元数据（通过编译缓存，只解析真正变化的文件）
+    if stale_files:
+        pocs, errors = load_compiled_pocs(stale_files)
+        failed = dict(errors)
+        for poc_file, poc in zip([f for f in stale_files if f not in failed], pocs):
+            index["meta"][poc_file] = build_meta(poc, os.stat(poc_file))
+        # 记录解析失败的文件，文件没有变化时不再重复解析
+        for poc_file, error in failed.items():
+            stat = os.stat(poc_file)
+            index["meta"][poc_file] = {"mtime": stat.st_mtime_ns, "size": stat.st_size, "error": error}
+        changed = True
+
+    # 删除已经不存在的目录和文件
+    all_files = {f for products in tree.values() for vulns in products.values()
+                 for files in vulns.values() for f in files}
+    for path in [p for p in index["dirs"] if p not in seen]:
+        del index["dirs"][path]
+        changed = True
+    for poc_file in [f for f in index["meta"] if f not in all_files]:
+        del index["meta"][poc_file]
+        changed = True
+
+    index["tree"] = tree
+    return changed
+
+
+def get_index(poc_dir='poc', index_file=DEFAULT_INDEX_FILE):
+
+    global _index
+    if _index is None or _index["root"] != poc_dir:
+        _index = read_index(index_file, poc_dir)
+
+    if refresh_index(_index):
+        try:
+            write_index(index_file, _index)
+        except OSError as e:
+            print(f"警告: 无法写入POC索引 {index_file}: {str(e)}")
+    return _index
+
+
+def query_pocs(index, product_types=None, products=None, vuln_types=None,
+               severities=None, tags=None, ids=None):
+
+    severities = {s.lower() for s in severities} if severities else None
+    tags = {t.lower() for t in tags} if tags else None
+    ids = set(ids) if ids else None
+
+    poc_files = []
+    for type_name, product_map in index["tree"].items():
+        if product_types and type_name not in product_types:
+            continue
+        for product_name, vuln_map in product_map.items():
+            if products and product_name not in products and (type_name, product_name) not in products:
+                continue
+            for vuln_type, files in vuln_map.items():
+                if vuln_types and vuln_type not in vuln_types:
+                    continue
+                for poc_file in files:
+                    meta = index["meta"].get(poc_file)
+                    if not meta or "error" in meta:
+                        continue  # 无法解析的POC
+                    if severities and meta["severity"].lower() not in severities:
+                        continue
+                    if tags and not tags & {t.lower() for t in meta["tags"]}:
+                        continue
+                    if ids and meta["id"] not in ids:
+                        continue
+                    poc_files.append(poc_file)
+    return poc_files
@@ -2,62 +2,253 @@
 日志模块 - 处理日志记录
 """
 import os
-import datetime
+import gzip
 import json
+import time
+import queue
+import shutil
+import atexit
+import datetime
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+class LogWriter:
+
+    # 日志由后台线程批量写入，扫描线程只需要把记录放入队列
+    def __init__(self, log_dir='logs', batch_size=100, flush_interval=1.0,
+                 max_bytes=0, backup_count=5, compress=False):
+
+        self.log_dir = log_dir
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_bytes = max_bytes  # 单个日志文件的最大字节数，0 表示不轮转
+        self.backup_count = backup_count
+        self.compress = compress
+
+        self.queue = queue.Queue()
+        self.closed = False
+        self.file = None
+        self.file_name = None
+        self.lock_file = None
+        self.thread = threading.Thread(target=self.run, name='log-writer', daemon=True)
+        self.thread.start()
+
+    def write(self, now, record):
+
+        self.queue.put((now, record))
+
+    def run(self):
+
+        batch = []
+        deadline = None
+        while True:
+            timeout = None if deadline is None else max(0, deadline - time.monotonic())
+            try:
+                item = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+
+            if item is not None and not isinstance(item, threading.Event):
+                batch.append(item)
+                if deadline is None:
+                    deadline = time.monotonic() + self.flush_interval
+                if len(batch) < self.batch_size:
+                    continue
+
+            # 达到批量大小、超过刷新间隔或收到刷新请求时写入
+            if batch:
+                self.write_batch(batch)
+                batch = []
+            deadline = None
+
+            if isinstance(item, threading.Event):
+                if self.file:
+                    self.file.flush()
+                item.set()
+                if self.closed:
+                    break
+
+    def write_batch(self, batch):
+
+        # 按日期分组，每组只调用一次write，多个扫描同时写入同一个文件时行不会交错
+        lines = {}
+        for now, record in batch:
+            lines.setdefault(now.strftime('%Y-%m-%d'), []).append(json.dumps(record, ensure_ascii=False) + "\n")
+
+        for day, day_lines in lines.items():
+            try:
+                data = "".join(day_lines)
+                # 多个扫描进程共用日志目录时，轮转和写入都在文件锁内进行
+                with self.locked():
+                    log_file = self.open_log(os.path.join(self.log_dir, f"{day}.log"), len(data.encode('utf-8')))
+                    log_file.write(data)
+                    log_file.flush()
+            except OSError as e:
+                print(f"警告: 无法写入日志: {str(e)}")
+
+    @contextmanager
+    def locked(self):
+
+        if self.lock_file is None:
+            if not os.path.exists(self.log_dir):
+                os.makedirs(self.log_dir)
+            self.lock_file = open(os.path.join(self.log_dir, '.lock'), 'a+')
+
+        fd = self.lock_file.fileno()
+        if fcntl:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+        else:
+            os.lseek(fd, 0, os.SEEK_SET)
+            msvcrt.locking(fd, msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+            else:
+                os.lseek(fd, 0, os.SEEK_SET)
+                msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+
+    def open_log(self, file_name, size):
+
+        try:
+            stat = os.stat(file_name)
+        except FileNotFoundError:
+            stat = None
+
+        if self.max_bytes and stat and stat.st_size + size > self.max_bytes:
+            self.rotate(file_name)
+            stat = None
+
+        # 日期变化或日志被其他扫描进程轮转后重新打开
+        if self.file is not None and (self.file_name != file_name or stat is None or
+                                      os.fstat(self.file.fileno()).st_ino != stat.st_ino):
+            self.file.close()
+            self.file = None
 
+        if self.file is None:
+            if not os.path.exists(self.log_dir):
+                os.makedirs(self.log_dir)
+            self.file = open(file_name, 'a', encoding='utf-8')
+            self.file_name = file_name
+        return self.file
 
-def check_and_create_logs_dir():
+    def rotate(self, file_name):
 
-    log_dir = 'logs'
-    if not os.path.exists(log_dir):
-        os.makedirs(log_dir)
-    return log_dir
+        # 2025-01-01.log -> 2025-01-01.log.1(.gz)，已有的备份依次后移，超过数量的删除
+        if self.file is not None and self.file_name == file_name:
+            self.file.close()
+            self.file = None
+
+        if self.backup_count <= 0:
+            os.remove(file_name)
+            return
+
+        suffix = '.gz' if self.compress else ''
+        for i in range(self.backup_count, 1, -1):
+            source = f"{file_name}.{i - 1}{suffix}"
+            if os.path.exists(source):
+                os.replace(source, f"{file_name}.{i}{suffix}")
+
+        rotated = f"{file_name}.1"
+        try:
+            os.replace(file_name, rotated)
+        except PermissionError:
+            return  # Windows下文件被其他进程打开时无法改名，继续写入当前文件
+
+        if self.compress:
+            with open(rotated, 'rb') as src, gzip.open(f"{rotated}.gz", 'wb') as dst:
+                shutil.copyfileobj(src, dst)
+            os.remove(rotated)
+
+    def flush(self):
+
+        # 等待队列中已有的记录全部写入
+        if not self.thread.is_alive():
+            return
+        done = threading.Event()
+        self.queue.put(done)
+        while not done.wait(0.1):
+            if not self.thread.is_alive():
+                return
+
+    def close(self):
+
+        if self.closed:
+            return
+        self.closed = True
+        self.flush()
+        for f in (self.file, self.lock_file):
+            if f:
+                f.close()
+
+
+# 进程内共用的日志写入器
+_writer = None
+
+
+def configure_log_writer(config):
+
+    global _writer
+    log_config = config.get('log') or {}
+    close_log_writer()
+    _writer = LogWriter(
+        log_dir=log_config.get('dir', 'logs'),
+        batch_size=log_config.get('batch_size', 100),
+        flush_interval=log_config.get('flush_interval', 1.0),
+        max_bytes=log_config.get('max_bytes', 0),
+        backup_count=log_config.get('backup_count', 5),
+        compress=log_config.get('compress', False)
+    )
+    return _writer
+
+
+def get_log_writer():
+
+    global _writer
+    if _writer is None:
+        _writer = LogWriter()
+    return _writer
+
+
+def close_log_writer():
+
+    # 程序退出（包括Ctrl+C中断）前写入所有尚未写入的日志
+    global _writer
+    if _writer is not None:
+        _writer.close()
+        _writer = None
+
+
+atexit.register(close_log_writer)
 
 
 def write_log(result):
 
-    log_dir = check_and_create_logs_dir()
-    log_filename = os.path.join(log_dir, f"{datetime.datetime.now().strftime('%Y-%m-%d')}.log")
-    
-    # 获取POC信息
-    poc_info = result['poc'].get('info', {})
-    poc_name = poc_info.get('name', 'Unknown')
-    poc_severity = poc_info.get('severity', 'info')
-    
-    # 获取URL
-    url = result['url']
-    
-    # 获取请求和响应信息
-    requests_info = []
-    
-    # 检查是否有多个响应
-    if 'responses' in result and result['responses']:
-        for i, response in enumerate(result['responses']):
-            if response:
-                request_info = {
-                    'method': response.request.method,
-                    'url': response.request.url,
-                    'status_code': response.status_code
-                }
-                requests_info.append(request_info)
-    elif result['response']:
-        request_info = {
-            'method': result['response'].request.method,
-            'url': result['response'].request.url,
-            'status_code': result['response'].status_code
-        }
-        requests_info.append(request_info)
-    
+    now = datetime.datetime.now()
+
+    # 获取每个请求的信息
+    requests_info = [
+        {'method': step.method, 'url': step.url, 'status_code': step.status_code}
+        for step in result.steps
+    ]
+
     # 构建日志消息
     log_data = {
-        'timestamp': datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-        'url': url,
-        'poc_name': poc_name,
-        'severity': poc_severity,
-        'result': result['match_result'],
+        'timestamp': now.strftime('%Y-%m-%d %H:%M:%S'),
+        'url': result.url,
+        'poc_name': result.poc.name,
+        'severity': result.poc.severity,
+        'result': result.match_result,
         'requests': requests_info
     }
-    
-    # 写入日志文件
-    with open(log_filename, 'a', encoding='utf-8') as log_file:
-        log_file.write(f"{json.dumps(log_data, ensure_ascii=False)}\n")
\ No newline at end of file
+
+    # 放入队列，由后台线程批量写入日志文件
+    get_log_writer().write(now, log_data)
@@ -0,0 +1,206 @@
+"""
+匹配模块 - 将所有POC的关键词编译为一个多模式自动机，每个响应只扫描一次
+"""
+import re
+import threading
+
+
+def build_trie_pattern(words):
+
+    # 将关键词构造成前缀树形式的正则表达式，相同前缀只比较一次
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[''] = word
+
+    def to_pattern(node):
+        branches = [re.escape(char) + to_pattern(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ''
+        pattern = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+        # 当前节点本身是一个完整的关键词时，后续部分可选（贪婪匹配保证取最长的关键词）
+        if '' in node:
+            pattern = '(?:' + pattern + ')?'
+        return pattern
+
+    # 每个关键词出现时，它的所有前缀关键词也一定出现在同一位置
+    prefixes = {}
+    for word in words:
+        node = trie
+        found = []
+        for char in word:
+            node = node[char]
+            if '' in node:
+                found.append(node[''])
+        prefixes[word] = tuple(found)
+
+    # 零宽前瞻使每个位置都能被检查，避免关键词之间互相重叠时漏匹配
+    return re.compile('(?=(' + to_pattern(trie) + '))', re.S), prefixes
+
+
+class MatcherEngine:
+
+    def __init__(self):
+
+        self.lock = threading.Lock()
+        self.words = set()
+        self.regexes = {}
+        # (版本号, 自动机, 前缀表, 最长关键词长度)，整体替换保证并发读取时的一致性
+        self.state = (0, None, {}, 0)
+
+    def add_pocs(self, pocs):
+
+        self.add_matchers(matcher for poc in pocs for request in poc.requests
+                          for matcher in request.matchers + request.skip_if)
+
+    def add_matchers(self, matchers):
+
+        words = set()
+        regexes = set()
+        for matcher in matchers:
+            words.update(matcher.words)
+            regexes.update(matcher.regex)
+        self.add_patterns(words, regexes)
+
+    def add_patterns(self, words, regexes):
+
+        with self.lock:
+            for pattern in regexes:
+                if pattern not in self.regexes:
+                    self.regexes[pattern] = re.compile(pattern, re.S)
+
+            new_words = set(words) - self.words
+            if not new_words:
+                return
+
+            # 关键词集合变化后重新编译自动机，已扫描过的响应会按版本号重新扫描
+            self.words |= new_words
+            pattern, prefixes = build_trie_pattern(self.words)
+            self.state = (self.state[0] + 1, pattern, prefixes, max(len(w) for w in self.words))
+
+    def found_words(self, response, part):
+
+        version, pattern, prefixes, _ = self.state
+        cache = response_cache(response)
+        entry = cache.get(part)
+        if entry is not None and entry[0] == version:
+            return entry[1]
+
+        if part == "all":
+            found = self.found_words(response, "header") | self.found_words(response, "body")
+        else:
+            found = frozenset(self.scan(part_text(response, part)))
+        cache[part] = (version, found)
+        return found
+
+    def scan(self, text, pos=0, found=None, state=None):
+
+        # 从pos开始扫描文本，将出现的关键词加入found（用于分块增量扫描）
+        _, pattern, prefixes, _ = state or self.state
+        found = set() if found is None else found
+        if not prefixes:
+            return found
+        for match in pattern.finditer(text, pos):
+            found.update(prefixes[match.group(1)])
+            if len(found) == len(prefixes):
+                break  # 所有关键词都已出现
+        return found
+
+    def regex_match(self, response, part, pattern):
+
+        cache = response_cache(response)
+        key = ('regex', part, pattern)
+        if key not in cache:
+            if pattern not in self.regexes:
+                self.add_patterns((), (pattern,))
+            cache[key] = self.regexes[pattern].search(part_text(response, part)) is not None
+        return cache[key]
+
+    def match(self, matcher, response):
+
+        part = matcher.part or "body"
+        if matcher.type == "word":
+            if not self.words.issuperset(matcher.words):
+                self.add_matchers([matcher])
+            found = self.found_words(response, part)
+            results = (word in found for word in matcher.words)
+        else:
+            results = (self.regex_match(response, part, pattern) for pattern in matcher.regex)
+
+        if matcher.condition == "or":
+            return any(results)
+        return all(results)
+
+
+def response_cache(response):
+
+    # 扫描结果保存在响应对象上，共享同一个响应的POC不会重复扫描
+    cache = getattr(response, '_rws_matches', None)
+    if cache is None:
+        cache = {}
+        setattr(response, '_rws_matches', cache)
+    return cache
+
+
+def response_text(response):
+
+    # requests每次访问 response.text 都会重新解码，这里只解码一次
+    text = getattr(response, '_rws_text', None)
+    if text is None:
+        text = response.text
+        setattr(response, '_rws_text', text)
+    return text
+
+
+def part_text(response, part):
+
+    if part == "body":
+        return response_text(response)
+
+    headers = "\r\n".join(f"{name}: {value}" for name, value in response.headers.items())
+    if part == "header":
+        return headers
+    return headers + "\r\n\r\n" + response_text(response)
+
+
+# 没有扫描上下文时（例如单独调用execute_poc）使用的默认引擎
+default_engine = MatcherEngine()
+
+
+def match_single_condition(matcher, response, engine=None):
+
+    if matcher.type in ("word", "regex"):
+        result = (engine or default_engine).match(matcher, response)
+    elif matcher.type == "status":
+        result = response.status_code in matcher.status
+    elif matcher.type == "time":
+        # 获取响应时间（秒）
+        response_time = getattr(response, 'elapsed_s', 0)
+
+        # 检查是否满足时间条件
+        if matcher.operator == "gt":  # 大于
+            result = response_time > matcher.value
+        elif matcher.operator == "lt":  # 小于
+            result = response_time < matcher.value
+        elif matcher.operator == "gte":  # 大于等于
+            result = response_time >= matcher.value
+        elif matcher.operator == "lte":  # 小于等于
+            result = response_time <= matcher.value
+        else:
+            return False
+    else:
+        return False
+
+    # negative: true 表示取反
+    return result != matcher.negative
+
+
+def match_step(request, response, engine=None):
+
+    # 按条件组合当前请求的所有匹配器，得出结论后不再计算剩余的匹配器
+    results = (match_single_condition(matcher, response, engine) for matcher in request.matchers)
+    if request.condition == "and":
+        return all(results)
+    return any(results)  # or 或其他情况
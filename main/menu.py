@@ -3,19 +3,23 @@
 """
 import sys
 import os
-import yaml
-import datetime
-import pyfiglet
+import itertools
 
 from .config import load_config
-from .poc import get_product_types, get_products, get_vuln_types, execute_scans_in_parallel
-from .url import load_urls_from_file
-from .logger import write_log
-from .report import initialize_html_report, update_html_report, finalize_html_report
+from .compiler import load_compiled_pocs
+from .library import get_index, query_pocs
+from .poc import get_product_types, get_products, get_vuln_types
+from .url import is_target_file, iter_urls_from_file
+from .logger import configure_log_writer
+from .checkpoint import create_checkpoint, list_checkpoints, load_checkpoint
+from .profiler import start_profiler
+from .runner import new_report_file, run_scan, resume_scan, summary_text
 
 
 def print_banner():
 
+    # pyfiglet只有交互模式才需要，命令行模式下不导入
+    import pyfiglet
     ascii_art = pyfiglet.figlet_format("RWS", font="slant")
     print("*" * 60)
     print(ascii_art)
@@ -72,10 +76,63 @@ def handle_product_selection(product_choice, product_map):
         return None
 
 
+def on_finding(result, summary):
+
+    # 发现漏洞时立即输出扫描结果
+    print(f"发现漏洞: {result.url} - {result.poc.name}")
+    print(f"报告已更新: {summary.report_file}")
+
+
+def print_summary(summary):
+
+    # 扫描完成后的总结
+    print(f"\n{summary_text(summary)}")
+    if summary.profile_file:
+        print(f"性能分析结果已保存到 {summary.profile_file}")
+    if summary.findings:
+        print(f"\n扫描完成! 共发现 {summary.findings} 个漏洞，报告已保存到 {summary.report_file}")
+    elif summary.report_file:
+        print(f"\n扫描完成! 未发现新的漏洞，报告已保存到 {summary.report_file}")
+    else:
+        print("\n扫描完成! 未发现漏洞，不生成报告。")
+
+
+def handle_resume(config):
+
+    # 启动时列出中断的扫描，选择后从断点继续
+    checkpoints = list_checkpoints(config)
+    if not checkpoints:
+        return
+
+    print("发现未完成的扫描:")
+    for idx, (path, meta) in enumerate(checkpoints, 1):
+        print(f"{idx}. {meta['created']}  {len(meta['poc_files'])} 个POC  目标: {', '.join(meta['targets'])}")
+
+    while True:
+        choice = input("\n输入编号继续扫描，直接回车开始新的扫描: ").strip()
+        if not choice:
+            return
+        if choice.lower() == 'exit':
+            sys.exit(0)
+        if choice.isdigit() and 1 <= int(choice) <= len(checkpoints):
+            path = checkpoints[int(choice) - 1][0]
+            break
+        print("无效的选择，请重新选择。")
+
+    try:
+        checkpoint = load_checkpoint(path)
+    except (OSError, ValueError) as e:
+        print(f"错误: 无法读取断点文件 {path}: {str(e)}")
+        return
+
+    print(f"\n继续扫描: {path}")
+    print_summary(resume_scan(checkpoint, on_finding, progress=True))
+
+
 def handle_scanning(selected_pocs, config):
 
     while True:
-        url_choice = input("\n请输入要扫描的URL（或者指定一个URL文件，如urls.txt）:")
+        url_choice = input("\n请输入要扫描的URL（或者指定一个URL文件，如urls.txt、urls.txt.gz，- 表示标准输入）:")
         print("输入 'cd ..' 返回上一级")
 
         if url_choice.lower() == 'exit':
@@ -84,83 +141,34 @@ def handle_scanning(selected_pocs, config):
         if url_choice.lower() == 'cd ..':
             return True
 
-        if url_choice.endswith('.txt'):
-            urls = load_urls_from_file(url_choice)
-            if not urls:
+        if is_target_file(url_choice):
+            # 目标文件边读取边扫描，不一次性载入内存
+            urls = iter_urls_from_file(url_choice)
+            first_url = next(urls, None)
+            if first_url is None:
                 print(f"错误: 未找到文件 {url_choice} 或文件为空，请重新输入文件名。")
                 continue
+            urls = itertools.chain([first_url], urls)
         else:
             urls = [url_choice]
 
-        # 执行扫描
-        all_results = []
-        vuln_results = []
-        
-        # 创建报告目录
-        report_dir = 'report'
-        if not os.path.exists(report_dir):
-            os.makedirs(report_dir)
-            
-        # 生成唯一的报告文件名（基于时间戳）
-        report_timestamp = datetime.datetime.now().strftime('%Y-%m-%d_%H-%M-%S')
-        report_file = os.path.join(report_dir, f"{report_timestamp}_scan_report.html")
-        
-        # 初始化HTML报告
-        initialize_html_report(report_file)
-        
-        for poc_file in selected_pocs:
-            try:
-                with open(poc_file, 'r', encoding='utf-8') as file:
-                    poc = yaml.safe_load(file)
-                    
-                    # 检查POC格式是否正确
-                    if 'requests' not in poc:
-                        print(f"警告: POC文件 {poc_file} 格式错误，缺少 'requests' 配置，跳过此POC")
-                        continue
-                    
-                    # 显示正在扫描的POC信息
-                    poc_name = poc['info'].get('name', os.path.basename(poc_file)) if 'info' in poc else os.path.basename(poc_file)
-                    print(f"\n正在扫描: {poc_name}")
-                    
-                    # 显示请求数量信息
-                    #requests_count = len(poc.get('requests', []))
-                    #if requests_count > 1:
-                        #print(f"该POC包含 {requests_count} 个请求步骤")
-                    
-                    # 单个POC的扫描结果
-                    results = execute_scans_in_parallel([poc], urls, config)
-                    all_results.extend(results)
-                    
-                    # 过滤出存在漏洞的结果
-                    current_vuln_results = [result for result in results
-                                          if result.get('match_result') == "漏洞扫描成功！"]
-                    
-                    # 如果当前POC发现了漏洞
-                    if current_vuln_results:
-                        vuln_results.extend(current_vuln_results)
-                        
-                        # 立即输出扫描结果并写入日志
-                        for result in current_vuln_results:
-                            print(f"发现漏洞: {result['url']} - {poc_name}")
-                            write_log(result)
-                        
-                        # 立即更新HTML报告
-                        update_html_report(report_file, current_vuln_results)
-                        print(f"报告已更新: {report_file}")
-            except Exception as e:
-                print(f"处理POC文件 {poc_file} 时出错: {str(e)}")
-                continue
+        report_file = new_report_file()
 
-        # 扫描完成后的总结
-        if vuln_results:
-            print(f"\n扫描完成! 共发现 {len(vuln_results)} 个漏洞，报告已保存到 {report_file}")
-            # 完成HTML报告
-            finalize_html_report(report_file)
-        else:
-            print("\n扫描完成! 未发现漏洞，不生成报告。")
-            # 删除空报告
-            if os.path.exists(report_file):
-                os.remove(report_file)
+        # 启用性能分析时在加载POC之前启动，汇总中包含POC加载的耗时
+        start_profiler(config.get('profile'))
+
+        # 先加载所有POC（使用编译缓存，只有变化过的文件才会重新解析），
+        # 再把全部(POC, URL)任务交给同一个调度器
+        pocs, errors = load_compiled_pocs(selected_pocs)
+        for poc_file, error in errors:
+            print(f"警告: 处理POC文件 {poc_file} 时出错: {error}，跳过此POC")
+
+        print(f"\n正在扫描: {len(pocs)} 个POC")
+
+        # 记录断点，扫描被中断后下次启动时可以继续
+        checkpoint = create_checkpoint(config, [poc.path for poc in pocs], [url_choice], report_file)
+        print_summary(run_scan(pocs, urls, config, report_file, on_finding, checkpoint=checkpoint,
+                               targets=[url_choice], progress=True))
 
         return False
 
@@ -170,18 +178,22 @@ def scan_menu():
     print_banner()
     
     config = load_config()
+    configure_log_writer(config)
+    handle_resume(config)
     while True:
-        # 第一层：选择产品类型
-        product_types = get_product_types()
+        # 第一层：选择产品类型。每次显示菜单时检查一次POC库的变化，之后的选择都使用这份索引
+        index = get_index()
+        product_types = get_product_types(index)
         selected_types = select_product_types(product_types)
         if not selected_types:
             continue
 
         # 第二层：选择产品
         while True:  # 产品选择循环
+            index = get_index()
             all_products = {}
             for product_type in selected_types:
-                all_products[product_type] = get_products(product_type)
+                all_products[product_type] = get_products(product_type, index)
 
             product_map = []
 
@@ -205,14 +217,7 @@ def scan_menu():
 
             # 如果选择了all，直接获取所有POC文件
             if product_choice.lower() == 'all':
-                selected_pocs = []
-                for product_type, product_name in selected_products:
-                    try:
-                        vuln_types = get_vuln_types([(product_type, product_name)])
-                        for vuln_type in vuln_types.get((product_type, product_name), {}):
-                            selected_pocs.extend(vuln_types[(product_type, product_name)][vuln_type])
-                    except FileNotFoundError:
-                        continue
+                selected_pocs = query_pocs(index, products=set(selected_products))
 
                 # 直接进入URL输入和扫描
                 if handle_scanning(selected_pocs, config):
@@ -220,14 +225,17 @@ def scan_menu():
                 break  # 完成扫描，回到最初
             else:
                 # 第三层：选择漏洞类型
-                vuln_types = get_vuln_types(selected_products)
+                vuln_types = get_vuln_types(selected_products, index)
                 if not vuln_types:
                     continue
 
                 while True:  # 漏洞类型选择循环
 
 
-                    all_vuln_types = list(set(sum([list(v.keys()) for v in vuln_types.values()], [])))
+                    # 按出现顺序合并去重，保证每次显示的编号一致
+                    all_vuln_types = list(dict.fromkeys(
+                        vuln_type for v in vuln_types.values() for vuln_type in v
+                    ))
                     for idx, vuln_type in enumerate(all_vuln_types, 1):
                         print(f"{idx}. {vuln_type}")
 
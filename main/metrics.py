@@ -0,0 +1,407 @@
+"""
+指标模块 - 统计请求数、流量、按类别的错误数、按主机和POC的延迟分布以及任务队列长度，
+以Prometheus文本格式通过本地HTTP端口或文件导出，并在终端显示扫描进度
+"""
+import os
+import sys
+import time
+import threading
+
+from .result import NO_MATCHERS, UNREACHABLE, VULN_NOT_FOUND
+from .url import host_of
+
+
+# 延迟分布的分桶上限（秒），最后还有一个 +Inf 桶
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+# 超过数量上限的主机合并为一个标签
+OTHER_HOSTS = 'other'
+
+
+def error_class(error):
+
+    # 请求错误只有错误信息，按前缀和内容分类
+    if error.startswith(UNREACHABLE):
+        lowered = error.lower()
+        return 'timeout' if 'timeout' in lowered or 'timed out' in lowered else 'connect'
+    if error.startswith("请求执行错误"):
+        return 'request'
+    return 'other'
+
+
+def poc_outcome(result):
+
+    if result.vulnerable:
+        return 'found'
+    if result.match_result in (VULN_NOT_FOUND, NO_MATCHERS):
+        return 'not_found'
+    return 'error'
+
+
+def new_histogram():
+
+    # 各分桶的计数（不累加）+ 总和
+    return [0] * (len(BUCKETS) + 1) + [0.0]
+
+
+def observe(histogram, value):
+
+    for i, bound in enumerate(BUCKETS):
+        if value <= bound:
+            break
+    else:
+        i = len(BUCKETS)
+    histogram[i] += 1
+    histogram[-1] += value
+
+
+def new_snapshot():
+
+    # 快照只包含基本类型，可以直接编码为JSON在进程之间传递
+    return {
+        "requests": 0,
+        "bytes": 0,
+        "cache_hits": 0,
+        "errors": {},
+        "status": {},
+        "host_latency": {},
+        "poc_latency": {},
+        "poc_results": {},
+        "queue": {"running": 0, "buffered": 0},
+    }
+
+
+def merge_snapshot(total, snapshot):
+
+    for key in ("requests", "bytes", "cache_hits"):
+        total[key] += snapshot[key]
+    for key in ("errors", "status"):
+        for name, value in snapshot[key].items():
+            total[key][name] = total[key].get(name, 0) + value
+    for key in ("host_latency", "poc_latency"):
+        for name, histogram in snapshot[key].items():
+            merged = total[key].get(name)
+            if merged is None:
+                total[key][name] = list(histogram)
+            else:
+                for i, value in enumerate(histogram):
+                    merged[i] += value
+    for poc_id, outcomes in snapshot["poc_results"].items():
+        merged = total["poc_results"].setdefault(poc_id, {})
+        for outcome, value in outcomes.items():
+            merged[outcome] = merged.get(outcome, 0) + value
+    for state, value in snapshot["queue"].items():
+        total["queue"][state] = total["queue"].get(state, 0) + value
+    return total
+
+
+def escape_label(value):
+
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def render_histogram(lines, name, label, histograms):
+
+    for key, histogram in sorted(histograms.items()):
+        label_text = f'{label}="{escape_label(key)}"'
+        cumulative = 0
+        for bound, value in zip(BUCKETS, histogram):
+            cumulative += value
+            lines.append(f'{name}_bucket{{{label_text},le="{bound}"}} {cumulative}')
+        cumulative += histogram[len(BUCKETS)]
+        lines.append(f'{name}_bucket{{{label_text},le="+Inf"}} {cumulative}')
+        lines.append(f'{name}_sum{{{label_text}}} {histogram[-1]:.6f}')
+        lines.append(f'{name}_count{{{label_text}}} {cumulative}')
+
+
+class ScanMetrics:
+
+    # 扫描引擎的各个线程共用，所有更新都在锁内完成；
+    # 多进程或分布式扫描时，工作节点定期发回自己的快照，导出时与本进程的指标合并
+    def __init__(self, max_hosts=1000):
+
+        self.max_hosts = max_hosts
+        self.lock = threading.Lock()
+        self.data = new_snapshot()
+        self.remote = {}  # 工作节点名称 -> 最近一次的快照
+        self.started = time.monotonic()
+
+    def record_request(self, url, elapsed, response, error):
+
+        with self.lock:
+            data = self.data
+            data["requests"] += 1
+            if error:
+                name = error_class(error)
+                data["errors"][name] = data["errors"].get(name, 0) + 1
+                return
+
+            data["bytes"] += len(response.content or b'')
+            status_class = f"{response.status_code // 100}xx"
+            data["status"][status_class] = data["status"].get(status_class, 0) + 1
+
+            host = host_of(url)
+            histograms = data["host_latency"]
+            histogram = histograms.get(host)
+            if histogram is None:
+                if len(histograms) >= self.max_hosts:
+                    host = OTHER_HOSTS
+                histogram = histograms.get(host)
+                if histogram is None:
+                    histogram = histograms[host] = new_histogram()
+            observe(histogram, elapsed)
+
+    def record_cache_hit(self):
+
+        with self.lock:
+            self.data["cache_hits"] += 1
+
+    def record_poc(self, poc, result, elapsed):
+
+        with self.lock:
+            histogram = self.data["poc_latency"].get(poc.id)
+            if histogram is None:
+                histogram = self.data["poc_latency"][poc.id] = new_histogram()
+            observe(histogram, elapsed)
+            outcomes = self.data["poc_results"].setdefault(poc.id, {})
+            outcome = poc_outcome(result)
+            outcomes[outcome] = outcomes.get(outcome, 0) + 1
+
+    def set_queue(self, running, buffered):
+
+        # 读写单个字典项，不需要加锁
+        self.data["queue"] = {"running": running, "buffered": buffered}
+
+    def snapshot(self):
+
+        with self.lock:
+            return merge_snapshot(new_snapshot(), self.data)
+
+    def merge_remote(self, source, snapshot):
+
+        with self.lock:
+            self.remote[source] = snapshot
+
+    def totals(self):
+
+        total = self.snapshot()
+        with self.lock:
+            remote = list(self.remote.values())
+        for snapshot in remote:
+            merge_snapshot(total, snapshot)
+        return total
+
+    def render(self):
+
+        # Prometheus文本格式
+        data = self.totals()
+        lines = [
+            "# HELP rws_requests_total 发送的HTTP请求数",
+            "# TYPE rws_requests_total counter",
+            f"rws_requests_total {data['requests']}",
+            "# HELP rws_response_bytes_total 读取的响应体字节数",
+            "# TYPE rws_response_bytes_total counter",
+            f"rws_response_bytes_total {data['bytes']}",
+            "# HELP rws_response_cache_hits_total 共享已有响应而没有发送的请求数",
+            "# TYPE rws_response_cache_hits_total counter",
+            f"rws_response_cache_hits_total {data['cache_hits']}",
+            "# HELP rws_request_errors_total 按类别统计的请求错误数",
+            "# TYPE rws_request_errors_total counter",
+        ]
+        lines += [f'rws_request_errors_total{{class="{name}"}} {value}' for name, value in sorted(data["errors"].items())]
+        lines += ["# HELP rws_responses_total 按状态码类别统计的响应数", "# TYPE rws_responses_total counter"]
+        lines += [f'rws_responses_total{{status="{name}"}} {value}' for name, value in sorted(data["status"].items())]
+        lines += ["# HELP rws_request_duration_seconds 按主机统计的请求延迟",
+                  "# TYPE rws_request_duration_seconds histogram"]
+        render_histogram(lines, "rws_request_duration_seconds", "host", data["host_latency"])
+        lines += ["# HELP rws_poc_duration_seconds 按POC统计的执行时间",
+                  "# TYPE rws_poc_duration_seconds histogram"]
+        render_histogram(lines, "rws_poc_duration_seconds", "poc", data["poc_latency"])
+        lines += ["# HELP rws_poc_results_total 按POC和结果统计的任务数", "# TYPE rws_poc_results_total counter"]
+        for poc_id, outcomes in sorted(data["poc_results"].items()):
+            for outcome, value in sorted(outcomes.items()):
+                lines.append(f'rws_poc_results_total{{poc="{escape_label(poc_id)}",outcome="{outcome}"}} {value}')
+        lines += ["# HELP rws_queue_tasks 执行中和排队中的任务数", "# TYPE rws_queue_tasks gauge"]
+        lines += [f'rws_queue_tasks{{state="{state}"}} {value}' for state, value in sorted(data["queue"].items())]
+        return "\n".join(lines) + "\n"
+
+
+class MetricsExporter:
+
+    # 通过本地HTTP端口（/metrics）或定期写入文件导出指标
+    def __init__(self, metrics, listen=None, metrics_file=None, interval=10):
+
+        self.metrics = metrics
+        self.metrics_file = metrics_file
+        self.interval = interval
+        self.server = None
+        self.stopped = threading.Event()
+
+        if listen:
+            from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+            from .cluster import parse_address
+            exporter = self
+
+            class Handler(BaseHTTPRequestHandler):
+
+                def do_GET(self):
+                    if self.path.split('?')[0] != '/metrics':
+                        self.send_error(404)
+                        return
+                    body = exporter.metrics.render().encode('utf-8')
+                    self.send_response(200)
+                    self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                    self.send_header('Content-Length', str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+
+                def log_message(self, *args):
+                    pass
+
+            self.server = ThreadingHTTPServer(parse_address(listen), Handler)
+            self.server.daemon_threads = True
+            threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+        if metrics_file:
+            threading.Thread(target=self.run, daemon=True).start()
+
+    def run(self):
+
+        while not self.stopped.wait(self.interval):
+            self.write_file()
+
+    def write_file(self):
+
+        # 先写临时文件再替换，读取方不会读到写了一半的文件
+        if not self.metrics_file:
+            return
+        metrics_dir = os.path.dirname(self.metrics_file)
+        if metrics_dir and not os.path.exists(metrics_dir):
+            os.makedirs(metrics_dir)
+        tmp_file = f"{self.metrics_file}.tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            f.write(self.metrics.render())
+        os.replace(tmp_file, self.metrics_file)
+
+
+# 进程内共用的指标
+_metrics = None
+_exporter = None
+
+
+def get_metrics(config):
+
+    global _metrics, _exporter
+    metrics_config = config.get('metrics') or {}
+    if not metrics_config.get('enabled', True):
+        return None
+    if _metrics is None:
+        _metrics = ScanMetrics(metrics_config.get('max_hosts', 1000))
+        if _exporter is not None:
+            # 导出端口和文件在进程中只打开一次，之后导出新的指标
+            _exporter.metrics = _metrics
+        elif metrics_config.get('listen') or metrics_config.get('file'):
+            _exporter = MetricsExporter(_metrics, metrics_config.get('listen'), metrics_config.get('file'),
+                                        metrics_config.get('interval', 10))
+    return _metrics
+
+
+def start_metrics(config):
+
+    # 每次扫描开始时使用新的指标，交互式菜单中之前扫描的计数不会计入进度行和导出的指标
+    global _metrics
+    _metrics = None
+    return get_metrics(config)
+
+
+def flush_metrics():
+
+    # 扫描结束时立即写入一次指标文件
+    if _exporter is not None:
+        _exporter.write_file()
+
+
+def format_duration(seconds):
+
+    seconds = int(seconds)
+    return f"{seconds // 3600:02d}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
+
+
+class ProgressLine:
+
+    # 在终端的同一行刷新扫描进度：已完成目标数、请求速率、错误率、队列长度和预计剩余时间
+    def __init__(self, summary, metrics, targets=None, finished=0, stream=None, interval=1.0):
+
+        self.summary = summary
+        self.metrics = metrics
+        self.total_targets = None
+        self.stream = stream or sys.stderr
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.started = time.monotonic()
+        self.last = (self.started, 0)
+        self.rate = None
+        self.visible = False
+        if targets:
+            # 目标文件可能很大，在后台统计目标数量，统计完成前不显示剩余时间；断点续扫时减去已完成的目标
+            threading.Thread(target=self.count, args=(targets, finished), daemon=True).start()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def count(self, targets, finished):
+
+        from .url import count_targets
+        total = count_targets(targets)
+        if total is not None:
+            self.total_targets = max(0, total - finished)
+
+    def text(self):
+
+        summary = self.summary
+        now = time.monotonic()
+
+        # 请求速率取最近几个刷新周期的平滑值
+        last_time, last_requests = self.last
+        if now > last_time:
+            current = (summary.requests_sent - last_requests) / (now - last_time)
+            self.rate = current if self.rate is None else self.rate * 0.7 + current * 0.3
+        self.last = (now, summary.requests_sent)
+
+        done = summary.targets_done + summary.unresolved
+        parts = [f"目标 {done}/{self.total_targets}" if self.total_targets else f"目标 {done}"]
+        parts.append(f"{self.rate or 0:.0f} 请求/秒")
+        if self.metrics is not None:
+            data = self.metrics.totals()
+            if data["requests"]:
+                parts.append(f"错误 {sum(data['errors'].values()) / data['requests']:.1%}")
+            parts.append(f"队列 {data['queue'].get('running', 0) + data['queue'].get('buffered', 0)}")
+        parts.append(f"漏洞 {summary.findings}")
+        elapsed = now - self.started
+        parts.append(f"用时 {format_duration(elapsed)}")
+        if self.total_targets and done:
+            parts.append(f"剩余 {format_duration(elapsed / done * max(0, self.total_targets - done))}")
+        return " | ".join(parts)
+
+    def run(self):
+
+        while not self.stopped.wait(self.interval):
+            line = self.text()
+            with self.lock:
+                self.stream.write(f"\r\x1b[K{line}")
+                self.stream.flush()
+                self.visible = True
+
+    def clear(self):
+
+        # 输出其他内容之前先清除进度行
+        with self.lock:
+            if self.visible:
+                self.stream.write("\r\x1b[K")
+                self.stream.flush()
+                self.visible = False
+
+    def stop(self):
+
+        self.stopped.set()
+        self.thread.join()
+        self.clear()
@@ -1,185 +1,246 @@
 """
 POC模块 - 处理POC文件的加载和执行
 """
-import os
-import yaml
 import requests
-from concurrent.futures import ThreadPoolExecutor, as_completed
 import time
 
+from .cache import build_cache_key
+from .compiler import compile_poc
+from .library import get_index
+from .matcher import default_engine, match_single_condition, match_step
+from .profiler import TimedReader, get_profiler
+from .result import NO_MATCHERS, UNREACHABLE, VULN_FOUND, VULN_NOT_FOUND, build_result
+from .session import create_scan_context, close_scan_context
+from .stream import BodyReader, CHUNK_SIZE, read_plan, share_readers
 
-def get_product_types():
 
-    poc_dir = 'poc'
-    product_types = []
-    if os.path.exists(poc_dir):
-        for type_name in os.listdir(poc_dir):
-            type_path = os.path.join(poc_dir, type_name)
-            if os.path.isdir(type_path):
-                product_types.append(type_name)
-    return product_types
+# 以下函数都可以传入同一个索引快照，避免每次调用都重新检查整个POC库
 
+def get_product_types(index=None):
 
-def get_products(product_type):
+    return list((index or get_index())["tree"])
 
-    poc_dir = 'poc'
-    products = []
-    type_path = os.path.join(poc_dir, product_type)
-    if os.path.exists(type_path):
-        for product_name in os.listdir(type_path):
-            product_path = os.path.join(type_path, product_name)
-            if os.path.isdir(product_path):
-                products.append(product_name)
-    return products
 
+def get_products(product_type, index=None):
 
-def load_poc_file(product_type, product_name):
+    return list((index or get_index())["tree"].get(product_type, {}))
 
-    poc_dir = 'poc'  # POC文件的根目录
-    product_dir = os.path.join(poc_dir, product_type, product_name)
 
-    if not os.path.exists(product_dir):
+def load_poc_file(product_type, product_name, index=None):
+
+    product_map = (index or get_index())["tree"].get(product_type, {})
+    if product_name not in product_map:
         raise FileNotFoundError(f"产品 {product_name} 的POC目录不存在。")
 
-    # 获取产品下所有漏洞类型目录
-    vuln_types = {}
-    for vuln_subdir in os.listdir(product_dir):
-        vuln_subdir_path = os.path.join(product_dir, vuln_subdir)
-        if os.path.isdir(vuln_subdir_path):
-            vuln_types[vuln_subdir] = []
-            # 遍历漏洞类型目录下的文件
-            for vuln_file in os.listdir(vuln_subdir_path):
-                if vuln_file.endswith('.yaml'):
-                    vuln_types[vuln_subdir].append(os.path.join(vuln_subdir_path, vuln_file))
+    # 返回副本，避免调用方修改索引
+    return {vuln_type: list(files) for vuln_type, files in product_map[product_name].items()}
+
+
+def build_request(request, url):
+
+    # 编译阶段已拆分好路径模板和请求头，这里只需要替换 BaseURL
+    path = url.join(request.path_parts)
 
-    return vuln_types
+    # 配置文件中的请求头已经合并到会话中，这里只需要POC中的请求头
+    headers = dict(request.headers)
 
+    return request.method, path, request.body, headers
 
-def execute_single_request(request_config, url, config):
+
+def send_request(request, path, headers, context):
 
     try:
-        method = request_config.get("method", ["GET"])[0]  # 默认使用GET方法
-        path = request_config["path"][0].replace("{{BaseURL}}", url)  # 替换 BaseURL
-
-        # 获取可选参数，如果不存在则使用默认值
-        body = request_config.get("body", [""])[0]  # 如果没有body，使用空字符串
-
-        # 合并配置文件中的请求头和POC中的请求头
-        headers = config.get('headers', {}).copy()  # 首先使用配置文件中的请求头
-        if "RequestHeader" in request_config:
-            # 添加POC中的请求头，如果有重复则覆盖配置文件中的值
-            poc_headers = {
-                header.split(":")[0].strip(): header.split(":")[1].strip()
-                for header in request_config["RequestHeader"]
-            }
-            headers.update(poc_headers)
-
-        # 设置代理
-        proxies = {}
-        if config.get('proxy'):
-            proxies = {
-                "http": config['proxy'].get('http'),
-                "https": config['proxy'].get('https')
-            }
-
-        # 设置超时
-        timeout = config.get('timeout', 10)  # 默认10秒
+        session = context["session"]
+        timeout = context["timeout"]
+        method, body = request.method, request.body
+        # 启用性能分析时记录请求各阶段的耗时
+        profiler = context.get("profiler")
+        timings = profiler.begin_request() if profiler is not None else None
 
         # 记录请求开始时间
         start_time = time.time()
 
-        # 根据HTTP方法发送请求
-        if method.upper() == "POST":
-            response = requests.post(
-                path,
-                data=body,
-                headers=headers,
-                proxies=proxies,
-                verify=False,
-                timeout=timeout
-            )
-        elif method.upper() == "GET":
-            response = requests.get(
-                path,
-                params=body,
-                headers=headers,
-                proxies=proxies,
-                verify=False,
-                timeout=timeout
-            )
+        # 根据HTTP方法发送请求，响应体在下面分块读取
+        if method == "POST":
+            response = session.post(path, data=body, headers=headers, timeout=timeout, stream=True)
         else:
-            return None, f"不支持的HTTP方法 {method}"
-
-        # 计算响应时间（秒）
-        response_time = time.time() - start_time
-        # 将响应时间添加到响应对象中
-        setattr(response, 'elapsed_s', response_time)
+            response = session.get(path, params=body, headers=headers, timeout=timeout, stream=True)
+        headers_elapsed = time.time() - start_time
 
+        try:
+            # 超过大小限制或所有匹配规则都已得出结论时不再读取剩余的响应体
+            groups, cap = read_plan(request, context)
+            reader = BodyReader(response, groups, cap, context.get("matcher") or default_engine, start_time)
+            if timings is not None:
+                reader = TimedReader(reader, timings)
+            for chunk in response.iter_content(CHUNK_SIZE):
+                if reader.feed(chunk):
+                    # 未读完的连接不能放回连接池复用
+                    if reader.truncated:
+                        response.raw.close()
+                    break
+            reader.finish()
+        finally:
+            response.close()
+
+        if timings is not None:
+            profiler.end_request(timings, headers_elapsed, time.time() - start_time)
         return response, None
 
+    except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+        return None, f"{UNREACHABLE}: {str(e)}"
     except requests.exceptions.RequestException as e:
         return None, f"请求执行错误: {str(e)}"
     except Exception as e:
         return None, f"执行错误: {str(e)}"
 
 
-def execute_poc(poc, url, config):
+def execute_single_request(request_config, url, config, context=None):
+
+    method, path, body, headers = build_request(request_config, url)
+
+    # 没有传入扫描上下文时临时创建一个（兼容单独调用的情况）
+    owns_context = context is None
+    if owns_context:
+        context = create_scan_context(config)
 
-    if 'requests' not in poc:
-        return {"url": url, "match_result": f"POC 格式错误：缺少 'requests' 配置", "response": None, "poc": poc}
+    metrics = context.get("metrics")
+    fetched = False
 
+    def fetch():
+        # 只统计实际发送的请求，共享的响应不重复计入
+        nonlocal fetched
+        fetched = True
+        start = time.monotonic()
+        response, error = send_request(request_config, path, headers, context)
+        if metrics is not None:
+            metrics.record_request(path, time.monotonic() - start, response, error)
+        return response, error
+
+    # 返回 (响应, 错误, 是否实际发送了请求)，共享其他POC的响应时为False
     try:
-        # 存储所有请求的响应
-        responses = []
-        errors = []
-
-        # 执行每个请求
-        for request_config in poc["requests"]:
-            response, error = execute_single_request(request_config, url, config)
-            if error:
-                errors.append(error)
+        # 相同的请求在本次扫描中只发送一次，其他POC直接共享响应
+        cache = context.get("cache")
+        if cache is not None and request_config.shared:
+            key = build_cache_key(method, path, request_config.headers, body)
+            response, error = cache.get_or_fetch(key, fetch, share_readers(request_config, context))
+        else:
+            response, error = fetch()
+        return response, error, fetched
+    finally:
+        if owns_context:
+            close_scan_context(context)
+
+
+# 逐个步骤执行POC：每个请求完成后立即匹配，某一步匹配失败时不再发送后续请求
+class PocRun:
+
+    def __init__(self, poc, url, engine=None):
+
+        self.poc = poc
+        self.url = url
+        self.engine = engine
+        self.step = 0
+        self.responses = []
+        self.errors = []
+        self.sent = 0  # 实际发送的请求数，不包括共享其他POC的响应
+        self.matched = []  # 每个带匹配规则的步骤的匹配结果
+        self.outcome = None  # True/False 表示已经得出结论
+
+    def next_request(self):
+
+        while self.outcome is None and self.step < len(self.poc.requests):
+            request = self.poc.requests[self.step]
+
+            # skip-if：根据上一个请求的响应决定是否跳过当前请求
+            if request.skip_if and self.responses and \
+                    any(match_single_condition(m, self.responses[-1], self.engine) for m in request.skip_if):
+                self.step += 1
                 continue
-            responses.append(response)
+            return request
+        return None
+
+    def feed(self, response, error, fetched=True):
+
+        request = self.poc.requests[self.step]
+        self.step += 1
+        if fetched:
+            self.sent += 1
+
+        # 请求失败时后续步骤已经无法全部匹配成功
+        if error:
+            self.errors.append(error)
+            self.outcome = False
+            return
+
+        self.responses.append(response)
+        if not request.matchers:
+            return
+
+        profiler = get_profiler()
+        if profiler is None:
+            step_result = match_step(request, response, self.engine)
+        else:
+            start = time.perf_counter()
+            step_result = match_step(request, response, self.engine)
+            profiler.add("match", time.perf_counter() - start)
+        self.matched.append(step_result)
+        if not step_result:
+            self.outcome = False
+        elif request.stop_at_first_match:
+            self.outcome = True
+
+    def result(self):
+
+        requests_sent = self.sent
+        requests_saved = len(self.poc.requests) - len(self.responses) - len(self.errors)
 
         # 如果所有请求都失败了
-        if not responses:
-            error_msg = "; ".join(errors) if errors else "所有请求均失败"
-            return {"url": url, "match_result": error_msg, "response": None, "poc": poc}
-
-        # 匹配响应内容和状态
-        match_result = match_response(poc, responses)
-        return {
-            "url": url, 
-            "match_result": match_result, 
-            "responses": responses,  # 返回所有响应
-            "response": responses[0] if responses else None,  # 为了兼容性，保留单个response
-            "poc": poc
-        }
+        if not self.responses:
+            error_msg = "; ".join(self.errors) if self.errors else "所有请求均失败"
+            return build_result(self.url, self.poc, error_msg, (), requests_sent, requests_saved)
+
+        if self.outcome is None:
+            if self.matched:
+                self.outcome = all(self.matched)
+            elif not any(request.matchers for request in self.poc.requests):
+                match_result = NO_MATCHERS
+            else:
+                # 带匹配规则的步骤都被 skip-if 跳过了
+                self.outcome = False
+
+        if self.outcome is not None:
+            match_result = VULN_FOUND if self.outcome else VULN_NOT_FOUND
+
+        # 只保留精简的记录，响应对象不再被引用（共享的响应由响应缓存决定何时释放）
+        return build_result(self.url, self.poc, match_result, self.responses, requests_sent, requests_saved)
+
+
+def execute_poc(poc, url, config, context=None):
+
+    # 兼容直接传入YAML字典的情况
+    if isinstance(poc, dict):
+        try:
+            poc = compile_poc(poc)
+        except ValueError as e:
+            return build_result(url, poc, str(e))
+
+    metrics = context.get("metrics") if context else None
+    start = time.monotonic()
+    try:
+        run = PocRun(poc, url, context.get("matcher") if context else None)
+        request = run.next_request()
+        while request is not None:
+            run.feed(*execute_single_request(request, url, config, context))
+            request = run.next_request()
+        result = run.result()
 
     except Exception as e:
-        return {"url": url, "match_result": f"POC执行错误: {str(e)}", "response": None, "poc": poc}
-
-
-def match_single_condition(matcher, response):
-
-    if matcher["type"] == "word" and "part" in matcher and "body" in matcher["part"]:
-        return all(word in response.text for word in matcher["words"])
-    elif matcher["type"] == "status":
-        return response.status_code in matcher["status"]
-    elif matcher["type"] == "time":
-        # 获取响应时间（秒）
-        response_time = getattr(response, 'elapsed_s', 0)
-        
-        # 检查是否满足时间条件
-        if "gt" in matcher:  # 大于
-            return response_time > float(matcher["gt"])
-        elif "lt" in matcher:  # 小于
-            return response_time < float(matcher["lt"])
-        elif "gte" in matcher:  # 大于等于
-            return response_time >= float(matcher["gte"])
-        elif "lte" in matcher:  # 小于等于
-            return response_time <= float(matcher["lte"])
-    return False
+        result = build_result(url, poc, f"POC执行错误: {str(e)}")
+
+    if metrics is not None:
+        metrics.record_poc(poc, result, time.monotonic() - start)
+    return result
 
 
 def match_response(poc, responses):
@@ -187,64 +248,38 @@ def match_response(poc, responses):
     all_match_results = []
 
     # 对每个请求进行匹配
-    for i, request_config in enumerate(poc["requests"]):
+    for i, request in enumerate(poc.requests):
         if i >= len(responses):  # 如果响应数量不足
             break
 
-        matchers = request_config.get("matchers", [])
-        if not matchers:
+        if not request.matchers:
             continue
 
-        # 获取当前请求的匹配结果
-        match_results = [match_single_condition(matcher, responses[i]) for matcher in matchers]
-        
-        # 获取当前请求的条件
-        condition = request_config.get("condition", "or").lower()
-        
-        # 根据条件判断当前请求的结果
-        if condition == "and":
-            request_result = all(match_results)
-        else:  # or 或其他情况
-            request_result = any(match_results)
-            
-        all_match_results.append(request_result)
+        all_match_results.append(match_step(request, responses[i]))
 
     # 如果没有任何匹配结果
     if not all_match_results:
-        return "没有定义匹配规则。"
+        return NO_MATCHERS
 
     # 所有请求都必须匹配成功
     final_result = all(all_match_results)
-    
-    return "漏洞扫描成功！" if final_result else "漏洞扫描失败。"
-
-
-def execute_scans_in_parallel(pocs, urls, config):
-
-    results = []
 
-    # 使用ThreadPoolExecutor来并行执行漏洞扫描
-    with ThreadPoolExecutor(max_workers=config['threads']) as executor:
-        futures = []
+    return VULN_FOUND if final_result else VULN_NOT_FOUND
 
-        for poc in pocs:
-            for url in urls:
-                futures.append(executor.submit(execute_poc, poc, url, config))
 
-        # 等待所有线程完成并收集结果
-        for future in as_completed(futures):
-            result = future.result()
-            results.append(result)
+def execute_scans_in_parallel(pocs, urls, config, context=None):
 
-    return results
+    from .scheduler import iter_scan_results
+    return list(iter_scan_results(pocs, urls, config, context))
 
 
-def get_vuln_types(selected_products):
+def get_vuln_types(selected_products, index=None):
 
+    index = index or get_index()
     vuln_types = {}
     for product_type, product_name in selected_products:
         try:
-            vuln_types[(product_type, product_name)] = load_poc_file(product_type, product_name)
+            vuln_types[(product_type, product_name)] = load_poc_file(product_type, product_name, index)
         except FileNotFoundError:
             continue
     return vuln_types 
\ No newline at end of file
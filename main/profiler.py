@@ -0,0 +1,351 @@
+"""
+性能分析模块 - 记录每个请求各阶段（DNS、连接、TLS、首字节、响应体传输）以及匹配、报告写入、POC加载的耗时，
+可选使用cProfile统计函数耗时、tracemalloc统计内存分配，扫描结束后把汇总写入报告旁边的文件
+"""
+import io
+import sys
+import time
+import random
+import datetime
+import threading
+
+
+# 每个阶段保留的耗时样本数，超过后随机替换，用于估算分位数
+SAMPLE_SIZE = 10000
+# 使用tracemalloc时检查内存占用的间隔（秒），保留内存占用最高时的快照
+MEMORY_SNAPSHOT_INTERVAL = 5
+
+# 阶段名称 -> 说明，汇总中按总耗时排序
+STAGES = {
+    "poc_load": "加载和编译POC",
+    "dns": "域名解析（新建连接时）",
+    "connect": "建立TCP连接（新建连接时）",
+    "tls": "TLS握手（新建连接时）",
+    "ttfb": "发送请求到收到响应头（不含建立连接）",
+    "body": "读取响应体（不含关键词扫描）",
+    "match_stream": "读取响应体时的解码和关键词扫描",
+    "match": "匹配规则判定",
+    "request": "单个请求的总耗时",
+    "report_write": "写入日志、HTML报告和结果数据库",
+}
+
+# 当前线程正在执行的请求的阶段耗时，由建立连接的钩子函数写入
+_local = threading.local()
+
+
+class StageStats:
+
+    __slots__ = ('count', 'total', 'max', 'samples')
+
+    def __init__(self):
+
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.samples = []
+
+    def add(self, seconds):
+
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+        if len(self.samples) < SAMPLE_SIZE:
+            self.samples.append(seconds)
+        else:
+            # 蓄水池抽样，样本数固定，每个耗时被保留的概率相同
+            index = random.randrange(self.count)
+            if index < SAMPLE_SIZE:
+                self.samples[index] = seconds
+
+    def percentile(self, q):
+
+        samples = sorted(self.samples)
+        if not samples:
+            return 0.0
+        return samples[min(len(samples) - 1, int(len(samples) * q))]
+
+
+class TimedReader:
+
+    # 代替 BodyReader 记录解码和关键词扫描的耗时，其余时间为读取响应体的耗时
+    __slots__ = ('reader', 'timings')
+
+    def __init__(self, reader, timings):
+
+        self.reader = reader
+        self.timings = timings
+
+    @property
+    def truncated(self):
+
+        return self.reader.truncated
+
+    def feed(self, chunk):
+
+        start = time.perf_counter()
+        try:
+            return self.reader.feed(chunk)
+        finally:
+            self.timings["match_stream"] += time.perf_counter() - start
+
+    def finish(self):
+
+        start = time.perf_counter()
+        try:
+            return self.reader.finish()
+        finally:
+            self.timings["match_stream"] += time.perf_counter() - start
+
+
+class Profiler:
+
+    def __init__(self, use_cprofile=False, use_tracemalloc=False, top=20):
+
+        self.top = top
+        self.lock = threading.Lock()
+        self.stages = {}
+        self.started = time.monotonic()
+        self.start_time = datetime.datetime.now()
+
+        # Python 3.12 起 cProfile 基于 sys.monitoring，一个分析器即可统计所有线程；
+        # 之前的版本只统计启用它的线程，扫描线程需要各自使用一个分析器（见 profiled）
+        self.profiles = []
+        self.per_thread = use_cprofile and sys.version_info < (3, 12)
+        if use_cprofile:
+            import cProfile
+            self.profiles.append(cProfile.Profile())
+            self.profiles[0].enable()
+
+        self.tracemalloc = use_tracemalloc
+        self.snapshot = None
+        self.snapshot_size = 0
+        self.stopped = threading.Event()
+        if use_tracemalloc:
+            import tracemalloc
+            tracemalloc.start()
+            threading.Thread(target=self.watch_memory, daemon=True).start()
+
+    def add(self, stage, seconds):
+
+        with self.lock:
+            stats = self.stages.get(stage)
+            if stats is None:
+                stats = self.stages[stage] = StageStats()
+            stats.add(seconds)
+
+    def begin_request(self):
+
+        # 线程引擎中建立连接的钩子通过线程局部变量找到当前请求
+        timings = {"dns": 0.0, "connect": 0.0, "tls": 0.0, "match_stream": 0.0}
+        _local.timings = timings
+        return timings
+
+    def end_request(self, timings, headers_elapsed, total):
+
+        # connect 包含域名解析的时间，分别记录时减去
+        _local.timings = None
+        connect = timings["connect"]
+        with self.lock:
+            for stage, seconds in (
+                    ("dns", timings["dns"]),
+                    ("connect", connect - timings["dns"]),
+                    ("tls", timings["tls"]),
+                    ("ttfb", max(0.0, headers_elapsed - connect - timings["tls"])),
+                    ("body", max(0.0, total - headers_elapsed - timings["match_stream"])),
+                    ("match_stream", timings["match_stream"]),
+                    ("request", total)):
+                # 复用已有连接的请求没有建立连接的阶段
+                if seconds or stage not in ("dns", "connect", "tls"):
+                    stats = self.stages.get(stage)
+                    if stats is None:
+                        stats = self.stages[stage] = StageStats()
+                    stats.add(seconds)
+
+    def watch_memory(self):
+
+        while not self.stopped.wait(MEMORY_SNAPSHOT_INTERVAL):
+            self.take_snapshot()
+
+    def take_snapshot(self):
+
+        # 扫描结束时内存大多已经释放，内存占用最高时的快照更能说明问题
+        import tracemalloc
+        current = tracemalloc.get_traced_memory()[0]
+        if current > self.snapshot_size:
+            snapshot = tracemalloc.take_snapshot()
+            self.snapshot, self.snapshot_size = snapshot, current
+
+    def profiled(self, func):
+
+        # 在扫描线程中执行的函数，Python 3.12 之前需要在每个线程中分别启用cProfile
+        if not self.per_thread:
+            return func
+
+        import cProfile
+
+        def run(*args, **kwargs):
+            profile = getattr(_local, 'profile', None)
+            if profile is None:
+                profile = _local.profile = cProfile.Profile()
+                with self.lock:
+                    self.profiles.append(profile)
+            profile.enable()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                profile.disable()
+
+        return run
+
+    def summary(self, profile_file=None):
+
+        elapsed = time.monotonic() - self.started
+        lines = [
+            f"扫描性能分析  开始时间 {self.start_time.strftime('%Y-%m-%d %H:%M:%S')}  用时 {elapsed:.2f} 秒",
+            "",
+            "各阶段耗时（按总耗时排序，并发执行的阶段总耗时为所有线程之和）:",
+            f"{'stage':<16}{'count':>10}{'total_s':>14}{'avg_ms':>14}{'p50_ms':>10}{'p95_ms':>10}{'p99_ms':>10}"
+            f"{'max_ms':>10}",
+        ]
+        with self.lock:
+            stages = sorted(self.stages.items(), key=lambda item: item[1].total, reverse=True)
+            for stage, stats in stages:
+                lines.append(
+                    f"{stage:<16}{stats.count:>10}{stats.total:>14.3f}{stats.total / stats.count * 1000:>14.2f}"
+                    f"{stats.percentile(0.5) * 1000:>10.2f}{stats.percentile(0.95) * 1000:>10.2f}"
+                    f"{stats.percentile(0.99) * 1000:>10.2f}{stats.max * 1000:>10.2f}"
+                )
+        lines.append("")
+        lines.append("阶段说明:")
+        lines.extend(f"  {stage:<14}{description}" for stage, description in STAGES.items())
+
+        # 先统计内存分配，分析结果本身占用的内存不计入
+        if self.tracemalloc:
+            import tracemalloc
+            self.stopped.set()
+            self.take_snapshot()
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            snapshot = self.snapshot.filter_traces([
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, __file__),
+                tracemalloc.Filter(False, "*/cProfile.py"),
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+            ])
+            memory_lines = [
+                "",
+                f"内存分配（tracemalloc）: 峰值 {peak / 1048576:.1f} MB，"
+                f"采样到的最高占用 {self.snapshot_size / 1048576:.1f} MB 时占用内存最多的前 {self.top} 个位置:",
+            ]
+            for stat in snapshot.statistics('lineno')[:self.top]:
+                frame = stat.traceback[0]
+                memory_lines.append(f"  {stat.size / 1024:>10.1f} KB  {stat.count:>8} 个对象  "
+                                    f"{frame.filename}:{frame.lineno}")
+
+        if self.profiles:
+            import pstats
+            for profile in self.profiles:
+                profile.disable()
+            stream = io.StringIO()
+            stats = pstats.Stats(*self.profiles, stream=stream)
+            if profile_file:
+                stats.dump_stats(profile_file)
+            stats.sort_stats('cumulative').print_stats(self.top)
+            lines.append("")
+            lines.append(f"cProfile（按累计耗时排序的前 {self.top} 个函数，完整数据见 {profile_file}）:"
+                         if profile_file else f"cProfile（按累计耗时排序的前 {self.top} 个函数）:")
+            lines.append(stream.getvalue().strip('\n'))
+
+        if self.tracemalloc:
+            lines.extend(memory_lines)
+
+        return "\n".join(lines) + "\n"
+
+
+# 进程内共用的性能分析器，只在启用性能分析时存在
+_profiler = None
+_hooks_installed = False
+
+
+def install_connection_hooks():
+
+    # 替换urllib3建立连接的函数，记录线程引擎中新建连接的TCP连接和TLS握手耗时
+    global _hooks_installed
+    if _hooks_installed:
+        return
+    _hooks_installed = True
+    from urllib3.connection import HTTPConnection, HTTPSConnection
+
+    original_new_conn = HTTPConnection._new_conn
+    original_connect = HTTPSConnection.connect
+
+    def new_conn(self):
+        timings = getattr(_local, 'timings', None)
+        if timings is None:
+            return original_new_conn(self)
+        start = time.perf_counter()
+        try:
+            return original_new_conn(self)
+        finally:
+            timings["connect"] += time.perf_counter() - start
+
+    def connect(self):
+        # HTTPS连接的总耗时减去其中建立TCP连接的时间即为TLS握手的时间
+        timings = getattr(_local, 'timings', None)
+        if timings is None:
+            return original_connect(self)
+        start = time.perf_counter()
+        connected = timings["connect"]
+        try:
+            return original_connect(self)
+        finally:
+            timings["tls"] += time.perf_counter() - start - (timings["connect"] - connected)
+
+    HTTPConnection._new_conn = new_conn
+    HTTPSConnection.connect = connect
+
+
+def record_dns(seconds):
+
+    # DNS缓存在解析时调用，计入当前请求
+    timings = getattr(_local, 'timings', None)
+    if timings is not None:
+        timings["dns"] += seconds
+
+
+def start_profiler(profile_config):
+
+    # 未启用性能分析时返回None；同一进程中同时只有一个性能分析器
+    global _profiler
+    profile_config = profile_config or {}
+    if not profile_config.get('enabled', False):
+        return None
+    if _profiler is None:
+        _profiler = Profiler(profile_config.get('cprofile', False), profile_config.get('tracemalloc', False),
+                             profile_config.get('top', 20))
+        try:
+            install_connection_hooks()
+        except ImportError:
+            pass
+    return _profiler
+
+
+def get_profiler():
+
+    return _profiler
+
+
+def finish_profiler(base_name):
+
+    # 把汇总写入 <base_name>_profile.txt（使用cProfile时另存 <base_name>_profile.prof），返回汇总文件名
+    global _profiler
+    profiler, _profiler = _profiler, None
+    if profiler is None:
+        return None
+    profile_file = f"{base_name}_profile.prof" if profiler.profiles else None
+    summary_file = f"{base_name}_profile.txt"
+    text = profiler.summary(profile_file)
+    with open(summary_file, 'w', encoding='utf-8') as f:
+        f.write(text)
+    return summary_file
@@ -5,6 +5,8 @@ import os
 import datetime
 import json
 
+from .matcher import response_text
+
 
 def format_headers(headers):
 
@@ -55,262 +57,97 @@ def format_response(response):
     formatted_response += format_headers(dict(response.headers))
 
     # 添加响应体
-    if response.text:
-        formatted_response += f"\n\n{response.text[:500]}"
-        if len(response.text) > 500:
+    text = response_text(response)
+    if text:
+        formatted_response += f"\n\n{text[:500]}"
+        if len(text) > 500 or getattr(response, 'truncated', False):
             formatted_response += "..."
 
     return formatted_response
 
 
-def initialize_html_report(report_file):
-
-    with open(report_file, 'w', encoding='utf-8') as f:
-        f.write("""<!DOCTYPE html>
-<html lang="en">
-<head>
-    <meta charset="utf-8">
-    <meta http-equiv="X-UA-Compatible" content="IE=edge">
-    <meta name="viewport" content="width=device-width,initial-scale=1">
-    <title>Vulnerability Scan Report</title>
-    <script>
-        var webVulns = [];
-        var serviceVulns = [];
-        var subdomains = [];
-    </script>
-    <style>
-        body { 
-            font-family: Arial, sans-serif; 
-            margin: 0; 
-            padding: 20px;
-            background-color: #f5f5f5;
-        }
-        .vuln-item { 
-            margin-bottom: 5px;
-            background-color: white;
-            border-radius: 4px;
-            box-shadow: 0 1px 3px rgba(0,0,0,0.1);
-        }
-        .vuln-header { 
-            padding: 12px 15px;
-            cursor: pointer;
-            display: flex;
-            align-items: center;
-            font-size: 14px;
-        }
-        .vuln-header:hover {
-            background-color: #f8f9fa;
-        }
-        .vuln-detail { 
-            display: none;
-            padding: 15px;
-            border-top: 1px solid #eee;
-        }
-        .expand-icon {
-            margin-right: 10px;
-            font-size: 18px;
-            width: 20px;
-            text-align: center;
-        }
-        .request-response { 
-            background-color: #f8f9fa;
-            padding: 15px;
-            border-radius: 4px;
-            font-family: Monaco, Consolas, monospace;
-            font-size: 12px;
-            white-space: pre-wrap;
-            margin: 10px 0;
-        }
-        .detail-item { 
-            font-weight: bold;
-            margin: 10px 0 5px;
-            color: #666;
-        }
-        .vuln-info {
-            display: flex;
-            flex: 1;
-            justify-content: space-between;
-        }
-        .vuln-url {
-            color: #1a73e8;
-        }
-        .severity {
-            padding: 2px 8px;
-            border-radius: 3px;
-            font-size: 12px;
-            font-weight: bold;
-        }
-        .severity.high { background-color: #fce8e8; color: #d93026; }
-        .severity.medium { background-color: #fff4e5; color: #e65100; }
-        .severity.low { background-color: #e8f0fe; color: #1a73e8; }
-        .severity.info { background-color: #e8f5e9; color: #1b5e20; }
-        .report-info {
-            background-color: white;
-            padding: 15px;
-            border-radius: 4px;
-            margin-bottom: 20px;
-            box-shadow: 0 1px 3px rgba(0,0,0,0.1);
-        }
-        .report-title {
-            font-size: 24px;
-            margin-bottom: 10px;
-        }
-        .report-time {
-            color: #666;
-            font-size: 14px;
-        }
-        .report-summary {
-            margin-top: 10px;
-            font-size: 14px;
-        }
-    </style>
-</head>
-<body>
-    <div class="report-info">
-        <div class="report-title">漏洞扫描报告</div>
-        <div class="report-time">开始时间: """ + datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S') + """</div>
-        <div class="report-summary" id="report-summary">扫描进行中...</div>
-    </div>
-    <div id="vulns"></div>
-    <script>
-        function toggleDetail(index) {
-            const detail = document.getElementById(`detail-${index}`);
-            const header = detail.previousElementSibling;
-            const icon = header.querySelector('.expand-icon');
-
-            if (detail.style.display === 'block') {
-                detail.style.display = 'none';
-                icon.textContent = '+';
-            } else {
-                detail.style.display = 'block';
-                icon.textContent = '-';
-            }
-        }
-        
-        function renderVulns() {
-            const vulnContainer = document.getElementById('vulns');
-            vulnContainer.innerHTML = '';
-            
-            webVulns.forEach((vuln, index) => {
-                const vulnDiv = document.createElement('div');
-                vulnDiv.className = 'vuln-item';
-
-                const severityClass = vuln.severity.toLowerCase();
-                vulnDiv.innerHTML = `
-                    <div class="vuln-header" onclick="toggleDetail(${index})">
-                        <span class="expand-icon">+</span>
-                        <div class="vuln-info">
-                            <span class="vuln-url">${vuln.target.url}</span>
-                            <div>
-                                <span class="severity ${severityClass}">${vuln.severity}</span>
-                                <span style="margin-left: 10px">${vuln.plugin}</span>
-                            </div>
-                        </div>
-                    </div>
-                    <div class="vuln-detail" id="detail-${index}">
-                        ${vuln.detail.snapshot.map(([req, resp]) => `
-                            <div class="detail-item">Request:</div>
-                            <div class="request-response">${req}</div>
-                            <div class="detail-item">Response:</div>
-                            <div class="request-response">${resp}</div>
-                        `).join('')}
-                    </div>
-                `;
-
-                vulnContainer.appendChild(vulnDiv);
-            });
-        }
-    </script>
-</body>
-</html>
-        """)
-
-
-def update_html_report(report_file, results):
-
-    # 读取现有报告内容
-    with open(report_file, 'r', encoding='utf-8') as f:
-        content = f.read()
-    
-    # 在</body>标签前插入新的漏洞数据
-    insert_position = content.rfind('</body>')
-    if insert_position == -1:
-        return  # 如果找不到</body>标签，则退出
-    
-    # 构建要插入的漏洞数据脚本
-    vuln_scripts = ""
-    for result in results:
-        # 处理多个响应的情况
-        snapshots = []
-        
-        # 检查是否有多个响应
-        if 'responses' in result and result['responses']:
-            # 处理多个响应
-            for response in result['responses']:
-                if response:
-                    snapshots.append([
-                        format_request(response.request if response else None),
-                        format_response(response)
-                    ])
-        else:
-            # 兼容单个响应的情况
-            snapshots.append([
-                format_request(result['response'].request if result['response'] else None),
-                format_response(result['response'])
-            ])
-        
-        vuln_data = {
-            "create_time": int(datetime.datetime.now().timestamp() * 1000),
-            "detail": {
-                "addr": result['url'],
-                "payload": "",
-                "snapshot": snapshots
-            },
-            "plugin": result['poc']['info'].get('name', 'Unknown') if 'info' in result['poc'] else 'Unknown',
-            "target": {
-                "url": result['url'],
-                "params": []
-            },
-            "vuln_class": result['poc']['info'].get('type', '') if 'info' in result['poc'] else '',
-            "severity": result['poc']['info'].get('severity', 'info') if 'info' in result['poc'] else 'info'
-        }
-        
-        vuln_scripts += f"""
-<script class='web-vulns'>
-    webVulns.push({json.dumps(vuln_data, ensure_ascii=False)});
-    renderVulns();
-</script>
-        """
-    
-    # 插入漏洞数据并保存
-    new_content = content[:insert_position] + vuln_scripts + content[insert_position:]
-    with open(report_file, 'w', encoding='utf-8') as f:
-        f.write(new_content)
+# 每个数据文件保存的漏洞数量，查看详情时按需加载对应的数据文件
+REPORT_CHUNK_SIZE = 200
 
 
-def finalize_html_report(report_file):
+def script_json(data):
 
-    # 读取现有报告内容
-    with open(report_file, 'r', encoding='utf-8') as f:
-        content = f.read()
-    
-    # 更新报告
-    end_time = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-    summary_update = f"""
-<script>
-    document.getElementById('report-summary').innerHTML = '扫描完成! 结束时间: {end_time}<br>共发现 ' + webVulns.length + ' 个漏洞';
-</script>
-    """
-    
-    # 在</body>标签前插入摘要更新脚本
-    insert_position = content.rfind('</body>')
-    if insert_position == -1:
-        return  # 如果找不到</body>标签，则退出
-    
-    # 插入摘要更新并保存
-    new_content = content[:insert_position] + summary_update + content[insert_position:]
-    with open(report_file, 'w', encoding='utf-8') as f:
-        f.write(new_content)
+    # 响应内容中可能包含 </script> 或 <!--，将 < 转义后才能安全地嵌入<script>标签
+    return json.dumps(data, ensure_ascii=False).replace('<', '\\u003c')
+
+
+class HtmlReport:
+
+    def __init__(self, report_file, start_time=None, resume=False):
+
+        # 报告只追加写入：页面中每个漏洞一行摘要，数据包按 REPORT_CHUNK_SIZE 分文件保存在数据目录中。
+        # 程序中途退出时浏览器仍然可以打开已经写入的部分
+        self.report_file = report_file
+        self.data_dir = f"{os.path.splitext(report_file)[0]}_data"
+        self.count = 0
+        self.chunk_file = None
+
+        if resume and os.path.exists(report_file):
+            # 断点续扫：接着已有的漏洞编号继续追加
+            with open(report_file, 'r', encoding='utf-8') as f:
+                self.count = sum(1 for line in f if line.startswith('<script>V('))
+            self.file = open(report_file, 'a', encoding='utf-8')
+            if self.count % REPORT_CHUNK_SIZE:
+                self.open_chunk(self.count // REPORT_CHUNK_SIZE, 'a')
+            return
+
+        # 报告模板较大，只在生成报告时才导入
+        from .template import REPORT_HEAD
+        start_time = start_time or datetime.datetime.now()
+        head = REPORT_HEAD.replace('__START_TIME__', start_time.strftime('%Y-%m-%d %H:%M:%S'))
+        head = head.replace('__DATA_DIR__', script_json(os.path.basename(self.data_dir)))
+        head = head.replace('__CHUNK_SIZE__', str(REPORT_CHUNK_SIZE))
+        self.file = open(report_file, 'w', encoding='utf-8')
+        self.file.write(head)
+        self.file.flush()
+
+    def open_chunk(self, chunk, mode='w'):
+
+        if self.chunk_file:
+            self.chunk_file.close()
+        if not os.path.exists(self.data_dir):
+            os.makedirs(self.data_dir)
+        self.chunk_file = open(os.path.join(self.data_dir, f"{chunk:05d}.js"), mode, encoding='utf-8')
+
+    def add(self, result):
+
+        index = self.count
+        self.count += 1
+        if index % REPORT_CHUNK_SIZE == 0:
+            self.open_chunk(index // REPORT_CHUNK_SIZE)
+
+        # 先写数据包再写摘要，页面中的每一行都能找到对应的数据
+        snapshots = [list(step.snapshot) for step in result.steps if step.snapshot]
+        self.chunk_file.write(f"reportSnapshots({index}, {script_json(snapshots)});\n")
+        self.chunk_file.flush()
+
+        row = [
+            int(datetime.datetime.now().timestamp() * 1000),
+            result.poc.severity,
+            result.poc.name,
+            result.url,
+            result.poc.vuln_class,
+        ]
+        self.file.write(f"<script>V({script_json(row)});</script>\n")
+        self.file.flush()
+
+    def finalize(self):
+
+        # 追加摘要更新脚本和结束标签
+        end_time = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        self.file.write(f"<script>finishReport({script_json(end_time)});</script>\n</body>\n</html>\n")
+        self.close()
+
+    def close(self):
+
+        for f in (self.file, self.chunk_file):
+            if f and not f.closed:
+                f.close()
 
 
 def generate_html_report(results):
@@ -324,10 +161,10 @@ def generate_html_report(results):
         f"{datetime.datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}_scan_report.html"
     )
     
-    # 使用新的函数
-    initialize_html_report(report_file)
-    update_html_report(report_file, results)
-    finalize_html_report(report_file)
+    report = HtmlReport(report_file)
+    for result in results:
+        report.add(result)
+    report.finalize()
     
     print(f"报告已保存到 {report_file}")
-    return report_file
\ No newline at end of file
+    return report_file
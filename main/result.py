@@ -0,0 +1,76 @@
+"""
+结果模块 - 精简的扫描结果记录，不保留完整的响应对象。
+响应对象在POC执行结束后即可释放；被多个POC共享的响应由响应缓存保留，所有POC都读取过或超过缓存大小上限时释放
+"""
+from .report import format_request, format_response
+
+
+VULN_FOUND = "漏洞扫描成功！"
+VULN_NOT_FOUND = "漏洞扫描失败。"
+NO_MATCHERS = "没有定义匹配规则。"
+HOST_SKIPPED = "目标主机无法连接，跳过扫描。"
+# 连接失败或超时的请求错误以此开头，用于判断目标主机是否可用
+UNREACHABLE = "连接失败"
+
+
+class StepRecord:
+
+    # 单个请求的记录：只保留日志和报告需要的信息
+    __slots__ = ('method', 'url', 'status_code', 'elapsed', 'truncated', 'snapshot')
+
+    def __init__(self, method, url, status_code, elapsed, truncated, snapshot=None):
+
+        self.method = method
+        self.url = url
+        self.status_code = status_code
+        self.elapsed = elapsed
+        self.truncated = truncated
+        self.snapshot = snapshot  # (请求数据包, 响应数据包)，只有发现漏洞时才生成
+
+
+class ScanResult:
+
+    __slots__ = ('url', 'poc', 'match_result', 'vulnerable', 'steps', 'requests_sent', 'requests_saved')
+
+    def __init__(self, url, poc, match_result, vulnerable=False, steps=(), requests_sent=0, requests_saved=0):
+
+        self.url = url
+        self.poc = poc
+        self.match_result = match_result
+        self.vulnerable = vulnerable
+        self.steps = steps
+        self.requests_sent = requests_sent
+        self.requests_saved = requests_saved
+
+
+def build_step(response, snapshot=False):
+
+    request = response.request
+    return StepRecord(
+        method=request.method if request else None,
+        url=request.url if request else response.url,
+        status_code=response.status_code,
+        elapsed=getattr(response, 'elapsed_s', 0),
+        truncated=getattr(response, 'truncated', False),
+        # 数据包在这里格式化（响应体只保留前500个字符），之后响应对象就可以释放
+        snapshot=(format_request(request), format_response(response)) if snapshot else None
+    )
+
+
+def build_result(url, poc, match_result, responses=(), requests_sent=0, requests_saved=0):
+
+    vulnerable = match_result == VULN_FOUND
+    steps = tuple(build_step(response, vulnerable) for response in responses if response is not None)
+    return ScanResult(url, poc, match_result, vulnerable, steps, requests_sent, requests_saved)
+
+
+def build_skipped(url, poc):
+
+    # 主机无法连接时跳过的任务，POC中的请求都没有发送
+    return ScanResult(url, poc, HOST_SKIPPED, requests_saved=len(poc.requests))
+
+
+def is_unreachable(result):
+
+    # 没有收到任何响应，并且失败原因是连接失败或超时
+    return not result.steps and result.match_result.startswith(UNREACHABLE)
@@ -0,0 +1,235 @@
+"""
+扫描执行模块 - 执行一次扫描，将结果写入日志、HTML报告和结果数据库，菜单和命令行共用
+"""
+import os
+import sys
+import time
+import sqlite3
+import datetime
+
+from .dns import get_dns_cache, iter_resolved_targets
+from .logger import get_log_writer, write_log
+from .metrics import ProgressLine, flush_metrics, start_metrics
+from .profiler import finish_profiler, get_profiler, start_profiler
+from .result import HOST_SKIPPED
+from .store import create_result_store
+
+
+class ScanSummary:
+
+    __slots__ = ('poc_count', 'targets_done', 'findings', 'skipped', 'unresolved', 'requests_sent',
+                 'requests_saved', 'report_file', 'profile_file', 'results', 'status')
+
+    def __init__(self, poc_count):
+
+        self.poc_count = poc_count
+        self.targets_done = 0
+        self.findings = 0
+        self.skipped = 0  # 因目标主机无法连接而跳过的任务数
+        self.unresolved = 0  # 域名无法解析而跳过的目标数
+        self.requests_sent = 0
+        self.requests_saved = 0
+        self.report_file = None  # 没有发现漏洞时不生成报告
+        self.profile_file = None  # 启用性能分析时的汇总文件
+        self.results = []  # keep_results 为 all 时保留所有结果
+        self.status = 'running'
+
+
+def new_report_file(report_dir='report'):
+
+    if not os.path.exists(report_dir):
+        os.makedirs(report_dir)
+
+    # 生成唯一的报告文件名（基于时间戳）
+    report_timestamp = datetime.datetime.now().strftime('%Y-%m-%d_%H-%M-%S')
+    return os.path.join(report_dir, f"{report_timestamp}_scan_report.html")
+
+
+def profile_base(report_file):
+
+    # 性能分析的汇总写入报告旁边，不生成报告时写入报告目录
+    if report_file:
+        return os.path.splitext(report_file)[0]
+    return os.path.splitext(new_report_file())[0]
+
+
+def summary_text(summary):
+
+    text = (f"共扫描 {summary.targets_done} 个目标，发送 {summary.requests_sent} 个请求，"
+            f"提前终止节省 {summary.requests_saved} 个请求")
+    if summary.skipped:
+        text += f"，目标主机无法连接跳过 {summary.skipped} 个任务"
+    if summary.unresolved:
+        text += f"，域名无法解析跳过 {summary.unresolved} 个目标"
+    return text
+
+
+def run_scan(pocs, urls, config, report_file=None, on_finding=None, warn=print, checkpoint=None, targets=None,
+             progress=False):
+
+    # 执行扫描：默认只保留发现漏洞的结果，其余结果处理完后立即释放
+    keep_all = config.get('keep_results', 'findings') == 'all'
+    summary = ScanSummary(len(pocs))
+    start_time = datetime.datetime.now()
+    report = None
+    resumed = checkpoint is not None and checkpoint.resumed
+    # 命令行和菜单在加载POC之前已经启动了性能分析（记录POC加载耗时），否则按配置在这里启动
+    profiler = get_profiler() or start_profiler(config.get('profile'))
+    # 扫描上下文（会话、异步引擎、协调节点）创建时取用的都是这次扫描的指标
+    metrics = start_metrics(config)
+
+    # 每个目标剩余的任务数，用于在目标扫描结束时统计
+    remaining = {}
+
+    if checkpoint:
+        # 断点续扫时跳过已完成的任务，部分完成的目标只扫描剩余的POC
+        def iter_unfinished(items):
+            for item in items:
+                if isinstance(item, tuple):
+                    remaining[item[0]] = len(item[1])
+                yield item
+        urls = iter_unfinished(checkpoint.iter_targets(urls, pocs))
+
+        if resumed and report_file and os.path.exists(report_file):
+            # 继续追加到上次的报告中，即使这次没有发现新的漏洞也要完成报告
+            from .report import HtmlReport
+            report = HtmlReport(report_file, resume=True)
+            summary.report_file = report_file
+
+    # 结果数据库，便于跨扫描查询
+    try:
+        store = create_result_store(config)
+    except (sqlite3.Error, ValueError) as e:
+        warn(f"警告: 无法打开结果数据库: {str(e)}")
+        store = None
+
+    # 扫描前批量解析目标主机，无法解析的目标不进入扫描队列（使用代理时由代理解析，不预先解析）
+    dns_config = config.get('dns') or {}
+    dns = get_dns_cache(config)
+    if dns and dns_config.get('pre_resolve', False) and not config.get('proxy'):
+        def on_unresolved(url):
+            summary.unresolved += 1
+            if checkpoint:
+                checkpoint.drop(url)
+        urls = iter_resolved_targets(iter(urls), dns, dns_config.get('resolve_workers', 50),
+                                     on_unresolved=on_unresolved)
+
+    # 在终端显示扫描进度，目标列表（targets）用于估算剩余时间，输出漏洞之前先清除进度行
+    progress_line = None
+    if progress and (config.get('metrics') or {}).get('progress', True) and sys.stderr.isatty():
+        finished = checkpoint.done_below + len(checkpoint.done) if checkpoint else 0
+        progress_line = ProgressLine(summary, metrics, targets, finished)
+        if on_finding:
+            print_finding = on_finding
+
+            def on_finding(result, summary):
+                progress_line.clear()
+                print_finding(result, summary)
+
+    # 调度器会导入requests等模块，只在真正扫描时才导入
+    from .scheduler import iter_scan_results
+
+    try:
+        for result in iter_scan_results(pocs, urls, config):
+            if keep_all:
+                summary.results.append(result)
+            summary.requests_sent += result.requests_sent
+            summary.requests_saved += result.requests_saved
+            if result.match_result == HOST_SKIPPED:
+                summary.skipped += 1
+
+            # 发现漏洞时立即写入日志并更新HTML报告
+            if result.vulnerable:
+                summary.findings += 1
+                started = time.perf_counter()
+                write_log(result)
+                if report_file:
+                    if report is None:
+                        # 报告模板只在第一次发现漏洞时才加载
+                        from .report import HtmlReport
+                        report = HtmlReport(report_file, start_time, resume=resumed)
+                        summary.report_file = report_file
+                    report.add(result)
+                if store:
+                    store.add(result)
+                if profiler is not None:
+                    profiler.add("report_write", time.perf_counter() - started)
+                if on_finding:
+                    on_finding(result, summary)
+
+            # 目标是逐个读取的，同一时间只有少量目标在扫描中
+            left = remaining.get(result.url, len(pocs)) - 1
+            if left:
+                remaining[result.url] = left
+            else:
+                remaining.pop(result.url, None)
+                summary.targets_done += 1
+
+            if store:
+                store.flush(force=False)
+
+            # 结果写入日志和报告后才记为已完成：发现漏洞时断点立即写入，先等待日志写入文件
+            if checkpoint:
+                if result.vulnerable:
+                    get_log_writer().flush()
+                checkpoint.record(result)
+    except BaseException:
+        # 扫描中断时已写入的报告仍然可以在浏览器中打开，断点保留到下次继续扫描
+        summary.status = 'interrupted'
+        if progress_line:
+            progress_line.stop()
+        flush_metrics()
+        if profiler is not None:
+            summary.profile_file = finish_profiler(profile_base(report_file))
+        if checkpoint:
+            checkpoint.close()
+        if report:
+            report.close()
+        if store:
+            # 写入失败（如数据库被锁、磁盘已满）时也要关闭连接，并继续抛出原来的异常
+            try:
+                try:
+                    store.finish(len(pocs), summary.targets_done, summary.requests_sent, summary.requests_saved,
+                                 'interrupted')
+                finally:
+                    store.close()
+            except Exception as e:
+                warn(f"警告: 无法保存扫描结果: {str(e)}")
+        raise
+
+    summary.status = 'finished'
+    if progress_line:
+        progress_line.stop()
+    flush_metrics()
+    if report:
+        # 完成HTML报告
+        report.finalize()
+    if profiler is not None:
+        summary.profile_file = finish_profiler(profile_base(report_file))
+    if checkpoint:
+        checkpoint.remove()
+    if store:
+        # 扫描已经完成，结果数据库写入失败时报告和日志中仍有全部结果，只给出警告
+        try:
+            try:
+                store.finish(len(pocs), summary.targets_done, summary.requests_sent, summary.requests_saved)
+            finally:
+                store.close()
+        except Exception as e:
+            warn(f"警告: 无法保存扫描结果: {str(e)}")
+    return summary
+
+
+def resume_scan(checkpoint, on_finding=None, warn=print, progress=False):
+
+    # 使用断点中保存的POC、目标、配置和报告文件继续扫描，日志和报告都是追加写入
+    from .compiler import load_compiled_pocs
+    from .url import iter_targets
+
+    meta = checkpoint.meta
+    start_profiler(meta["config"].get('profile'))
+    pocs, errors = load_compiled_pocs(meta["poc_files"])
+    for poc_file, error in errors:
+        warn(f"警告: 处理POC文件 {poc_file} 时出错: {error}，跳过此POC")
+    return run_scan(pocs, iter_targets(meta["targets"]), meta["config"], meta["report_file"], on_finding, warn,
+                    checkpoint, meta["targets"], progress)
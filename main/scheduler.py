@@ -0,0 +1,384 @@
+"""
+调度模块 - 将所有(POC, URL)任务放入同一个工作池统一调度，按主机自适应调整并发数并跳过无法连接的主机
+"""
+import os
+import time
+import socket
+from collections import deque, OrderedDict
+from itertools import islice
+from urllib.parse import urlsplit
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from .poc import execute_poc
+from .result import build_skipped, is_unreachable
+from .session import create_scan_context, close_scan_context
+from .stream import build_interest
+from .url import host_of
+
+
+# 出现这些状态码说明主机已经过载
+OVERLOAD_STATUS = (429, 503)
+# 过载时并发数减半，正常时每完成约一轮并发加一（从未过载过的主机每完成一个任务加一）
+DECREASE_FACTOR = 0.5
+# 延迟和错误率的平滑系数
+EWMA_WEIGHT = 0.2
+# 最多保留的空闲主机状态数，主机再多内存占用也保持不变
+MAX_IDLE_HOSTS = 10000
+
+# 熔断状态：正常、跳过（主机无法连接）、试探（冷却结束后只放行一个任务）、探测中（等待存活探测结果）
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half-open'
+PROBING = 'probing'
+
+
+def iter_work_items(pocs, urls):
+
+    # 目标可能来自只能读取一次的文件或标准输入，所以以目标为外层循环。
+    # 目标为 (URL, POC列表) 时只扫描其中的POC（断点续扫时部分完成的目标）
+    for url in urls:
+        target_pocs = pocs
+        if isinstance(url, tuple):
+            url, target_pocs = url
+        for poc in target_pocs:
+            yield poc, url
+
+
+def probe_address(url):
+
+    # 存活探测的地址，无法解析的URL不探测，由POC请求报告错误
+    try:
+        parts = urlsplit(url)
+        if not parts.hostname:
+            return None
+        return parts.hostname, parts.port or (443 if parts.scheme == 'https' else 80)
+    except ValueError:
+        return None
+
+
+def probe_host(url, timeout):
+
+    # 只检查端口能否连接，不发送HTTP请求
+    address = probe_address(url)
+    if address is None:
+        return True
+    try:
+        socket.create_connection(address, timeout=timeout).close()
+        return True
+    except OSError:
+        return False
+    except ValueError:
+        # 主机名无法编码（例如 a..b）时视为可以连接，由POC请求报告错误
+        return True
+
+
+def get_queue_size(config, workers):
+
+    # 同时提交的任务数上限，目标再多内存占用也保持不变
+    return config.get('queue_size') or workers * 4
+
+
+def process_count(config):
+
+    # 多进程模式的进程数，未指定时为CPU核数；1 表示在当前进程中扫描
+    process_config = config.get('processes') or {}
+    if not process_config.get('enabled', False):
+        return 1
+    return process_config.get('count') or os.cpu_count() or 1
+
+
+class HostState:
+
+    __slots__ = ('limit', 'active', 'waiting', 'scheduled', 'latency', 'error_rate', 'last_decrease',
+                 'circuit', 'failures', 'opened_at')
+
+    def __init__(self, limit):
+
+        self.limit = limit  # 当前并发上限（浮点数，取整后使用）
+        self.active = 0
+        self.waiting = deque()
+        self.scheduled = False  # 是否已在可执行主机队列中
+        self.latency = None  # 平均响应时间（秒）
+        self.error_rate = 0.0
+        self.last_decrease = 0.0
+        self.circuit = CLOSED
+        self.failures = 0  # 连续连接失败或超时的任务数
+        self.opened_at = 0.0
+
+    def capacity(self):
+
+        # 熔断试探和存活探测期间只执行一个任务
+        return int(self.limit) if self.circuit == CLOSED else 1
+
+
+class HostScheduler:
+
+    # 任务按主机排队，只有主机的并发数未达到上限时才开始执行：
+    # 慢主机或过载主机的任务在队列中等待，不会占用其他主机的并发；
+    # 连续多次连接失败的主机熔断，其余任务直接跳过
+    def __init__(self, global_limit, adaptive=True, initial=4, min_limit=1, max_limit=None, slow_latency=5.0,
+                 breaker_failures=5, breaker_cooldown=60, probe=False):
+
+        self.global_limit = global_limit
+        self.adaptive = adaptive
+        self.max_limit = min(max_limit or global_limit, global_limit)
+        self.min_limit = max(1, min(min_limit, self.max_limit))
+        # 不自适应时每个主机最多可以使用全部并发
+        self.initial = max(self.min_limit, min(initial, self.max_limit)) if adaptive else self.max_limit
+        self.slow_latency = slow_latency
+        self.breaker_failures = breaker_failures  # 0 表示不熔断
+        self.breaker_cooldown = breaker_cooldown  # 0 表示熔断后本次扫描不再尝试
+        self.probe = probe
+        self.hosts = OrderedDict()
+        self.ready_hosts = deque()
+        self.skipped = deque()  # 因主机无法连接而跳过的任务
+        self.running = 0
+        self.buffered = 0
+        self.probes = 0  # 尚未完成的存活探测数，探测不是从目标列表读取的任务
+
+    def __len__(self):
+
+        # 已读取但尚未完成的任务数，不包括存活探测
+        return self.running + self.buffered - self.probes
+
+    def add(self, item, url):
+
+        host = host_of(url)
+        state = self.hosts.get(host)
+        if state is None:
+            state = self.hosts[host] = HostState(self.initial)
+            if self.probe:
+                # 主机的第一个任务之前先执行存活探测，POC为None表示探测任务
+                state.circuit = PROBING
+                state.waiting.append((None, url))
+                self.buffered += 1
+                self.probes += 1
+
+        if state.circuit == OPEN:
+            if not self.breaker_cooldown or time.monotonic() - state.opened_at < self.breaker_cooldown:
+                self.skipped.append(item)
+                return
+            # 冷却结束，放行一个任务试探主机是否恢复
+            state.circuit = HALF_OPEN
+        state.waiting.append(item)
+        self.buffered += 1
+        self.schedule(host, state)
+
+    def schedule(self, host, state):
+
+        if not state.scheduled and state.waiting and state.active < state.capacity():
+            state.scheduled = True
+            self.ready_hosts.append(host)
+
+    def ready(self):
+
+        # 轮流从可执行的主机中取任务，直到达到总并发上限
+        items = []
+        while self.ready_hosts and self.running < self.global_limit:
+            host = self.ready_hosts.popleft()
+            state = self.hosts[host]
+            state.scheduled = False
+            if not state.waiting or state.active >= state.capacity():
+                continue
+            items.append((state.waiting.popleft(), host))
+            state.active += 1
+            self.running += 1
+            self.buffered -= 1
+            self.schedule(host, state)
+        return items
+
+    def done(self, host, result):
+
+        state = self.hosts[host]
+        state.active -= 1
+        self.running -= 1
+        if self.adaptive and result.requests_sent:
+            self.adjust(state, result)
+
+        if result.steps:
+            # 收到了响应，说明主机可以连接
+            state.failures = 0
+            if state.circuit == HALF_OPEN:
+                state.circuit = CLOSED
+        elif state.circuit == HALF_OPEN:
+            # 试探任务没有收到任何响应（包括POC执行出错）时重新熔断，主机不会一直只有一个并发
+            state.failures += 1
+            self.trip(state)
+        elif is_unreachable(result):
+            state.failures += 1
+            if self.breaker_failures and state.failures >= self.breaker_failures:
+                self.trip(state)
+        self.release(host, state)
+
+    def probed(self, host, alive):
+
+        state = self.hosts[host]
+        state.active -= 1
+        self.running -= 1
+        self.probes -= 1
+        if alive:
+            state.circuit = CLOSED
+        else:
+            self.trip(state)
+        self.release(host, state)
+
+    def trip(self, state):
+
+        # 熔断：已排队的任务全部跳过，冷却时间内新加入的任务也直接跳过
+        state.circuit = OPEN
+        state.opened_at = time.monotonic()
+        for poc, url in state.waiting:
+            if poc is not None:
+                self.skipped.append((poc, url))
+        self.buffered -= len(state.waiting)
+        state.waiting.clear()
+
+    def release(self, host, state):
+
+        self.schedule(host, state)
+        if not state.active and not state.waiting:
+            # 空闲的主机移到末尾，超过数量时删除最早空闲的主机
+            self.hosts.move_to_end(host)
+            while len(self.hosts) > MAX_IDLE_HOSTS:
+                oldest, oldest_state = next(iter(self.hosts.items()))
+                if oldest_state.active or oldest_state.waiting:
+                    break
+                del self.hosts[oldest]
+
+    def adjust(self, state, result):
+
+        # AIMD：请求失败、出现过载状态码或响应过慢时并发数减半，否则缓慢增加
+        # 执行过的请求（包括共享其他POC的响应）多于收到的响应时说明有请求失败
+        steps = result.steps
+        attempted = len(result.poc.requests) - result.requests_saved
+        failed = attempted > len(steps) or any(step.status_code in OVERLOAD_STATUS for step in steps)
+        elapsed = max((step.elapsed or 0 for step in steps), default=0)
+
+        state.error_rate += ((1.0 if failed else 0.0) - state.error_rate) * EWMA_WEIGHT
+        if elapsed:
+            state.latency = elapsed if state.latency is None else state.latency + (elapsed - state.latency) * EWMA_WEIGHT
+
+        if failed or elapsed >= self.slow_latency:
+            # 同一轮并发请求同时失败时只减半一次
+            now = time.monotonic()
+            if now - state.last_decrease >= (state.latency or 0):
+                state.limit = max(self.min_limit, state.limit * DECREASE_FACTOR)
+                state.last_decrease = now
+        elif not state.last_decrease:
+            # 慢启动：从未过载过的主机每完成一个任务并发加一
+            state.limit = min(self.max_limit, state.limit + 1)
+        else:
+            state.limit = min(self.max_limit, state.limit + 1 / state.limit)
+
+
+def create_host_scheduler(config, global_limit):
+
+    adaptive_config = config.get('adaptive') or {}
+    breaker_config = config.get('circuit_breaker') or {}
+    enabled = breaker_config.get('enabled', True)
+    return HostScheduler(
+        global_limit,
+        adaptive=adaptive_config.get('enabled', True),
+        initial=adaptive_config.get('initial', 4),
+        min_limit=adaptive_config.get('min', 1),
+        max_limit=adaptive_config.get('max'),
+        slow_latency=adaptive_config.get('slow_latency') or config.get('timeout', 10) * 0.5,
+        breaker_failures=breaker_config.get('failures', 5) if enabled else 0,
+        breaker_cooldown=breaker_config.get('cooldown', 60),
+        # 使用代理时目标可能只能通过代理访问，不直接探测
+        probe=enabled and breaker_config.get('probe', False) and not config.get('proxy')
+    )
+
+
+def probe_timeout(config):
+
+    return (config.get('circuit_breaker') or {}).get('probe_timeout', 3)
+
+
+def iter_scan_results(pocs, urls, config, context=None):
+
+    # 配置了监听地址时作为协调节点，任务分发给工作节点执行；多进程模式同样由本机的工作进程执行
+    if (config.get('cluster') or {}).get('listen'):
+        from .cluster import iter_cluster_results
+        yield from iter_cluster_results(pocs, urls, config)
+        return
+    processes = process_count(config)
+    if processes > 1:
+        from .cluster import iter_process_results
+        yield from iter_process_results(pocs, urls, config, processes)
+        return
+
+    # 配置为异步引擎时使用asyncio执行
+    if config.get('engine', 'thread') == 'async':
+        from .aio import iter_scans_async
+        yield from iter_scans_async(pocs, urls, config)
+        return
+
+    # 整个扫描共用一个会话，复用各主机的连接
+    owns_context = context is None
+    if owns_context:
+        context = create_scan_context(config)
+
+    # 所有POC的关键词编译为一个自动机，每个响应只需扫描一次
+    context["matcher"].add_pocs(pocs)
+    # 匹配规则都得出结论后不再读取剩余的响应体
+    context["interest"] = build_interest(pocs)
+
+    # 所有POC的任务共用一个线程池，慢目标不会阻塞其他POC的扫描
+    threads = config['threads']
+    executor = ThreadPoolExecutor(max_workers=threads)
+    hosts = create_host_scheduler(config, threads)
+    work_items = iter_work_items(pocs, urls)
+    queue_size = get_queue_size(config, threads)
+    exhausted = False
+    pending = {}
+    metrics = context.get("metrics")
+    # Python 3.12 之前cProfile需要在每个扫描线程中单独启用
+    profiler = context.get("profiler")
+    run_poc = profiler.profiled(execute_poc) if profiler is not None else execute_poc
+    try:
+        # 只读取有限数量的任务，每完成一个再从目标列表中取下一个，扫描可以立即开始
+        while True:
+            if not exhausted and len(hosts) < queue_size:
+                count = queue_size - len(hosts)
+                for poc, url in islice(work_items, count):
+                    hosts.add((poc, url), url)
+                    count -= 1
+                exhausted = count > 0
+
+            # 提交主机并发数未达到上限的任务
+            for (poc, url), host in hosts.ready():
+                if poc is None:
+                    future = executor.submit(probe_host, url, probe_timeout(config))
+                else:
+                    future = executor.submit(run_poc, poc, url, config, context)
+                pending[future] = (poc, host)
+
+            # 主机熔断后跳过的任务直接返回结果
+            while hosts.skipped:
+                poc, url = hosts.skipped.popleft()
+                yield build_skipped(url, poc)
+            if metrics is not None:
+                metrics.set_queue(hosts.running, hosts.buffered)
+            if not pending:
+                if exhausted and not len(hosts):
+                    break
+                continue
+
+            # 任务完成一个就返回一个结果，并根据结果调整该主机的并发数
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                poc, host = pending.pop(future)
+                if poc is None:
+                    hosts.probed(host, future.result())
+                    continue
+                result = future.result()
+                hosts.done(host, result)
+                yield result
+    finally:
+        # 扫描被中断时取消尚未开始的任务
+        executor.shutdown(wait=False, cancel_futures=True)
+        if metrics is not None:
+            metrics.set_queue(0, 0)
+        if owns_context:
+            close_scan_context(context)
@@ -0,0 +1,78 @@
+"""
+会话模块 - 管理HTTP连接池和扫描上下文
+"""
+import urllib3
+import requests
+from http.cookiejar import DefaultCookiePolicy
+from requests.adapters import HTTPAdapter
+
+from .cache import create_response_cache
+from .dns import get_dns_cache
+from .matcher import MatcherEngine
+from .metrics import get_metrics
+from .profiler import get_profiler
+from .stream import DEFAULT_MAX_BODY_SIZE
+
+
+# 扫描时不校验证书，禁用SSL警告
+urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+
+def build_proxies(config):
+
+    proxies = {}
+    if config.get('proxy'):
+        proxies = {
+            "http": config['proxy'].get('http'),
+            "https": config['proxy'].get('https')
+        }
+    return proxies
+
+
+def create_session(config):
+
+    pool_config = config.get('pool') or {}
+    threads = config.get('threads', 10)
+
+    # 每个主机的连接池大小默认与线程数一致，保证所有线程都能复用连接
+    adapter = HTTPAdapter(
+        pool_connections=pool_config.get('connections', 100),
+        pool_maxsize=pool_config.get('maxsize', threads),
+        pool_block=pool_config.get('block', False)
+    )
+
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.verify = False
+
+    # 不在不同POC之间共享Cookie，保持与单独请求一致的行为
+    session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+
+    # 配置文件中的请求头和代理只在创建会话时处理一次
+    session.headers.update(config.get('headers') or {})
+    session.proxies.update(build_proxies(config))
+
+    return session
+
+
+def create_scan_context(config):
+
+    metrics = get_metrics(config)
+    return {
+        "session": create_session(config),
+        "dns": get_dns_cache(config),  # 新建立的连接使用DNS缓存
+        "timeout": config.get('timeout', 10),  # 默认10秒
+        "metrics": metrics,  # 未启用扫描指标时为None
+        "profiler": get_profiler(),  # 未启用性能分析时为None
+        "cache": create_response_cache(config, metrics),
+        "matcher": MatcherEngine(),
+        "max_body_size": config.get('max_body_size', DEFAULT_MAX_BODY_SIZE),
+        "interest": None,  # 每个请求的响应会被哪些匹配规则使用，由调度模块填写
+    }
+
+
+def close_scan_context(context):
+
+    if context and context.get("session"):
+        context["session"].close()
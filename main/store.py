@@ -0,0 +1,310 @@
+"""
+结果存储模块 - 将扫描结果写入SQLite数据库，支持跨扫描查询和JSONL导出
+"""
+import os
+import sys
+import bz2
+import gzip
+import json
+import lzma
+import time
+import sqlite3
+import datetime
+
+from .url import host_of
+
+
+# 数据库结构版本，结构变化时需要递增
+SCHEMA_VERSION = 1
+DEFAULT_STORE_FILE = os.path.join('results', 'results.db')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS scans (
+    id INTEGER PRIMARY KEY,
+    started_at TEXT NOT NULL,
+    finished_at TEXT,
+    poc_count INTEGER NOT NULL DEFAULT 0,
+    target_count INTEGER NOT NULL DEFAULT 0,
+    finding_count INTEGER NOT NULL DEFAULT 0,
+    requests_sent INTEGER NOT NULL DEFAULT 0,
+    requests_saved INTEGER NOT NULL DEFAULT 0,
+    status TEXT NOT NULL DEFAULT 'running'
+);
+CREATE TABLE IF NOT EXISTS targets (
+    id INTEGER PRIMARY KEY,
+    url TEXT NOT NULL UNIQUE,
+    host TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS pocs (
+    id INTEGER PRIMARY KEY,
+    poc_id TEXT NOT NULL,
+    path TEXT NOT NULL,
+    name TEXT NOT NULL,
+    severity TEXT NOT NULL,
+    vuln_class TEXT,
+    UNIQUE (poc_id, path)
+);
+CREATE TABLE IF NOT EXISTS findings (
+    id INTEGER PRIMARY KEY,
+    scan_id INTEGER NOT NULL REFERENCES scans (id),
+    target_id INTEGER NOT NULL REFERENCES targets (id),
+    poc_ref INTEGER NOT NULL REFERENCES pocs (id),
+    severity TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    steps TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_targets_host ON targets (host);
+CREATE INDEX IF NOT EXISTS idx_pocs_poc_id ON pocs (poc_id);
+CREATE INDEX IF NOT EXISTS idx_findings_scan ON findings (scan_id);
+CREATE INDEX IF NOT EXISTS idx_findings_target ON findings (target_id);
+CREATE INDEX IF NOT EXISTS idx_findings_poc ON findings (poc_ref);
+CREATE INDEX IF NOT EXISTS idx_findings_severity ON findings (severity);
+"""
+
+# 压缩格式的导出文件
+COMPRESSED_WRITERS = {
+    '.gz': gzip.open,
+    '.bz2': bz2.open,
+    '.xz': lzma.open,
+}
+
+
+def now_text():
+
+    return datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+
+def connect(store_file):
+
+    store_dir = os.path.dirname(store_file)
+    if store_dir and not os.path.exists(store_dir):
+        os.makedirs(store_dir)
+
+    # WAL模式下多个扫描可以同时写入，查询也不会被写入阻塞
+    conn = sqlite3.connect(store_file, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    if version not in (0, SCHEMA_VERSION):
+        conn.close()
+        raise ValueError(f"结果数据库 {store_file} 的版本 {version} 不受支持")
+    conn.executescript(SCHEMA)
+    conn.execute(f"PRAGMA user_version={SCHEMA_VERSION}")
+    return conn
+
+
+class ResultStore:
+
+    def __init__(self, store_file=DEFAULT_STORE_FILE, batch_size=500, flush_interval=2.0):
+
+        self.conn = connect(store_file)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.pending = []
+        self.last_flush = time.monotonic()
+        self.target_ids = {}
+        self.poc_ids = {}
+        self.finding_count = 0
+
+        with self.conn:
+            self.scan_id = self.conn.execute(
+                "INSERT INTO scans (started_at) VALUES (?)", (now_text(),)
+            ).lastrowid
+
+    def add(self, result):
+
+        # 结果先放入缓冲区，达到批量大小或超过刷新间隔时在一个事务中写入
+        steps = [
+            {
+                "method": step.method,
+                "url": step.url,
+                "status_code": step.status_code,
+                "elapsed": step.elapsed,
+                "truncated": step.truncated,
+                "request": step.snapshot[0] if step.snapshot else None,
+                "response": step.snapshot[1] if step.snapshot else None,
+            }
+            for step in result.steps
+        ]
+        self.pending.append((result.url, result.poc, now_text(), json.dumps(steps, ensure_ascii=False)))
+        self.finding_count += 1
+        self.flush(force=len(self.pending) >= self.batch_size)
+
+    def target_id(self, url):
+
+        target_id = self.target_ids.get(url)
+        if target_id is None:
+            # 新目标直接使用插入的行号，之前的扫描中已经出现过的目标才需要查询
+            cursor = self.conn.execute("INSERT OR IGNORE INTO targets (url, host) VALUES (?, ?)", (url, host_of(url)))
+            if cursor.rowcount == 1:
+                target_id = cursor.lastrowid
+            else:
+                target_id = self.conn.execute("SELECT id FROM targets WHERE url = ?", (url,)).fetchone()[0]
+            self.target_ids[url] = target_id
+        return target_id
+
+    def poc_id(self, poc):
+
+        key = (poc.id, poc.path)
+        poc_id = self.poc_ids.get(key)
+        if poc_id is None:
+            cursor = self.conn.execute(
+                "INSERT OR IGNORE INTO pocs (poc_id, path, name, severity, vuln_class) VALUES (?, ?, ?, ?, ?)",
+                (poc.id, poc.path, poc.name, poc.severity, poc.vuln_class)
+            )
+            if cursor.rowcount == 1:
+                poc_id = cursor.lastrowid
+            else:
+                poc_id = self.conn.execute(
+                    "SELECT id FROM pocs WHERE poc_id = ? AND path = ?", key
+                ).fetchone()[0]
+            self.poc_ids[key] = poc_id
+        return poc_id
+
+    def flush(self, force=True):
+
+        # 扫描中每个结果都会调用 flush(force=False)，漏洞很少时缓冲区中的结果也会按刷新间隔写入
+        if not force and time.monotonic() - self.last_flush < self.flush_interval:
+            return
+        self.last_flush = time.monotonic()
+        if not self.pending:
+            return
+
+        try:
+            with self.conn:
+                rows = [
+                    (self.scan_id, self.target_id(url), self.poc_id(poc), poc.severity.lower(), created_at, steps)
+                    for url, poc, created_at, steps in self.pending
+                ]
+                self.conn.executemany(
+                    "INSERT INTO findings (scan_id, target_id, poc_ref, severity, created_at, steps) "
+                    "VALUES (?, ?, ?, ?, ?, ?)", rows
+                )
+        except sqlite3.Error:
+            # 事务回滚后缓存的编号可能已经无效
+            self.target_ids.clear()
+            self.poc_ids.clear()
+            raise
+        self.pending = []
+
+    def finish(self, poc_count, target_count, requests_sent, requests_saved, status='finished'):
+
+        self.flush()
+        with self.conn:
+            self.conn.execute(
+                "UPDATE scans SET finished_at = ?, poc_count = ?, target_count = ?, finding_count = ?, "
+                "requests_sent = ?, requests_saved = ?, status = ? WHERE id = ?",
+                (now_text(), poc_count, target_count, self.finding_count,
+                 requests_sent, requests_saved, status, self.scan_id)
+            )
+
+    def close(self):
+
+        try:
+            self.flush()
+        finally:
+            self.conn.close()
+
+
+def create_result_store(config):
+
+    store_config = config.get('results_store') or {}
+    if not store_config.get('enabled', True):
+        return None
+    return ResultStore(
+        store_config.get('path', DEFAULT_STORE_FILE),
+        store_config.get('batch_size', 500),
+        store_config.get('flush_interval', 2.0)
+    )
+
+
+def query_findings(conn, scan_id=None, host=None, poc_id=None, severity=None):
+
+    # 按条件查询漏洞，逐行返回，不一次性载入内存
+    conditions = []
+    params = []
+    if scan_id is not None:
+        conditions.append("f.scan_id = ?")
+        params.append(scan_id)
+    if host:
+        conditions.append("t.host = ?")
+        params.append(host.lower())
+    if poc_id:
+        conditions.append("p.poc_id = ?")
+        params.append(poc_id)
+    if severity:
+        conditions.append("f.severity = ?")
+        params.append(severity.lower())
+
+    sql = (
+        "SELECT f.id, f.scan_id, f.created_at, t.url, t.host, p.poc_id, p.name, f.severity, p.vuln_class, f.steps "
+        "FROM findings f JOIN targets t ON t.id = f.target_id JOIN pocs p ON p.id = f.poc_ref"
+    )
+    if conditions:
+        sql += " WHERE " + " AND ".join(conditions)
+    sql += " ORDER BY f.id"
+
+    for row in conn.execute(sql, params):
+        yield {
+            "id": row[0],
+            "scan_id": row[1],
+            "created_at": row[2],
+            "url": row[3],
+            "host": row[4],
+            "poc_id": row[5],
+            "poc_name": row[6],
+            "severity": row[7],
+            "vuln_class": row[8],
+            "steps": json.loads(row[9]),
+        }
+
+
+def open_export_file(filename):
+
+    if filename == '-':
+        return sys.stdout
+    export_dir = os.path.dirname(filename)
+    if export_dir and not os.path.exists(export_dir):
+        os.makedirs(export_dir)
+    opener = COMPRESSED_WRITERS.get(os.path.splitext(filename)[1], open)
+    return opener(filename, 'wt', encoding='utf-8')
+
+
+def export_jsonl(store_file, filename, **filters):
+
+    # 每个漏洞一行JSON，边查询边写入，结果再多也不会一次性载入内存
+    conn = sqlite3.connect(store_file)
+    f = open_export_file(filename)
+    count = 0
+    try:
+        for finding in query_findings(conn, **filters):
+            f.write(json.dumps(finding, ensure_ascii=False))
+            f.write("\n")
+            count += 1
+    finally:
+        if f is not sys.stdout:
+            f.close()
+        conn.close()
+    return count
+
+
+def main(argv=None):
+
+    import argparse
+    parser = argparse.ArgumentParser(prog='python -m main.store', description='导出结果数据库中的漏洞')
+    parser.add_argument('output', help='导出文件（.jsonl，支持.gz/.bz2/.xz压缩，- 表示标准输出）')
+    parser.add_argument('--db', default=DEFAULT_STORE_FILE, help='结果数据库文件')
+    parser.add_argument('--scan', type=int, dest='scan_id', help='只导出指定扫描的结果')
+    parser.add_argument('--host', help='只导出指定主机的结果')
+    parser.add_argument('--poc', dest='poc_id', help='只导出指定POC id的结果')
+    parser.add_argument('--severity', help='只导出指定危害程度的结果')
+    args = parser.parse_args(argv)
+
+    count = export_jsonl(args.db, args.output, scan_id=args.scan_id, host=args.host,
+                         poc_id=args.poc_id, severity=args.severity)
+    print(f"已导出 {count} 条结果", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,190 @@
+"""
+流式读取模块 - 分块读取响应体，限制读取大小，并在匹配结果确定后提前停止读取
+"""
+import time
+import codecs
+
+from .matcher import response_cache
+
+
+CHUNK_SIZE = 16384
+DEFAULT_MAX_BODY_SIZE = 1048576  # 默认最多读取1MB响应体
+
+
+def request_key(request):
+
+    # 同一个请求模板（替换BaseURL之前）
+    return request.method, request.path_parts, request.headers, str(request.body)
+
+
+def build_interest(pocs):
+
+    # 统计每个请求模板的响应会被哪些匹配规则使用：本步骤的匹配器和下一步骤的skip-if。
+    # 响应可能通过响应缓存被多个POC共享，只有所有规则都得出结论时才能提前停止读取
+    interest = {}
+    for poc in pocs:
+        for i, request in enumerate(poc.requests):
+            entry = interest.setdefault(request_key(request), {"groups": [], "caps": set(), "readers": 0})
+            # 共享响应的POC数量，所有POC都读取过后响应缓存不再保留这个响应
+            if request.shared:
+                entry["readers"] += 1
+            if request.matchers:
+                entry["groups"].append((request.condition, request.matchers))
+            if i + 1 < len(poc.requests) and poc.requests[i + 1].skip_if:
+                entry["groups"].append(("or", poc.requests[i + 1].skip_if))
+            entry["caps"].add(request.max_body_size)
+    return interest
+
+
+def read_plan(request, context):
+
+    entry = (context.get("interest") or {}).get(request_key(request))
+    default_cap = context.get("max_body_size", DEFAULT_MAX_BODY_SIZE)
+
+    # 多个POC共享同一个请求时使用其中最大的读取上限，0 表示不限制
+    caps = entry["caps"] if entry else {request.max_body_size}
+    caps = {default_cap if cap is None else cap for cap in caps}
+    cap = 0 if 0 in caps else max(caps)
+
+    # 不知道响应会被哪些规则使用时不提前停止
+    groups = entry["groups"] if entry else None
+    return groups, cap
+
+
+def share_readers(request, context):
+
+    # 不知道会有多少POC读取时返回None，响应缓存按最近使用淘汰
+    entry = (context.get("interest") or {}).get(request_key(request))
+    return entry["readers"] if entry else None
+
+
+def decide_matcher(matcher, reader):
+
+    # 根据已读取的内容判断匹配器结果：True/False 表示已确定，None 表示还需要继续读取
+    part = matcher.part or "body"
+    if matcher.type == "status":
+        result = reader.response.status_code in matcher.status
+    elif matcher.type == "time":
+        elapsed = time.time() - reader.start_time
+        if matcher.operator in ("gt", "gte"):
+            result = True if elapsed > matcher.value else None
+        elif matcher.operator in ("lt", "lte"):
+            result = False if elapsed > matcher.value else None
+        else:
+            result = False
+    elif part == "header":
+        result = reader.engine.match(matcher, reader.response)
+    elif matcher.type == "word" and reader.decoder is not None:
+        found = reader.found
+        if part == "all":
+            found = found | reader.engine.found_words(reader.response, "header")
+        hits = [word in found for word in matcher.words]
+        # 关键词只会越来越多，所以只能提前确定"出现"的结论
+        if matcher.condition == "or":
+            result = True if any(hits) else None
+        else:
+            result = True if all(hits) else None
+    else:
+        result = None
+
+    if result is None:
+        return None
+    return result != matcher.negative
+
+
+def decide_group(group, reader):
+
+    condition, matchers = group
+    results = [decide_matcher(matcher, reader) for matcher in matchers]
+    if condition == "and":
+        if False in results:
+            return False
+        return True if None not in results else None
+    if True in results:
+        return True
+    return False if None not in results else None
+
+
+class BodyReader:
+
+    def __init__(self, response, groups, cap, engine, start_time):
+
+        self.response = response
+        self.cap = cap
+        self.engine = engine
+        self.start_time = start_time
+        self.chunks = []
+        self.size = 0
+        self.truncated = False
+
+        # 响应头中指定了编码时边读取边解码并扫描关键词，否则读取完成后再按requests的方式解码
+        self.decoder = None
+        if response.encoding:
+            try:
+                self.decoder = codecs.getincrementaldecoder(response.encoding)(errors='replace')
+            except LookupError:
+                pass
+        self.state = engine.state
+        self.found = set()
+        self.texts = []
+        self.tail = ''
+
+        self.pending = list(groups) if groups is not None else None
+
+    def scan(self, text):
+
+        self.texts.append(text)
+        # 保留上一块末尾的字符，跨越分块边界的关键词也能被匹配到
+        buffer = self.tail + text
+        self.engine.scan(buffer, 0, self.found, self.state)
+        keep = self.state[3] - 1
+        self.tail = buffer[-keep:] if keep > 0 else ''
+
+    def feed(self, chunk):
+
+        # 返回True表示不需要继续读取
+        if self.cap and self.size + len(chunk) > self.cap:
+            chunk = chunk[:self.cap - self.size]
+            self.truncated = True
+
+        self.chunks.append(chunk)
+        self.size += len(chunk)
+        if self.decoder is not None:
+            self.scan(self.decoder.decode(chunk))
+
+        if self.truncated:
+            return True
+        if self.pending is None:
+            return False
+
+        # 已经得出结论的规则不会再改变，只需要继续检查尚未确定的规则
+        self.pending = [group for group in self.pending if decide_group(group, self) is None]
+        if not self.pending:
+            self.truncated = not self.complete()
+            return True
+        return False
+
+    def complete(self):
+
+        # 根据Content-Length判断响应体是否已经读完（压缩的响应无法判断）
+        headers = self.response.headers
+        length = headers.get('Content-Length', '')
+        if length.isdigit() and 'Content-Encoding' not in headers:
+            return self.size >= int(length)
+        return False
+
+    def finish(self):
+
+        response = self.response
+        response._content = b''.join(self.chunks)
+        response._content_consumed = True
+
+        if self.decoder is not None:
+            self.scan(self.decoder.decode(b'', True))
+            setattr(response, '_rws_text', ''.join(self.texts))
+            response_cache(response)['body'] = (self.state[0], frozenset(self.found))
+
+        # truncated 表示响应体因为大小限制或提前结束而没有完整读取（提前结束时可能恰好已经读完）
+        setattr(response, 'truncated', self.truncated)
+        setattr(response, 'elapsed_s', time.time() - self.start_time)
+        return response
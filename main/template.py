@@ -0,0 +1,372 @@
+"""
+报告模板模块 - HTML报告的页面头部、样式和查看器脚本
+"""
+
+
+REPORT_HEAD = r"""<!DOCTYPE html>
+<html lang="en">
+<head>
+    <meta charset="utf-8">
+    <meta http-equiv="X-UA-Compatible" content="IE=edge">
+    <meta name="viewport" content="width=device-width,initial-scale=1">
+    <title>Vulnerability Scan Report</title>
+    <style>
+        body { 
+            font-family: Arial, sans-serif; 
+            margin: 0; 
+            padding: 20px;
+            background-color: #f5f5f5;
+        }
+        .toolbar {
+            display: flex;
+            align-items: center;
+            gap: 10px;
+            margin-bottom: 10px;
+            font-size: 14px;
+        }
+        .toolbar select, .toolbar input {
+            padding: 4px 6px;
+            font-size: 14px;
+        }
+        .vuln-list {
+            height: 60vh;
+            overflow-y: auto;
+            background-color: white;
+            border-radius: 4px;
+            box-shadow: 0 1px 3px rgba(0,0,0,0.1);
+        }
+        .vuln-spacer {
+            position: relative;
+        }
+        .vuln-rows {
+            position: absolute;
+            top: 0;
+            left: 0;
+            right: 0;
+        }
+        .vuln-header { 
+            height: 36px;
+            box-sizing: border-box;
+            padding: 0 15px;
+            cursor: pointer;
+            display: flex;
+            align-items: center;
+            font-size: 14px;
+            border-bottom: 1px solid #f0f0f0;
+        }
+        .vuln-header:hover, .vuln-header.selected {
+            background-color: #f8f9fa;
+        }
+        .vuln-index {
+            width: 60px;
+            color: #999;
+        }
+        .vuln-info {
+            display: flex;
+            flex: 1;
+            justify-content: space-between;
+            overflow: hidden;
+            white-space: nowrap;
+        }
+        .vuln-url {
+            color: #1a73e8;
+            overflow: hidden;
+            text-overflow: ellipsis;
+        }
+        .vuln-detail { 
+            margin-top: 10px;
+            padding: 15px;
+            background-color: white;
+            border-radius: 4px;
+            box-shadow: 0 1px 3px rgba(0,0,0,0.1);
+        }
+        .request-response { 
+            background-color: #f8f9fa;
+            padding: 15px;
+            border-radius: 4px;
+            font-family: Monaco, Consolas, monospace;
+            font-size: 12px;
+            white-space: pre-wrap;
+            word-break: break-all;
+            margin: 10px 0;
+        }
+        .detail-item { 
+            font-weight: bold;
+            margin: 10px 0 5px;
+            color: #666;
+        }
+        .severity {
+            padding: 2px 8px;
+            margin-left: 10px;
+            border-radius: 3px;
+            font-size: 12px;
+            font-weight: bold;
+        }
+        .severity.high, .severity.critical { background-color: #fce8e8; color: #d93026; }
+        .severity.medium { background-color: #fff4e5; color: #e65100; }
+        .severity.low { background-color: #e8f0fe; color: #1a73e8; }
+        .severity.info { background-color: #e8f5e9; color: #1b5e20; }
+        .report-info {
+            background-color: white;
+            padding: 15px;
+            border-radius: 4px;
+            margin-bottom: 20px;
+            box-shadow: 0 1px 3px rgba(0,0,0,0.1);
+        }
+        .report-title {
+            font-size: 24px;
+            margin-bottom: 10px;
+        }
+        .report-time {
+            color: #666;
+            font-size: 14px;
+        }
+        .report-summary {
+            margin-top: 10px;
+            font-size: 14px;
+        }
+    </style>
+</head>
+<body>
+    <div class="report-info">
+        <div class="report-title">漏洞扫描报告</div>
+        <div class="report-time">开始时间: __START_TIME__</div>
+        <div class="report-summary" id="report-summary">扫描进行中...</div>
+    </div>
+    <div class="toolbar">
+        <select id="filter-severity"><option value="">全部危害程度</option></select>
+        <select id="filter-plugin"><option value="">全部插件</option></select>
+        <input id="filter-host" placeholder="按主机过滤">
+        <span id="match-count"></span>
+    </div>
+    <div class="vuln-list" id="vulns">
+        <div class="vuln-spacer" id="vulns-spacer"><div class="vuln-rows" id="vulns-rows"></div></div>
+    </div>
+    <div class="vuln-detail" id="vuln-detail" style="display: none"></div>
+    <script>
+        // 报告页面中只保存每个漏洞的摘要，数据包保存在数据目录中，查看详情时才加载
+        var DATA_DIR = __DATA_DIR__;
+        var CHUNK_SIZE = __CHUNK_SIZE__;
+        var ROW_HEIGHT = 36;
+        var OVERSCAN = 10;
+
+        var webVulns = [];
+        var filtered = null;  // 过滤后的漏洞下标，null 表示不过滤
+        var filters = {severity: '', plugin: '', host: ''};
+        var seenOptions = {'filter-severity': {}, 'filter-plugin': {}};
+        var snapshots = {};
+        var loadedChunks = {};  // 数据文件序号 -> true 已完整加载 / false 加载时仍在追加 / 等待加载的回调列表
+        var reportFinished = false;
+        var selected = -1;
+        var renderPending = false;
+
+        function hostOf(url) {
+            var match = /^[a-z][a-z0-9+.-]*:\/\/([^\/?#]+)/i.exec(url);
+            return match ? match[1].toLowerCase() : url.toLowerCase();
+        }
+
+        function matches(vuln) {
+            return (!filters.severity || vuln.severity === filters.severity) &&
+                (!filters.plugin || vuln.plugin === filters.plugin) &&
+                (!filters.host || vuln.host.indexOf(filters.host) !== -1);
+        }
+
+        function addOption(selectId, value) {
+            var seen = seenOptions[selectId];
+            if (seen[value]) return;
+            seen[value] = true;
+            var option = document.createElement('option');
+            option.value = value;
+            option.textContent = value;
+            document.getElementById(selectId).appendChild(option);
+        }
+
+        // 每发现一个漏洞追加一行：[发现时间, 危害程度, 插件, URL, 漏洞类型]
+        function V(row) {
+            var vuln = {
+                index: webVulns.length,
+                create_time: row[0],
+                severity: String(row[1]),
+                plugin: String(row[2]),
+                url: String(row[3]),
+                vuln_class: row[4],
+                host: hostOf(String(row[3]))
+            };
+            webVulns.push(vuln);
+            addOption('filter-severity', vuln.severity);
+            addOption('filter-plugin', vuln.plugin);
+            if (filtered !== null && matches(vuln)) filtered.push(vuln.index);
+            scheduleRender();
+        }
+
+        function applyFilters() {
+            filters.severity = document.getElementById('filter-severity').value;
+            filters.plugin = document.getElementById('filter-plugin').value;
+            filters.host = document.getElementById('filter-host').value.trim().toLowerCase();
+            if (!filters.severity && !filters.plugin && !filters.host) {
+                filtered = null;
+            } else {
+                filtered = [];
+                for (var i = 0; i < webVulns.length; i++) {
+                    if (matches(webVulns[i])) filtered.push(i);
+                }
+            }
+            document.getElementById('vulns').scrollTop = 0;
+            scheduleRender();
+        }
+
+        function scheduleRender() {
+            if (renderPending) return;
+            renderPending = true;
+            requestAnimationFrame(render);
+        }
+
+        function buildRow(vuln) {
+            var row = document.createElement('div');
+            row.className = 'vuln-header' + (vuln.index === selected ? ' selected' : '');
+            row.onclick = function () { showDetail(vuln.index); };
+
+            var index = document.createElement('span');
+            index.className = 'vuln-index';
+            index.textContent = vuln.index + 1;
+
+            var info = document.createElement('div');
+            info.className = 'vuln-info';
+            var url = document.createElement('span');
+            url.className = 'vuln-url';
+            url.textContent = vuln.url;
+            var right = document.createElement('div');
+            var severity = document.createElement('span');
+            severity.className = 'severity ' + vuln.severity.toLowerCase().replace(/[^a-z]/g, '');
+            severity.textContent = vuln.severity;
+            var plugin = document.createElement('span');
+            plugin.style.marginLeft = '10px';
+            plugin.textContent = vuln.plugin;
+            right.appendChild(severity);
+            right.appendChild(plugin);
+            info.appendChild(url);
+            info.appendChild(right);
+
+            row.appendChild(index);
+            row.appendChild(info);
+            return row;
+        }
+
+        // 只渲染可见区域内的行，漏洞数量再多页面也保持流畅
+        function render() {
+            renderPending = false;
+            var list = document.getElementById('vulns');
+            var total = filtered === null ? webVulns.length : filtered.length;
+            document.getElementById('vulns-spacer').style.height = (total * ROW_HEIGHT) + 'px';
+
+            var first = Math.max(0, Math.floor(list.scrollTop / ROW_HEIGHT) - OVERSCAN);
+            var last = Math.min(total, Math.ceil((list.scrollTop + list.clientHeight) / ROW_HEIGHT) + OVERSCAN);
+            var rows = document.getElementById('vulns-rows');
+            var fragment = document.createDocumentFragment();
+            for (var i = first; i < last; i++) {
+                fragment.appendChild(buildRow(webVulns[filtered === null ? i : filtered[i]]));
+            }
+            rows.style.transform = 'translateY(' + (first * ROW_HEIGHT) + 'px)';
+            rows.textContent = '';
+            rows.appendChild(fragment);
+
+            document.getElementById('match-count').textContent =
+                filtered === null ? ('共 ' + total + ' 个漏洞') : ('匹配 ' + total + ' / ' + webVulns.length + ' 个漏洞');
+        }
+
+        // 数据文件中每行调用一次，保存对应漏洞的数据包
+        function reportSnapshots(index, snapshot) {
+            snapshots[index] = snapshot;
+        }
+
+        // 扫描还在进行时最后一个数据文件仍在追加，只有写满或报告结束后才不再重新加载
+        function chunkComplete(chunk) {
+            return reportFinished || ((chunk + 1) * CHUNK_SIZE - 1) in snapshots;
+        }
+
+        function loadChunk(chunk, callback) {
+            if (loadedChunks[chunk] === true) {
+                callback(true);
+                return;
+            }
+            if (loadedChunks[chunk]) {
+                loadedChunks[chunk].push(callback);
+                return;
+            }
+            var reload = loadedChunks[chunk] === false;
+            loadedChunks[chunk] = [callback];
+            // 使用<script>加载数据文件，直接双击打开报告（file://）时也能正常工作；
+            // 重新加载仍在追加的数据文件时加上时间戳，避免使用浏览器缓存的旧内容
+            var script = document.createElement('script');
+            script.src = DATA_DIR + '/' + ('00000' + chunk).slice(-5) + '.js' + (reload ? '?t=' + Date.now() : '');
+            script.onload = script.onerror = function (event) {
+                var callbacks = loadedChunks[chunk];
+                var ok = event.type === 'load';
+                loadedChunks[chunk] = ok ? (chunkComplete(chunk) || false) : undefined;
+                document.head.removeChild(script);
+                callbacks.forEach(function (cb) { cb(ok); });
+            };
+            document.head.appendChild(script);
+        }
+
+        function addBlock(panel, title, text) {
+            var label = document.createElement('div');
+            label.className = 'detail-item';
+            label.textContent = title;
+            var block = document.createElement('div');
+            block.className = 'request-response';
+            block.textContent = text;
+            panel.appendChild(label);
+            panel.appendChild(block);
+        }
+
+        function showDetail(index) {
+            var vuln = webVulns[index];
+            var panel = document.getElementById('vuln-detail');
+            selected = index;
+            scheduleRender();
+
+            panel.style.display = 'block';
+            panel.textContent = '';
+            addBlock(panel, 'Target:', vuln.url + '\n' + vuln.plugin + ' [' + vuln.severity + ']' +
+                (vuln.vuln_class ? ' ' + vuln.vuln_class : '') + '\n' + new Date(vuln.create_time).toLocaleString());
+
+            // 已经读取到的数据包不会再变化，不需要重新加载仍在追加的数据文件
+            if (index in snapshots) {
+                showSnapshot(panel, index, true);
+                return;
+            }
+            loadChunk(Math.floor(index / CHUNK_SIZE), function (ok) {
+                if (selected === index) showSnapshot(panel, index, ok);
+            });
+        }
+
+        function showSnapshot(panel, index, ok) {
+            var snapshot = snapshots[index];
+            if (!ok || !snapshot) {
+                addBlock(panel, 'Snapshot:', ok ? '无数据包信息' : '数据文件加载失败: ' + DATA_DIR);
+                return;
+            }
+            snapshot.forEach(function (pair) {
+                addBlock(panel, 'Request:', pair[0]);
+                addBlock(panel, 'Response:', pair[1]);
+            });
+        }
+
+        function finishReport(endTime) {
+            reportFinished = true;
+            document.getElementById('report-summary').textContent =
+                '扫描完成! 结束时间: ' + endTime + '，共发现 ' + webVulns.length + ' 个漏洞';
+        }
+
+        document.getElementById('vulns').addEventListener('scroll', scheduleRender);
+        window.addEventListener('resize', scheduleRender);
+        document.getElementById('filter-severity').addEventListener('change', applyFilters);
+        document.getElementById('filter-plugin').addEventListener('change', applyFilters);
+        var hostTimer = null;
+        document.getElementById('filter-host').addEventListener('input', function () {
+            clearTimeout(hostTimer);
+            hostTimer = setTimeout(applyFilters, 200);
+        });
+    </script>
+"""
@@ -1,14 +1,93 @@
 """
 URL模块
 """
+import os
+import sys
+import bz2
+import gzip
+import lzma
+from urllib.parse import urlsplit
 
 
-def load_urls_from_file(filename):
+# 支持直接读取的压缩格式
+COMPRESSED_OPENERS = {
+    '.gz': gzip.open,
+    '.bz2': bz2.open,
+    '.xz': lzma.open,
+}
+
+
+def host_of(url):
+
+    # 主机:端口（小写），调度器、扫描指标和结果数据库都按它区分主机
+    return (urlsplit(url).netloc or url).lower()
+
+
+def is_target_file(name):
+
+    # "-" 表示从标准输入读取目标
+    if name == '-':
+        return True
+    if '://' in name:
+        return False
+    if name.endswith('.txt') or os.path.splitext(name)[1] in COMPRESSED_OPENERS:
+        return True
+    return os.path.isfile(name)
+
+
+def open_target_file(filename):
+
+    opener = COMPRESSED_OPENERS.get(os.path.splitext(filename)[1], open)
+    return opener(filename, 'rt', encoding='utf-8', errors='replace')
+
+
+def iter_urls_from_file(filename):
 
+    # 逐行读取，目标数量再多也不会一次性载入内存
     try:
-        with open(filename, 'r', encoding='utf-8') as f:
-            urls = [line.strip() for line in f.readlines() if line.strip()]
-        return urls
+        f = sys.stdin if filename == '-' else open_target_file(filename)
     except FileNotFoundError:
         print(f"错误: 文件 {filename} 未找到。")
-        return []
\ No newline at end of file
+        return
+
+    try:
+        for line in f:
+            url = line.strip()
+            if url:
+                yield url
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+
+def iter_targets(targets):
+
+    # 目标可以是URL或URL文件，目标文件边读取边扫描，不一次性载入内存
+    for target in targets:
+        if is_target_file(target):
+            yield from iter_urls_from_file(target)
+        else:
+            yield target
+
+
+def count_targets(targets):
+
+    # 统计目标数量，用于估算剩余时间；标准输入无法预先统计，返回None
+    total = 0
+    for target in targets:
+        if target == '-':
+            return None
+        if not is_target_file(target):
+            total += 1
+            continue
+        try:
+            with open_target_file(target) as f:
+                total += sum(1 for line in f if line.strip())
+        except OSError:
+            return None
+    return total
+
+
+def load_urls_from_file(filename):
+
+    return list(iter_urls_from_file(filename))